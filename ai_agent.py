@@ -1,7 +1,27 @@
+import json
 import logging
+from contextlib import closing
+from itertools import islice
+from flask import current_app
 from sqlalchemy import text
 from app import db
-from gemini import generate_sql_query, format_response
+from gemini import (generate_sql_query, generate_sql_queries, format_response, format_response_stream,
+                    format_responses, SQL_SYSTEM_PROMPT)
+from query_cache import QuestionSQLCache, schema_fingerprint, normalize_question
+from schema_index import build_schema_prompt
+from task_pool import submit_with_app_context, gather
+from single_flight import SingleFlight
+from metrics import span, ERRORS, ROWS_RETURNED
+from result_cache import QueryResultCache
+from data_version import get_data_version
+from intent_router import route_question
+from answer_formatter import format_answer
+from rollups import ROLLUP_SCHEMA, apply_rollup_rewrite
+from index_advisor import IndexAdvisor
+from columnar_store import ColumnarStore
+from query_governor import QueryGovernor
+from result_pages import RESULT_ROW_CAP, RESULT_FETCH_CHUNK_SIZE, make_page_token
+
 def get_database_schema():
     """Get comprehensive database schema information for AI context"""
     schema_info = """
@@ -39,6 +59,8 @@ def get_database_schema():
        - message (Text explaining eligibility status, empty if eligible)
        - created_at (Timestamp)
     
+    {rollup_schema}
+    
     IMPORTANT RELATIONSHIPS:
     - All tables are connected via item_id (integer)
     - Use JOINs to get comprehensive product information
@@ -52,7 +74,7 @@ def get_database_schema():
     - Overall RoAS: SELECT (SUM(ad_sales)/SUM(ad_spend))*100 FROM product_ad_metrics WHERE ad_spend > 0;
     - Highest CPC product: SELECT item_id, (ad_spend/clicks) as cpc FROM product_ad_metrics WHERE clicks > 0 ORDER BY cpc DESC LIMIT 1;
     - Products by sales: SELECT item_id, SUM(total_sales) as sales FROM product_sales GROUP BY item_id ORDER BY sales DESC;
-    """
+    """.format(rollup_schema=ROLLUP_SCHEMA.strip())
     return schema_info
 
 class EcommerceAIAgent:
@@ -62,71 +84,394 @@ class EcommerceAIAgent:
     
     def __init__(self):
         self.schema_info = get_database_schema()
+        # Cached SQL is tied to both the schema and the generation rules it was produced under
+        self.schema_hash = schema_fingerprint(self.schema_info + SQL_SYSTEM_PROMPT)
+        self.sql_cache = QuestionSQLCache()
+        self.result_cache = QueryResultCache()
+        self.index_advisor = IndexAdvisor()
+        self.columnar_store = ColumnarStore()
+        self.query_governor = QueryGovernor()
+        self.single_flight = SingleFlight()
     
-    def process_question(self, question: str) -> dict:
+    def process_question(self, question: str, llm_format: bool = False) -> dict:
         """
-        Process a natural language question and return formatted answer
+        Process a natural language question and return formatted answer.
+        Set llm_format to always phrase the answer with Gemini instead of the local templates.
+        Identical questions already being answered are waited on and share that answer.
         """
+        # Keyed on the data version too, so a pipeline started before a reload is never shared after it
+        key = f"{get_data_version()}:{int(llm_format)}:{normalize_question(question)}"
+        with span("process_question"):
+            response, shared = self.single_flight.do(
+                key,
+                lambda: self._answer_question(question, llm_format),
+                encode=lambda response: json.loads(current_app.json.dumps(response))
+            )
+        return dict(response, question=question, coalesced=shared)
+    
+    def _answer_question(self, question: str, llm_format: bool = False) -> dict:
         try:
             logging.info(f"Processing question: {question}")
             
-            # Step 1: Generate SQL query using Gemini
-            sql_response = generate_sql_query(question, self.schema_info)
-            sql_query = sql_response.query
-            explanation = sql_response.explanation
-            
-            logging.info(f"Generated SQL: {sql_query}")
+            # Step 1: Resolve SQL locally (known intent or cached SQL), otherwise generate it with Gemini
+            sql_response, sql_source, intent = self.resolve_sql(question)
             
-            # Step 2: Execute the SQL query
-            result = self.execute_query(sql_query)
+            # Step 2: Execute the SQL query (large results are capped; the rest is paged via tokens)
+            result, result_cached, truncated = self.run_resolved_sql(question, sql_response, sql_source, intent)
             
-            # Step 3: Format the response using Gemini
-            formatted_answer = format_response(question, result, explanation)
+            # Step 3: Format the response locally, using Gemini only for shapes the templates can't handle
+            with span("format_response"):
+                formatted_answer = self.template_answer(question, result, intent, llm_format)
+                formatter = "template" if formatted_answer is not None else "llm"
+                if formatted_answer is None:
+                    formatted_answer = format_response(question, result, sql_response.explanation)
+            if truncated:
+                formatted_answer += self._truncation_note(result)
             
-            return {
-                "success": True,
-                "question": question,
-                "sql_query": sql_query,
-                "explanation": explanation,
-                "raw_result": result,
-                "formatted_answer": formatted_answer
-            }
+            return self._build_response(question, sql_response, sql_source, intent,
+                                        result, result_cached, truncated, formatter, formatted_answer)
             
         except Exception as e:
             logging.error(f"Error processing question: {e}")
-            return {
-                "success": False,
-                "question": question,
-                "error": str(e),
-                "formatted_answer": f"I encountered an error while processing your question: {str(e)}"
-            }
+            ERRORS.inc(stage="process_question")
+            return self._build_error_response(question, e)
     
-    def execute_query(self, sql_query: str) -> list:
+    def stream_question(self, question: str, llm_format: bool = False):
         """
-        Execute SQL query and return results
+        Process a natural language question stage by stage.
+        Yields (event, data) pairs: "sql", then "result", then one or more "answer" chunks
+        and finally "done" with the full response (or "error" if a stage fails).
         """
         try:
-            # Execute the query
-            result = db.session.execute(text(sql_query))
+            logging.info(f"Streaming question: {question}")
+            
+            sql_response, sql_source, intent = self.resolve_sql(question)
+            yield "sql", {
+                "sql_query": sql_response.query,
+                "sql_params": intent.params if intent else {},
+                "explanation": sql_response.explanation,
+                "sql_source": sql_source,
+                "intent": intent.intent if intent else None
+            }
             
-            # Convert result to list of dictionaries
-            columns = result.keys()
-            rows = result.fetchall()
+            result, result_cached, truncated = self.run_resolved_sql(question, sql_response, sql_source, intent)
+            yield "result", {
+                "raw_result": result,
+                "row_count": len(result),
+                "result_cached": result_cached,
+                "truncated": truncated
+            }
             
-            # Format results
-            formatted_results = []
-            for row in rows:
-                row_dict = {}
-                for i, column in enumerate(columns):
-                    row_dict[column] = row[i]
-                formatted_results.append(row_dict)
+            formatted_answer = self.template_answer(question, result, intent, llm_format)
+            formatter = "template" if formatted_answer is not None else "llm"
+            if formatted_answer is not None:
+                yield "answer", {"text": formatted_answer}
+            else:
+                chunks = []
+                with span("format_response_stream"):
+                    for chunk in format_response_stream(question, result, sql_response.explanation):
+                        chunks.append(chunk)
+                        yield "answer", {"text": chunk}
+                formatted_answer = "".join(chunks)
+            if truncated:
+                note = self._truncation_note(result)
+                yield "answer", {"text": note}
+                formatted_answer += note
             
-            logging.info(f"Query executed successfully, returned {len(formatted_results)} rows")
-            return formatted_results
+            yield "done", self._build_response(question, sql_response, sql_source, intent,
+                                               result, result_cached, truncated, formatter, formatted_answer)
             
         except Exception as e:
+            logging.error(f"Error streaming question: {e}")
+            ERRORS.inc(stage="stream_question")
+            yield "error", self._build_error_response(question, e)
+    
+    def process_batch(self, questions: list, llm_format: bool = False, timeout: float = None) -> dict:
+        """
+        Answer several questions together. Duplicates (after normalization) are answered once,
+        SQL for every question that needs the model is generated in one Gemini call, the statements
+        run concurrently on the shared worker pool and model-formatted answers share one call too.
+        Returns {"results": [...], ...} with one response per input question, in order.
+        """
+        # Unique questions keyed by their normalized text, keeping the first spelling seen
+        unique = {}
+        for question in questions:
+            unique.setdefault(normalize_question(question), question)
+        unique_questions = list(unique.values())
+        responses = {}
+        model_calls = 0
+        
+        # Step 1: Resolve locally where possible, then generate the rest of the SQL in a single call
+        resolved = {}
+        pending = []
+        for question in unique_questions:
+            intent = route_question(question)
+            if intent is not None:
+                resolved[question] = (intent, "intent", intent)
+                continue
+            sql_response = self.sql_cache.get(question, self.schema_hash)
+            if sql_response is not None:
+                resolved[question] = (sql_response, "cache", None)
+            else:
+                pending.append(question)
+        
+        if pending:
+            model_calls += 1
+            schema_prompt, selection = build_schema_prompt(" ".join(pending))
+            try:
+                with span("generate_sql_batch"):
+                    if len(pending) == 1:
+                        generated = [generate_sql_query(pending[0], schema_prompt, list(selection["tables"]))]
+                    else:
+                        generated = generate_sql_queries(pending, schema_prompt, list(selection["tables"]))
+                for question, sql_response in zip(pending, generated):
+                    resolved[question] = (sql_response, "llm", None)
+            except Exception as e:
+                for question in pending:
+                    responses[question] = self._build_error_response(question, e)
+        
+        # Step 2: Execute every statement concurrently, each in its own app context / DB session
+        with span("execute_batch"):
+            futures = {
+                question: submit_with_app_context(self.run_resolved_sql, question, sql_response, sql_source, intent)
+                for question, (sql_response, sql_source, intent) in resolved.items()
+            }
+            outcomes = gather(futures, timeout)
+        
+        # Step 3: Template answers locally, then format whatever is left with one Gemini call
+        executed = {}
+        needs_llm = []
+        for question, outcome in outcomes.items():
+            if isinstance(outcome, Exception):
+                responses[question] = self._build_error_response(question, outcome)
+                continue
+            sql_response, sql_source, intent = resolved[question]
+            result, result_cached, truncated = outcome
+            formatted_answer = self.template_answer(question, result, intent, llm_format)
+            executed[question] = [result, result_cached, truncated, formatted_answer]
+            if formatted_answer is None:
+                needs_llm.append(question)
+        
+        if needs_llm:
+            model_calls += 1
+            with span("format_response_batch"):
+                answers = format_responses([
+                    (question, executed[question][0], resolved[question][0].explanation) for question in needs_llm
+                ])
+            for question, answer in zip(needs_llm, answers):
+                executed[question][3] = answer
+        
+        for question, (result, result_cached, truncated, formatted_answer) in executed.items():
+            sql_response, sql_source, intent = resolved[question]
+            formatter = "llm" if question in needs_llm else "template"
+            if truncated:
+                formatted_answer += self._truncation_note(result)
+            responses[question] = self._build_response(question, sql_response, sql_source, intent,
+                                                       result, result_cached, truncated, formatter, formatted_answer)
+        
+        results = []
+        for question in questions:
+            response = dict(responses[unique[normalize_question(question)]])
+            response["question"] = question
+            results.append(response)
+        return {
+            "results": results,
+            "question_count": len(questions),
+            "unique_questions": len(unique_questions),
+            "failed": sum(1 for response in results if not response["success"]),
+            "model_calls": model_calls
+        }
+    
+    def resolve_sql(self, question: str) -> tuple:
+        """
+        Find the SQL for a question: a recognised intent first, then the SQL cache, then Gemini.
+        Returns (sql_response, sql_source, intent) where intent is None unless the router matched.
+        """
+        with span("resolve_sql"):
+            intent = route_question(question)
+            if intent is not None:
+                sql_response, sql_source = intent, "intent"
+            else:
+                sql_response = self.sql_cache.get(question, self.schema_hash)
+                sql_source = "cache" if sql_response is not None else "llm"
+                if sql_response is None:
+                    # Only the tables and columns the question refers to are sent to the model
+                    with span("generate_sql"):
+                        schema_prompt, selection = build_schema_prompt(question)
+                        sql_response = generate_sql_query(question, schema_prompt, list(selection["tables"]))
+        
+        logging.info(f"SQL ({sql_source}): {sql_response.query} {intent.params if intent else ''}")
+        return sql_response, sql_source, intent
+    
+    def run_resolved_sql(self, question: str, sql_response, sql_source: str, intent=None) -> tuple:
+        """
+        Execute SQL returned by resolve_sql and keep the SQL cache in step with the outcome.
+        Returns (results, result_cached, truncated); results hold at most RESULT_ROW_CAP rows.
+        """
+        # Recognised intents are answered from the in-memory columnar store when it is enabled
+        if intent is not None:
+            try:
+                with span("columnar_evaluate"):
+                    result = self.columnar_store.evaluate(intent)
+            except Exception as e:
+                logging.error(f"Columnar engine failed, falling back to SQL: {e}")
+                result = None
+            if result is not None:
+                logging.info(f"Intent {intent.intent} answered by the columnar engine, {len(result)} rows")
+                ROWS_RETURNED.inc(min(len(result), RESULT_ROW_CAP), source="columnar")
+                return result[:RESULT_ROW_CAP], False, len(result) > RESULT_ROW_CAP
+        
+        try:
+            with span("execute_query"):
+                result, result_cached, truncated = self.execute_cached_query(sql_response.query,
+                                                                             intent.params if intent else None)
+        except Exception:
+            if sql_source == "cache":
+                self.sql_cache.invalidate(question, self.schema_hash)
+            raise
+        
+        ROWS_RETURNED.inc(len(result), source="result_cache" if result_cached else "database")
+        # Only SQL that executed successfully is worth caching
+        if sql_source == "llm":
+            self.sql_cache.put(question, self.schema_hash, sql_response)
+        return result, result_cached, truncated
+    
+    def template_answer(self, question: str, result: list, intent=None, llm_format: bool = False):
+        """
+        Local answer for the result, or None when Gemini should format it
+        """
+        if llm_format:
+            return None
+        return format_answer(question, result, intent.explanation if intent else None)
+    
+    def _truncation_note(self, result: list) -> str:
+        return (f"\n\n(Based on the first {len(result)} rows of a larger result; "
+                f"use the export link for the full data.)")
+    
+    def _build_response(self, question, sql_response, sql_source, intent, result, result_cached,
+                        truncated, formatter, formatted_answer) -> dict:
+        # Tokens let the client page through or export the full result without resending SQL
+        params = intent.params if intent else {}
+        data_version = get_data_version()
+        return {
+            "success": True,
+            "question": question,
+            "sql_query": sql_response.query,
+            "sql_params": intent.params if intent else {},
+            "explanation": sql_response.explanation,
+            "sql_source": sql_source,
+            "intent": intent.intent if intent else None,
+            "sql_cached": sql_source == "cache",
+            "result_cached": result_cached,
+            "raw_result": result,
+            "row_count": len(result),
+            "truncated": truncated,
+            "row_cap": RESULT_ROW_CAP,
+            "next_page_token": make_page_token(sql_response.query, params, len(result), data_version) if truncated else None,
+            "export_token": make_page_token(sql_response.query, params, 0, data_version),
+            "formatter": formatter,
+            "formatted_answer": formatted_answer
+        }
+    
+    def _build_error_response(self, question, error) -> dict:
+        return {
+            "success": False,
+            "question": question,
+            "error": str(error),
+            "formatted_answer": f"I encountered an error while processing your question: {str(error)}"
+        }
+    
+    def execute_query(self, sql_query: str, params: dict = None, max_rows: int = None) -> list:
+        """
+        Execute SQL query (with optional bind parameters) and return results.
+        With max_rows, stops reading from the cursor after that many rows.
+        """
+        with closing(self.iter_query_rows(sql_query, params)) as rows:
+            formatted_results = list(islice(rows, max_rows))
+        
+        logging.info(f"Query executed successfully, returned {len(formatted_results)} rows")
+        return formatted_results
+    
+    def iter_query_rows(self, sql_query: str, params: dict = None, chunk_size: int = RESULT_FETCH_CHUNK_SIZE,
+                        timeout: float = None, columnar: bool = False):
+        """
+        Execute SQL query through the query governor and yield result rows as dicts, fetching
+        chunk_size rows from the cursor at a time (a server-side cursor on Postgres), so memory
+        stays flat for large results. timeout overrides the governor's per-statement deadline.
+        With columnar, the column names are yielded first and rows follow as tuples, without
+        building a dict per row.
+        """
+        executed = False
+        try:
+            # Serve eligible aggregates from the rollup tables
+            sql_query = apply_rollup_rewrite(sql_query)
+            
+            with self.query_governor.execute(sql_query, params, timeout=timeout) as result:
+                executed = True
+                columns = list(result.keys())
+                if columnar:
+                    yield columns
+                while True:
+                    chunk = result.fetchmany(chunk_size)
+                    if not chunk:
+                        break
+                    if columnar:
+                        yield from (tuple(row) for row in chunk)
+                    else:
+                        for row in chunk:
+                            yield dict(zip(columns, row))
+        except GeneratorExit:
+            raise
+        except Exception as e:
+            executed = False
+            db.session.rollback()
             logging.error(f"SQL execution error: {e}")
             raise Exception(f"Failed to execute SQL query: {str(e)}")
+        finally:
+            # Also runs when the caller stops reading early
+            if executed:
+                # Track the statement and its query plan for index recommendations
+                self.index_advisor.record(sql_query, params)
+    
+    def execute_query_page(self, sql_query: str, params: dict = None, offset: int = 0,
+                           limit: int = RESULT_ROW_CAP) -> tuple:
+        """
+        Rows offset..offset+limit of a query's result.
+        Returns (rows, has_more); earlier rows are skipped on the cursor rather than held in memory.
+        """
+        with closing(self.iter_query_rows(sql_query, params)) as rows:
+            page = list(islice(rows, offset, offset + limit + 1))
+        return page[:limit], len(page) > limit
+    
+    def execute_query_page_columns(self, sql_query: str, params: dict = None, offset: int = 0,
+                                   limit: int = RESULT_ROW_CAP) -> tuple:
+        """
+        Columnar form of execute_query_page: returns (columns, rows, has_more) with each row
+        a tuple of values in column order
+        """
+        with closing(self.iter_query_rows(sql_query, params, columnar=True)) as rows:
+            columns = next(rows)
+            page = list(islice(rows, offset, offset + limit + 1))
+        return columns, page[:limit], len(page) > limit
+    
+    def execute_cached_query(self, sql_query: str, params: dict = None, max_rows: int = RESULT_ROW_CAP) -> tuple:
+        """
+        Execute SQL query through the result cache, reading at most max_rows rows.
+        Returns (results, cached, truncated) where cached tells whether the database was skipped
+        and truncated whether the query had more rows than max_rows.
+        """
+        data_version = get_data_version()
+        
+        # One row past the cap is read (and cached) to learn whether the result was truncated
+        cache_params = {**(params or {}), "_max_rows": max_rows}
+        cached_result = self.result_cache.get(sql_query, data_version, cache_params)
+        if cached_result is not None:
+            logging.info(f"Result cache hit at data version {data_version}, {len(cached_result)} rows")
+            return cached_result[:max_rows], True, len(cached_result) > max_rows
+        
+        result = self.execute_query(sql_query, params, max_rows=max_rows + 1)
+        self.result_cache.put(sql_query, data_version, result, cache_params)
+        return result[:max_rows], False, len(result) > max_rows
     
     def get_total_sales(self) -> dict:
         """
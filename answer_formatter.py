@@ -0,0 +1,168 @@
+import datetime
+import decimal
+
+# Result shapes larger than these are left to the LLM formatter
+RANKED_LIST_MAX_ROWS = 25
+TIME_SERIES_MAX_LISTED_ROWS = 31
+
+# Column-name fragments that decide how a value is displayed. Ratios (RoAS, CTR) are
+# stored as percentages by the queries in ai_agent.get_database_schema().
+_PERCENT_HINTS = ("roas", "ctr", "rate", "percent", "pct")
+_CURRENCY_HINTS = ("cpc", "sales", "spend", "revenue", "cost", "price", "amount")
+_COUNT_HINTS = ("clicks", "impressions", "units", "count", "orders", "records", "products", "items")
+_RATIO_HINTS = _PERCENT_HINTS + ("cpc",)
+
+_ACRONYMS = {"roas": "RoAS", "cpc": "CPC", "ctr": "CTR", "id": "ID"}
+_DATE_COLUMNS = ("date", "day", "month", "week")
+_ID_COLUMNS = ("item_id", "product_id")
+
+def humanize_column(column: str) -> str:
+    """
+    Turn a result column name into a display label, e.g. total_sales -> Total sales
+    """
+    words = str(column).replace("_", " ").split()
+    if not words:
+        return str(column)
+    words = [_ACRONYMS.get(word.lower(), word.lower()) for word in words]
+    if words[0] == words[0].lower():
+        words[0] = words[0].capitalize()
+    return " ".join(words)
+
+def _has_hint(column: str, hints) -> bool:
+    name = str(column).lower()
+    return any(hint in name for hint in hints)
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float, decimal.Decimal)) and not isinstance(value, bool)
+
+def format_value(column: str, value) -> str:
+    """
+    Format a single value using the semantics implied by its column name
+    """
+    if value is None:
+        return "no data"
+    if isinstance(value, bool):
+        return "yes" if value else "no"
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    if not _is_number(value):
+        return str(value)
+
+    value = float(value)
+    if _has_hint(column, _PERCENT_HINTS):
+        return f"{value:,.2f}%"
+    if _has_hint(column, _CURRENCY_HINTS):
+        return f"${value:,.2f}"
+    if _has_hint(column, _COUNT_HINTS) or str(column).lower() in _ID_COLUMNS or value.is_integer():
+        return f"{value:,.0f}"
+    return f"{value:,.2f}"
+
+def _format_row(row: dict) -> str:
+    return ", ".join(f"{humanize_column(column)}: {format_value(column, value)}" for column, value in row.items())
+
+def _find_column(columns, candidates):
+    for column in columns:
+        if str(column).lower() in candidates:
+            return column
+    return None
+
+def _is_monotonic(values) -> bool:
+    ascending = all(a <= b for a, b in zip(values, values[1:]))
+    descending = all(a >= b for a, b in zip(values, values[1:]))
+    return ascending or descending
+
+def _format_scalar(column, value, label):
+    title = label or humanize_column(column)
+    if value is None:
+        return f"{title}: no matching data was found."
+    return f"{title}: {format_value(column, value)}"
+
+def _format_single_row(row, label):
+    id_column = _find_column(row, _ID_COLUMNS)
+    details = {column: value for column, value in row.items() if column != id_column}
+    prefix = f"Item {row[id_column]}" if id_column else (label or "Result")
+    if id_column and label:
+        prefix = f"{label}: Item {row[id_column]}"
+    return f"{prefix} — {_format_row(details)}" if details else prefix
+
+def _format_ranked_list(rows, id_column, metric_column, label):
+    values = [row[metric_column] for row in rows]
+    if not _is_monotonic(values):
+        return None
+
+    descending = values[0] >= values[-1]
+    title = label or f"{'Top' if descending else 'Bottom'} {len(rows)} items by {humanize_column(metric_column)}"
+    lines = [f"{title}:"]
+    for position, row in enumerate(rows, start=1):
+        extras = [f"{humanize_column(column)}: {format_value(column, value)}"
+                  for column, value in row.items() if column not in (id_column, metric_column)]
+        line = f"{position}. Item {row[id_column]} — {format_value(metric_column, row[metric_column])}"
+        if extras:
+            line += f" ({', '.join(extras)})"
+        lines.append(line)
+    return "\n".join(lines)
+
+def _format_time_series(rows, date_column, metric_columns, label):
+    dates = [row[date_column] for row in rows]
+    if any(value is None for value in dates) or dates != sorted(dates) or len(set(dates)) != len(dates):
+        return None
+
+    first, last = format_value(date_column, dates[0]), format_value(date_column, dates[-1])
+    lines = [f"{label or 'Results'} from {first} to {last} ({len(rows)} periods):"]
+    for column in metric_columns:
+        values = [row[column] for row in rows if row[column] is not None]
+        if not values:
+            continue
+        peak_row = max((row for row in rows if row[column] is not None), key=lambda row: row[column])
+        summary = f"- {humanize_column(column)}: "
+        if not _has_hint(column, _RATIO_HINTS):
+            summary += f"total {format_value(column, sum(values))}, "
+        summary += f"peak {format_value(column, peak_row[column])} on {format_value(date_column, peak_row[date_column])}"
+        lines.append(summary)
+
+    if len(rows) <= TIME_SERIES_MAX_LISTED_ROWS:
+        lines.append("")
+        for row in rows:
+            values = ", ".join(f"{humanize_column(column)} {format_value(column, row[column])}" for column in metric_columns)
+            lines.append(f"{format_value(date_column, row[date_column])}: {values}")
+    return "\n".join(lines)
+
+def format_answer(question: str, sql_result: list, label: str = None):
+    """
+    Format common result shapes (scalar, single row, ranked list, time series) without an LLM call.
+    Returns None when the shape is not recognised, so the caller can fall back to gemini.format_response.
+    """
+    if not isinstance(sql_result, list) or any(not isinstance(row, dict) for row in sql_result):
+        return None
+
+    if not sql_result:
+        return "No matching data was found for this question."
+
+    columns = list(sql_result[0].keys())
+    if any(list(row.keys()) != columns for row in sql_result):
+        return None
+
+    if len(sql_result) == 1:
+        row = sql_result[0]
+        if len(columns) == 1:
+            return _format_scalar(columns[0], row[columns[0]], label)
+        return _format_single_row(row, label)
+
+    id_column = _find_column(columns, _ID_COLUMNS)
+    date_column = _find_column(columns, _DATE_COLUMNS)
+    metric_columns = [column for column in columns
+                      if column not in (id_column, date_column)
+                      and all(_is_number(row[column]) or row[column] is None for row in sql_result)]
+    other_columns = [column for column in columns if column not in metric_columns + [id_column, date_column]]
+    if other_columns or not metric_columns:
+        return None
+
+    if id_column and len(metric_columns) == 1 and len(sql_result) <= RANKED_LIST_MAX_ROWS:
+        if any(row[metric_columns[0]] is None for row in sql_result):
+            return None
+        return _format_ranked_list(sql_result, id_column, metric_columns[0], label)
+
+    if date_column and not id_column:
+        return _format_time_series(sql_result, date_column, metric_columns, label)
+
+    return None
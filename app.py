@@ -1,12 +1,19 @@
+import time
+_imports_started = time.perf_counter()
+
 import os
 import logging
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase
 from werkzeug.middleware.proxy_fix import ProxyFix
+from metrics import init_app as init_metrics, STARTUP
+from response_encoding import init_app as init_response_encoding
+
+STARTUP.record("imports", time.perf_counter() - _imports_started)
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
+# Configure logging (DEBUG, INFO, WARNING, ...)
+logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO").upper())
 
 class Base(DeclarativeBase):
     pass
@@ -28,25 +35,32 @@ app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
 
 # Initialize the app with the extension
 db.init_app(app)
+# Time and count every request for /metrics
+init_metrics(app)
+# orjson encoding (when installed) and gzip/br compression of large JSON responses
+init_response_encoding(app)
 
 with app.app_context():
-    # Import models to ensure tables are created
+    # Import models so their tables are registered
     import models
-    db.create_all()
+    
+    # Create tables and load the data once across all workers (or restore DB_SNAPSHOT_PATH);
+    # workers started after that only check the readiness marker
+    from startup import ensure_data_ready, start_warmup
+    with STARTUP.phase("data"):
+        ensure_data_ready()
     
     # Import and register routes
-    from routes import *
+    with STARTUP.phase("routes"):
+        from routes import *
     
-    # Load real data if database is empty
-    try:
-        if models.ProductSales.query.count() == 0:
-            from real_data_loader import load_all_real_data
-            load_all_real_data()
-    except Exception as e:
-        # If tables don't exist, load the data anyway
-        logging.info(f"Tables may not exist yet, loading data: {e}")
-        from real_data_loader import load_all_real_data
-        load_all_real_data()
+# Import the Gemini SDK, build the agent and its columnar store and precompute the quick answers
+# (STARTUP_WARMUP), in the background by default so the worker can serve while they load
+start_warmup(app)
+
+# Keep the precomputed quick answers fresh (QUICK_ANSWERS_REFRESH_SECONDS)
+from quick_answers import start_refresh_schedule
+start_refresh_schedule(app)
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,327 @@
+import argparse
+import itertools
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+# Canned SQL returned by the fake model, picked by the first pattern found in the question
+CANNED_SQL = [
+    (r"trend|daily|per day|by date",
+     "SELECT date, SUM(total_sales) AS total_sales FROM product_sales GROUP BY date ORDER BY date",
+     "Daily total sales"),
+    (r"without ads|no ad|not advertised",
+     "SELECT s.item_id, SUM(s.total_sales) AS total_sales FROM product_sales s "
+     "LEFT JOIN product_ad_metrics a ON a.item_id = s.item_id AND a.date = s.date "
+     "WHERE a.item_id IS NULL GROUP BY s.item_id ORDER BY total_sales DESC LIMIT 10",
+     "Items with sales on days without ad activity"),
+    (r"eligib",
+     "SELECT eligibility, COUNT(DISTINCT item_id) AS items FROM product_eligibility GROUP BY eligibility",
+     "Items per eligibility status"),
+    (r"click|impression|ctr",
+     "SELECT item_id, SUM(clicks) AS clicks, SUM(impressions) AS impressions FROM product_ad_metrics "
+     "GROUP BY item_id ORDER BY clicks DESC LIMIT 10",
+     "Items with the most clicks"),
+]
+DEFAULT_SQL = ("SELECT item_id, SUM(total_sales) AS total_sales FROM product_sales "
+               "GROUP BY item_id ORDER BY total_sales DESC LIMIT 10", "Top items by sales")
+
+# /api/ask workload: questions answered by the intent router and ones that need the model
+ASK_QUESTIONS = [
+    "What is my total sales?",
+    "Calculate the RoAS (Return on Ad Spend)",
+    "Which product had the highest CPC (Cost Per Click)?",
+    "Top 5 items by ad spend",
+    "Show the daily sales trend",
+    "Which items sold without ads?",
+    "How many items are eligible for advertising?",
+    "Which items get the most clicks and impressions?",
+    "Which products bring in the most money?",
+]
+
+class _FakeModels:
+    def __init__(self, client):
+        self._client = client
+
+    def generate_content(self, model, contents, config=None):
+        prompt = _prompt_text(contents)
+        schema = getattr(config, "response_schema", None) if config is not None else None
+        if schema is not None and getattr(schema, "__origin__", None) is list:
+            if "Questions:" in prompt:
+                questions = re.findall(r"^\d+\. (.*)$", prompt.split("Questions:", 1)[1], re.MULTILINE)
+                text = json.dumps([_canned_sql(question) for question in questions])
+            else:
+                text = json.dumps([f"Formatted answer {i}" for i in range(prompt.count("SQL Result:"))])
+            latency = self._client.sql_latency if model == self._client.sql_model else self._client.format_latency
+        elif schema is not None:
+            question = prompt.rsplit("Question:", 1)[-1].strip()
+            text = json.dumps(_canned_sql(question))
+            latency = self._client.sql_latency
+        else:
+            text = "Formatted answer from the benchmark model."
+            latency = self._client.format_latency
+
+        self._client.count(model)
+        time.sleep(latency)
+        return _fake_response(text, prompt)
+
+    def generate_content_stream(self, model, contents, config=None):
+        response = self.generate_content(model, contents, config)
+        for word in response.text.split(" "):
+            yield _fake_response(word + " ", "")
+
+class _FakeCaches:
+    def __init__(self, client):
+        self._client = client
+
+    def create(self, model, config=None):
+        if not self._client.prompt_cache:
+            raise RuntimeError("Cached content is not supported for this benchmark run")
+        return SimpleNamespace(name="cachedContents/benchmark")
+
+class FakeGeminiClient:
+    """
+    Offline stand-in for genai.Client. Returns canned SQLQuery JSON (picked from CANNED_SQL by
+    keyword) and canned answers after a configurable delay, so the rest of the pipeline runs
+    for real without network access. Install it with gemini.set_client().
+    """
+
+    def __init__(self, sql_latency_ms=800.0, format_latency_ms=400.0, prompt_cache=True,
+                 sql_model="gemini-2.5-pro"):
+        self.sql_latency = sql_latency_ms / 1000
+        self.format_latency = format_latency_ms / 1000
+        self.prompt_cache = prompt_cache
+        self.sql_model = sql_model
+        self.models = _FakeModels(self)
+        self.caches = _FakeCaches(self)
+        self.calls = {}
+        self._lock = threading.Lock()
+
+    def count(self, model):
+        with self._lock:
+            self.calls[model] = self.calls.get(model, 0) + 1
+
+def _prompt_text(contents):
+    if isinstance(contents, str):
+        return contents
+    return "\n".join(part.text for content in contents for part in content.parts if part.text)
+
+def _canned_sql(question):
+    for pattern, query, explanation in CANNED_SQL:
+        if re.search(pattern, question, re.IGNORECASE):
+            return {"query": query, "explanation": explanation}
+    return {"query": DEFAULT_SQL[0], "explanation": DEFAULT_SQL[1]}
+
+def _fake_response(text, prompt):
+    from google.genai import types
+
+    usage = types.GenerateContentResponseUsageMetadata(
+        prompt_token_count=max(1, len(prompt) // 4),
+        candidates_token_count=max(1, len(text) // 4),
+    )
+    return SimpleNamespace(text=text, usage_metadata=usage)
+
+def percentile(sorted_values, fraction):
+    """Linear-interpolated percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+def summarize(latencies, errors, wall_seconds):
+    latencies = sorted(latencies)
+    ms = lambda value: round(value * 1000, 2) if value is not None else None
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "wall_seconds": round(wall_seconds, 3),
+        "requests_per_second": round(len(latencies) / wall_seconds, 2) if wall_seconds else None,
+        "latency_ms": {
+            "min": ms(latencies[0]) if latencies else None,
+            "mean": ms(sum(latencies) / len(latencies)) if latencies else None,
+            "p50": ms(percentile(latencies, 0.5)),
+            "p90": ms(percentile(latencies, 0.9)),
+            "p95": ms(percentile(latencies, 0.95)),
+            "p99": ms(percentile(latencies, 0.99)),
+            "max": ms(latencies[-1]) if latencies else None,
+        }
+    }
+
+def run_load(app, method, path, make_request, total, concurrency):
+    """
+    Send total requests to path from concurrency threads, each with its own test client
+    (the WSGI app is called in-process, so no server or sockets are involved).
+    make_request(i) returns keyword arguments for the i-th request.
+    """
+    counter = itertools.count()
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+
+    def worker():
+        client = app.test_client()
+        while True:
+            i = next(counter)
+            if i >= total:
+                return
+            start = time.perf_counter()
+            response = client.open(path, method=method, **make_request(i))
+            body = response.get_data()
+            elapsed = time.perf_counter() - start
+            failed = response.status_code >= 400
+            if not failed and response.is_json:
+                failed = json.loads(body).get("success") is False
+            with lock:
+                latencies.append(elapsed)
+                errors[0] += failed
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(latencies, errors[0], time.perf_counter() - started)
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, baseline, max_regression):
+    """
+    Endpoints whose throughput dropped or p95 latency grew by more than max_regression
+    (a fraction) against a baseline results file
+    """
+    regressions = []
+    for name, current in results["endpoints"].items():
+        previous = baseline.get("endpoints", {}).get(name)
+        if not previous:
+            continue
+        old_rps, new_rps = previous["requests_per_second"], current["requests_per_second"]
+        if old_rps and new_rps < old_rps * (1 - max_regression):
+            regressions.append(f"{name}: {new_rps} req/s vs {old_rps} req/s")
+        old_p95, new_p95 = previous["latency_ms"]["p95"], current["latency_ms"]["p95"]
+        if old_p95 and new_p95 > old_p95 * (1 + max_regression):
+            regressions.append(f"{name}: p95 {new_p95} ms vs {old_p95} ms")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load benchmark of the API with a fake Gemini backend")
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint (default 200)")
+    parser.add_argument("--concurrency", type=int, default=8, help="concurrent clients (default 8)")
+    parser.add_argument("--warmup", type=int, default=10, help="unmeasured requests per endpoint first")
+    parser.add_argument("--sql-latency-ms", type=float, default=800.0, help="fake SQL generation delay")
+    parser.add_argument("--format-latency-ms", type=float, default=400.0, help="fake answer formatting delay")
+    parser.add_argument("--no-prompt-cache", action="store_true", help="make the fake model refuse cached content")
+    parser.add_argument("--cold", action="store_true",
+                        help="make every /api/ask question unique so the SQL cache and coalescing never hit")
+    parser.add_argument("--llm-format", action="store_true", help="format every /api/ask answer with the model")
+    parser.add_argument("--endpoint", action="append", choices=["ask", "quick-answers", "data-summary"],
+                        help="only benchmark these endpoints (repeatable)")
+    parser.add_argument("--loaders", action="store_true", help="also time a full reload of the CSV data")
+    parser.add_argument("--database-url", default=None,
+                        help="database to benchmark against (default: a SQLite file in the temp directory)")
+    parser.add_argument("--output", default="benchmark-results.json", help="where to write the JSON results")
+    parser.add_argument("--baseline", help="earlier results file to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2,
+                        help="allowed throughput drop / p95 growth against the baseline (default 0.2)")
+    args = parser.parse_args()
+
+    # The app reads its configuration at import time, so the environment is set up first
+    os.environ["DATABASE_URL"] = args.database_url or os.environ.get(
+        "BENCHMARK_DATABASE_URL", f"sqlite:///{os.path.join(tempfile.gettempdir(), 'ecommerce-benchmark.db')}")
+    os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+
+    import logging
+    logging.disable(logging.INFO)
+
+    import gemini
+    fake_client = FakeGeminiClient(args.sql_latency_ms, args.format_latency_ms,
+                                   prompt_cache=not args.no_prompt_cache, sql_model=gemini.SQL_MODEL)
+    gemini.set_client(fake_client)
+
+    setup_started = time.perf_counter()
+    from app import app
+    from metrics import STAGE_SECONDS
+    setup_seconds = time.perf_counter() - setup_started
+
+    run_id = int(time.time())
+    def ask_request(i):
+        question = ASK_QUESTIONS[i % len(ASK_QUESTIONS)]
+        if args.cold:
+            question = f"{question} (run {run_id} request {i})"
+        return {"json": {"question": question, "llm_format": args.llm_format}}
+
+    workloads = {
+        "ask": ("POST", "/api/ask", ask_request),
+        "quick-answers": ("GET", "/api/quick-answers", lambda i: {}),
+        "data-summary": ("GET", "/api/data/summary", lambda i: {}),
+    }
+
+    results = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "database": re.sub(r"//[^@/]*@", "//***@", os.environ["DATABASE_URL"]),
+            "app_setup_seconds": round(setup_seconds, 3),
+            "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+        },
+        "endpoints": {},
+    }
+
+    for name in args.endpoint or list(workloads):
+        method, path, make_request = workloads[name]
+        if args.warmup:
+            run_load(app, method, path, make_request, args.warmup, min(args.concurrency, args.warmup))
+        calls_before = sum(fake_client.calls.values())
+        summary = run_load(app, method, path, make_request, args.requests, args.concurrency)
+        summary["model_calls"] = sum(fake_client.calls.values()) - calls_before
+        results["endpoints"][name] = summary
+        print(f"{name}: {summary['requests_per_second']} req/s, p50 {summary['latency_ms']['p50']} ms, "
+              f"p95 {summary['latency_ms']['p95']} ms, p99 {summary['latency_ms']['p99']} ms, "
+              f"{summary['errors']} errors, {summary['model_calls']} model calls")
+
+    if args.loaders:
+        from real_data_loader import load_all_real_data
+        with app.app_context():
+            started = time.perf_counter()
+            load_all_real_data()
+            results["loaders"] = {"load_all_real_data_seconds": round(time.perf_counter() - started, 3)}
+        print(f"load_all_real_data: {results['loaders']['load_all_real_data_seconds']}s")
+
+    results["stages"] = {
+        labels[0]: {"count": series["count"],
+                    **{f"p{int(float(q) * 100)}_ms": round(value * 1000, 3) for q, value in series["quantiles"].items()}}
+        for labels, series in sorted(STAGE_SECONDS.snapshot().items())
+    }
+    results["model_calls"] = dict(fake_client.calls)
+
+    with open(args.output, "w") as output:
+        json.dump(results, output, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.max_regression)
+        if regressions:
+            print("Regressions against the baseline:")
+            for regression in regressions:
+                print(f"- {regression}")
+            sys.exit(1)
+        print("No regressions against the baseline")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Import-time budgets in seconds, measured in a fresh interpreter, and the heavy modules each
+# entry point must not pull in at import. The SDK and query engines belong to the first
+# question (or the background warm-up), not to worker boot or the loader CLIs.
+HEAVY_MODULES = ("google.genai", "numpy", "pyarrow")
+BUDGETS = {
+    "real_data_loader": (0.15, HEAVY_MODULES + ("flask", "sqlalchemy")),
+    "data_loader": (0.1, HEAVY_MODULES + ("flask", "sqlalchemy")),
+    "gemini": (0.4, HEAVY_MODULES),
+    "app": (2.0, HEAVY_MODULES),
+}
+
+_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - started
+print(json.dumps({{"seconds": seconds, "loaded": [name for name in {watched!r} if name in sys.modules]}}))
+"""
+
+def measure(module: str, watched=(), env=None) -> dict:
+    """Import module in a new interpreter; returns its import seconds and which watched modules it loaded"""
+    completed = subprocess.run(
+        [sys.executable, "-c", _PROBE.format(module=module, watched=tuple(watched))],
+        capture_output=True, text=True, env=env, cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{completed.stderr.strip()}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+def check(modules, repeat: int = 3, scale: float = 1.0) -> list:
+    """
+    Measure each module repeat times and compare the median against its budget (times scale).
+    Returns one result dict per module.
+    """
+    # Time the boot itself: no warm-up thread racing the measurement, no log noise
+    env = dict(os.environ, STARTUP_WARMUP="off", LOG_LEVEL="WARNING")
+    results = []
+    for module in modules:
+        budget, forbidden = BUDGETS[module]
+        samples = [measure(module, forbidden, env) for _ in range(repeat)]
+        seconds = statistics.median(sample["seconds"] for sample in samples)
+        loaded = sorted({name for sample in samples for name in sample["loaded"]})
+        results.append({
+            "module": module,
+            "seconds": round(seconds, 3),
+            "budget": round(budget * scale, 3),
+            "loaded_heavy_modules": loaded,
+            "ok": seconds <= budget * scale and not loaded
+        })
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check that entry points import within their time budgets")
+    parser.add_argument("modules", nargs="*",
+                        help=f"modules to check (default: all of {', '.join(BUDGETS)})")
+    parser.add_argument("--repeat", type=int, default=3, help="imports per module; the median is compared")
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help="multiply every budget, e.g. 2 on a slow CI machine")
+    args = parser.parse_args()
+    unknown = [module for module in args.modules if module not in BUDGETS]
+    if unknown:
+        parser.error(f"no budget for {', '.join(unknown)}")
+
+    # "app" connects to DATABASE_URL and loads the data if it is not there yet, which is not
+    # an import cost; run python startup.py first on a fresh database
+    results = check(args.modules or list(BUDGETS), args.repeat, args.scale)
+    for result in results:
+        status = "ok" if result["ok"] else "OVER BUDGET"
+        heavy = f", loaded {', '.join(result['loaded_heavy_modules'])}" if result["loaded_heavy_modules"] else ""
+        print(f"{result['module']:<18} {result['seconds']:.3f}s (budget {result['budget']:.3f}s){heavy}  {status}")
+    sys.exit(0 if all(result["ok"] for result in results) else 1)
@@ -0,0 +1,309 @@
+import argparse
+import logging
+import math
+import os
+import sys
+import threading
+import time
+from datetime import date
+from sqlalchemy import text
+from app import db
+from data_version import get_data_version
+from intent_router import METRICS, route_question
+from metrics import timed
+from snapshot import DATASET_TABLES, snapshots_match_database, snapshot_columns
+
+try:
+    import numpy as np
+except ImportError:  # optional dependency: the SQL path is used instead
+    np = None
+
+COLUMNAR_ENGINE_ENABLED = os.environ.get("COLUMNAR_ENGINE_ENABLED", "true").lower() == "true"
+
+# Columns loaded per table, in SELECT order. Dates are kept as datetime64[D] for filtering.
+TABLE_COLUMNS = {
+    "product_sales": ("date", "item_id", "total_sales", "total_units_ordered"),
+    "product_ad_metrics": ("date", "item_id", "ad_sales", "ad_spend", "impressions", "clicks", "units_sold"),
+    "product_eligibility": ("eligibility_datetime", "item_id", "eligibility"),
+}
+SNAPSHOT_DATASETS = {table: name for name, table in DATASET_TABLES.items()}
+_FLOAT_COLUMNS = {"total_sales", "ad_sales", "ad_spend"}
+_DATE_COLUMNS = {"date": "datetime64[D]", "eligibility_datetime": "datetime64[s]"}
+
+# Ratio metrics as (numerator * numerator_scale) / denominator * result_scale, written in the same
+# operation order as the SQL in intent_router.METRICS so per-record values are bit-identical.
+# The denominator > 0 condition is each metric's guard.
+RATIO_METRICS = {
+    "roas": ("ad_sales", "ad_spend", 1, 100),
+    "cpc": ("ad_spend", "clicks", 1, 1),
+    "ctr": ("clicks", "impressions", 100.0, 1),
+}
+
+# Relative tolerance for floating-point sums, whose rounding depends on summation order
+PARITY_REL_TOLERANCE = 1e-9
+
+PARITY_QUESTIONS = [
+    "What is my total sales?",
+    "Total sales in the last 30 days",
+    "Total sales for item 0",
+    "Total units ordered since 2025-06-05",
+    "What was my ad spend between 2025-06-01 and 2025-06-07?",
+    "Total impressions",
+    "Total clicks on 2025-06-03",
+    "Total units sold through ads",
+    "Calculate the RoAS (Return on Ad Spend)",
+    "What is my CPC?",
+    "What is my CTR before 2025-06-10?",
+    "RoAS for item 2",
+    "Which product had the highest CPC (Cost Per Click)?",
+    "Top 5 products by ad sales",
+    "Bottom 3 products by sales",
+    "What are my top performing products by revenue?",
+    "Which item had the lowest CTR?",
+    "Top 10 products by RoAS since 2025-06-05",
+    "Top 20 items by clicks",
+]
+
+class ColumnarStore:
+    """
+    In-memory NumPy copy of the base tables that answers the intent router's queries
+    (sums, RoAS/CPC/CTR, per-item rankings, date and item filters) without a database round trip.
+
+    Arrays are built at the current data version and rebuilt on the next evaluation after the
+    data version changes. evaluate() returns None for anything it does not support,
+    so callers fall back to SQL.
+    """
+
+    def __init__(self, enabled=COLUMNAR_ENGINE_ENABLED):
+        self.enabled = enabled and np is not None
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._tables = None
+        self._data_version = None
+        self._dates_as_text = True
+        self.source = None
+        self.built_at = None
+        self.build_seconds = None
+        self.evaluations = 0
+        self.fallbacks = 0
+
+    @timed("columnar_refresh")
+    def refresh(self, data_version: int = None):
+        """
+        Reload every table into arrays and stamp them with the data version
+        """
+        if not self.enabled:
+            return
+        data_version = get_data_version() if data_version is None else data_version
+        start = time.perf_counter()
+
+        # Dates come back from SQL as ISO text on SQLite and as date objects elsewhere
+        dates_as_text = db.engine.dialect.name == "sqlite"
+        from_snapshots = snapshots_match_database()
+        tables = {}
+        for table, columns in TABLE_COLUMNS.items():
+            if from_snapshots:
+                # Memory-mapped arrays shared through the page cache instead of a full table read
+                tables[table] = snapshot_columns(SNAPSHOT_DATASETS[table], columns)
+                continue
+            rows = db.session.execute(text(f"SELECT {', '.join(columns)} FROM {table}")).fetchall()
+            arrays = {}
+            for index, column in enumerate(columns):
+                values = [row[index] for row in rows]
+                if column in _DATE_COLUMNS:
+                    arrays[column] = np.array([str(value).replace(" ", "T")[:19] for value in values],
+                                              dtype=_DATE_COLUMNS[column])
+                elif column == "eligibility":
+                    arrays[column] = np.array(values, dtype=bool)
+                elif column in _FLOAT_COLUMNS:
+                    arrays[column] = np.array(values, dtype=np.float64)
+                else:
+                    arrays[column] = np.array(values, dtype=np.int64)
+            tables[table] = arrays
+        db.session.rollback()
+
+        with self._lock:
+            self._tables = tables
+            self._data_version = data_version
+            self._dates_as_text = dates_as_text
+            self.source = "snapshot" if from_snapshots else "database"
+            self.built_at = time.time()
+            self.build_seconds = time.perf_counter() - start
+        logging.info(f"Columnar store built from {'snapshots' if from_snapshots else 'the database'} "
+                     f"at data version {data_version} in {self.build_seconds:.2f}s "
+                     f"({', '.join(f'{table}: {len(arrays[TABLE_COLUMNS[table][0]])} rows' for table, arrays in tables.items())})")
+
+    def ensure_fresh(self):
+        """Rebuild the arrays if the data changed since they were built"""
+        data_version = get_data_version()
+        if self._tables is not None and self._data_version == data_version:
+            return
+        # Concurrent requests after a data change wait for one rebuild instead of each doing it
+        with self._build_lock:
+            if self._tables is None or self._data_version != data_version:
+                self.refresh(data_version)
+
+    def evaluate(self, intent):
+        """
+        Evaluate an intent_router.IntentMatch with vectorised operations.
+        Returns rows shaped exactly like the intent's SQL result, or None when unsupported.
+        """
+        if not self.enabled or intent is None:
+            return None
+
+        ranked = intent.intent.startswith("rank_")
+        metric = intent.intent[len("rank_"):] if ranked else intent.intent
+        spec = METRICS.get(metric)
+        if (spec is None or set(intent.params) - {"start_date", "end_date", "item_id", "limit"}
+                or (ranked and (intent.descending is None or "limit" not in intent.params))):
+            self.fallbacks += 1
+            return None
+
+        self.ensure_fresh()
+        columns = self._tables[spec["table"]]
+        mask = self._filter_mask(columns, metric, intent.params)
+
+        if ranked:
+            result = self._ranked(columns, mask, metric, intent)
+        else:
+            result = [{metric: self._aggregate(columns, mask, metric)}]
+        self.evaluations += 1
+        return result
+
+    def stats(self) -> dict:
+        tables = self._tables or {}
+        return {
+            "enabled": self.enabled,
+            "numpy_available": np is not None,
+            "data_version": self._data_version,
+            "source": self.source,
+            "rows": {table: int(len(arrays[TABLE_COLUMNS[table][0]])) for table, arrays in tables.items()},
+            "bytes": int(sum(array.nbytes for arrays in tables.values() for array in arrays.values())),
+            "build_seconds": round(self.build_seconds, 4) if self.build_seconds is not None else None,
+            "evaluations": self.evaluations,
+            "fallbacks": self.fallbacks
+        }
+
+    def _filter_mask(self, columns, metric, params):
+        mask = np.ones(len(columns["item_id"]), dtype=bool)
+        if metric in RATIO_METRICS:
+            mask &= columns[RATIO_METRICS[metric][1]] > 0
+        if "start_date" in params:
+            mask &= columns["date"] >= np.datetime64(params["start_date"], "D")
+        if "end_date" in params:
+            mask &= columns["date"] <= np.datetime64(params["end_date"], "D")
+        if "item_id" in params:
+            mask &= columns["item_id"] == int(params["item_id"])
+        return mask
+
+    def _aggregate(self, columns, mask, metric):
+        # SQL SUM() over no rows is NULL, and so is a ratio built from it
+        if not mask.any():
+            return None
+        if metric in RATIO_METRICS:
+            numerator, denominator, numerator_scale, result_scale = RATIO_METRICS[metric]
+            return ((_sum(columns[numerator][mask]) * numerator_scale) / _sum(columns[denominator][mask])) * result_scale
+        return _sum(columns[metric][mask])
+
+    def _ranked(self, columns, mask, metric, intent):
+        limit = int(intent.params["limit"])
+        descending = intent.descending
+        item_ids = columns["item_id"][mask]
+
+        if metric in RATIO_METRICS:
+            # Ratios are ranked per daily record, as in the intent's SQL
+            numerator, denominator, numerator_scale, result_scale = RATIO_METRICS[metric]
+            values = ((columns[numerator][mask] * numerator_scale) / columns[denominator][mask]) * result_scale
+            dates = columns["date"][mask]
+            # ORDER BY metric, item_id, date (np.lexsort sorts by its last key first)
+            order = np.lexsort((dates, item_ids, -values if descending else values))[:limit]
+            dates = dates[order]
+            return [{"item_id": int(item_ids[index]), "date": self._date_value(day), metric: float(values[index])}
+                    for index, day in zip(order, dates)]
+
+        groups, inverse = np.unique(item_ids, return_inverse=True)
+        totals = np.bincount(inverse, weights=columns[metric][mask], minlength=len(groups))
+        order = _order(totals, descending)[:limit]
+        as_int = metric not in _FLOAT_COLUMNS
+        return [{"item_id": int(groups[index]), metric: int(round(totals[index])) if as_int else float(totals[index])}
+                for index in order]
+
+    def _date_value(self, day):
+        value = date.fromisoformat(str(day))
+        return value.isoformat() if self._dates_as_text else value
+
+def _sum(values):
+    total = values.sum()
+    return float(total) if values.dtype.kind == "f" else int(total)
+
+def _order(values, descending: bool):
+    # Stable sort so ties keep ascending item order, as in the intent's ORDER BY
+    return np.argsort(-values if descending else values, kind="stable")
+
+def _values_match(expected, actual) -> bool:
+    if isinstance(expected, float) or isinstance(actual, float):
+        if expected is None or actual is None:
+            return expected is actual
+        return math.isclose(expected, actual, rel_tol=PARITY_REL_TOLERANCE, abs_tol=1e-9)
+    return expected == actual
+
+def _rows_match(expected: list, actual: list, metric: str) -> bool:
+    if len(expected) != len(actual) or any(list(row) != list(other) for row, other in zip(expected, actual)):
+        return False
+    # The metric column must agree row by row; rows tied on the metric may come back in any order
+    if not all(_values_match(row[metric], other[metric]) for row, other in zip(expected, actual)):
+        return False
+    for row in expected:
+        if not any(all(_values_match(row[column], other[column]) for column in row) for other in actual):
+            return False
+    return True
+
+def verify_parity(agent, store: ColumnarStore, questions=PARITY_QUESTIONS) -> list:
+    """
+    Run each question's intent through both the SQL path and the columnar store.
+    Returns one dict per question with match True/False, or None when the question has no intent.
+    Integers, ids and dates must be equal; float sums agree to PARITY_REL_TOLERANCE.
+    """
+    outcomes = []
+    for question in questions:
+        intent = route_question(question)
+        if intent is None:
+            outcomes.append({"question": question, "intent": None, "match": None})
+            continue
+        metric = intent.intent[len("rank_"):] if intent.intent.startswith("rank_") else intent.intent
+        expected = agent.execute_query(intent.query, intent.params)
+        actual = store.evaluate(intent)
+        match = actual is not None and _rows_match(expected, actual, metric)
+        outcomes.append({
+            "question": question,
+            "intent": intent.intent,
+            "rows": len(expected),
+            "match": match,
+            "sql_result": None if match else expected,
+            "columnar_result": None if match else actual
+        })
+    return outcomes
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check that the columnar engine matches the SQL path")
+    parser.add_argument("questions", nargs="*", help="questions to check (defaults to the built-in parity set)")
+    args = parser.parse_args()
+
+    from app import app
+    from ai_agent import EcommerceAIAgent
+    with app.app_context():
+        agent = EcommerceAIAgent()
+        store = ColumnarStore(enabled=True)
+        if not store.enabled:
+            sys.exit("NumPy is not installed; the columnar engine is unavailable")
+        outcomes = verify_parity(agent, store, args.questions or PARITY_QUESTIONS)
+
+    failures = [outcome for outcome in outcomes if outcome["match"] is False]
+    for outcome in outcomes:
+        status = {True: "ok", False: "MISMATCH", None: "no intent"}[outcome["match"]]
+        print(f"[{status}] {outcome['question']} ({outcome['intent']})")
+        if outcome["match"] is False:
+            print(f"    sql:      {outcome['sql_result']}")
+            print(f"    columnar: {outcome['columnar_result']}")
+    print(f"{len(outcomes) - len(failures)}/{len(outcomes)} questions match")
+    sys.exit(1 if failures else 0)
@@ -1,142 +1,274 @@
-import logging
-from datetime import datetime, date, timedelta
-from app import db
-from models import ProductEligibility, ProductSales, ProductAdMetrics
+import argparse
+import csv
+import math
+import os
+import random
+import time
+from datetime import date, datetime, time as dt_time, timedelta
 
-def load_sample_data():
+# Shape of the real CSVs at 1x: 264 advertised items over 14 days (every item has an ad metrics
+# row every day), about a third of them with sales on roughly half of the days, and 337 items
+# in the daily eligibility snapshots. The distributions below are fitted to those files.
+BASE_AD_ITEMS = 264
+BASE_ELIGIBILITY_ITEMS = 337
+DEFAULT_DAYS = 14
+DEFAULT_START_DATE = date(2025, 6, 1)
+
+SELLER_FRACTION = 0.26           # items with any product_sales rows
+ADVERTISER_FRACTION = 0.38       # items whose ads get impressions at all
+AD_ACTIVE_DAY_PROBABILITY = 0.87 # days an advertiser's ads are served
+RETURN_PROBABILITY = 0.01        # sales rows that are net returns (negative units and sales)
+INELIGIBLE_FRACTION = 0.145
+STATUS_FLIP_PROBABILITY = 0.003  # chance an item's eligibility changes between snapshots
+SPEND_WITHOUT_CLICKS_PROBABILITY = 0.3
+
+INELIGIBLE_MESSAGES = [
+    (0.9, "This product's cost to Amazon does not allow us to meet customers’ pricing expectations. "
+          "Consider reducing the cost. It may take a few weeks for your product to become eligible to "
+          "advertise after you reduce the cost."),
+    (0.1, "This product is either missing important information or contains incorrect information. "
+          "Review in your account to correct the information."),
+]
+
+# Column order of the real CSV files
+CSV_COLUMNS = {
+    'sales': ['date', 'item_id', 'total_sales', 'total_units_ordered'],
+    'ad_metrics': ['date', 'item_id', 'ad_sales', 'impressions', 'ad_spend', 'clicks', 'units_sold'],
+    'eligibility': ['eligibility_datetime_utc', 'item_id', 'eligibility', 'message'],
+}
+CSV_FILE_NAMES = {
+    'sales': 'product_sales.csv',
+    'ad_metrics': 'product_ad_metrics.csv',
+    'eligibility': 'product_eligibility.csv',
+}
+
+def _poisson(rng, mean):
+    if mean <= 0:
+        return 0
+    if mean > 30:
+        return max(0, round(rng.gauss(mean, math.sqrt(mean))))
+    # Knuth's method; fine for the small means used here
+    limit, count, product = math.exp(-mean), 0, rng.random()
+    while product > limit:
+        count += 1
+        product *= rng.random()
+    return count
+
+def _item_profile(rng):
+    """Per-item latent parameters shared by its sales and ad rows"""
+    return {
+        'price': min(2000.0, max(10.0, rng.lognormvariate(math.log(150), 0.5))),
+        'seller': rng.random() < SELLER_FRACTION,
+        'sales_day_probability': rng.uniform(0.2, 1.0),
+        'demand': rng.lognormvariate(math.log(2), 1.2),
+        'advertiser': rng.random() < ADVERTISER_FRACTION,
+        'impression_scale': rng.lognormvariate(5.0, 2.0),
+        'ctr': min(0.5, rng.lognormvariate(math.log(0.006), 0.8)),
+        'cpc': rng.lognormvariate(math.log(1.5), 0.4),
+        'conversion': min(0.5, rng.lognormvariate(math.log(0.15), 0.9)),
+    }
+
+def generate_item_rows(item_id, days, start_date=DEFAULT_START_DATE, seed=0):
     """
-    Load sample e-commerce data into the database
-    This creates realistic data for testing the AI agent
+    Ad metrics rows (one per day) and sales rows (sparse) for one advertised item, as row dicts
+    shaped like the real_data_loader parsers produce. Each item has its own random stream, so
+    the first N items are the same whatever the scale.
     """
-    try:
-        logging.info("Loading sample e-commerce data...")
-        
-        # Sample products with eligibility data
-        products = [
-            {"product_id": "PROD001", "product_name": "Wireless Bluetooth Headphones", "category": "Electronics", "brand": "TechBrand"},
-            {"product_id": "PROD002", "product_name": "Organic Cotton T-Shirt", "category": "Clothing", "brand": "EcoWear"},
-            {"product_id": "PROD003", "product_name": "Stainless Steel Water Bottle", "category": "Sports", "brand": "HydroLife"},
-            {"product_id": "PROD004", "product_name": "LED Desk Lamp", "category": "Home", "brand": "BrightLight"},
-            {"product_id": "PROD005", "product_name": "Protein Powder Vanilla", "category": "Health", "brand": "FitNutrition"},
-        ]
-        
-        # Create product eligibility records
-        for prod_data in products:
-            product = ProductEligibility(
-                product_id=prod_data["product_id"],
-                product_name=prod_data["product_name"],
-                category=prod_data["category"],
-                brand=prod_data["brand"],
-                is_eligible_for_ads=True
-            )
-            db.session.add(product)
-        
-        # Generate sales data for the last 30 days
-        base_date = date.today() - timedelta(days=30)
-        
-        for i in range(30):
-            current_date = base_date + timedelta(days=i)
-            
-            for prod_data in products:
-                # Generate varying sales data
-                base_sales = {
-                    "PROD001": {"units": 15, "revenue": 2999.85},
-                    "PROD002": {"units": 25, "revenue": 749.75},
-                    "PROD003": {"units": 12, "revenue": 359.88},
-                    "PROD004": {"units": 8, "revenue": 639.92},
-                    "PROD005": {"units": 20, "revenue": 1199.80},
-                }
-                
-                # Add some daily variation (±20%)
-                variation = 0.8 + (i % 10) * 0.04  # Creates variation between 0.8 and 1.2
-                
-                units = int(base_sales[prod_data["product_id"]]["units"] * variation)
-                revenue = base_sales[prod_data["product_id"]]["revenue"] * variation
-                
-                sales = ProductSales(
-                    product_id=prod_data["product_id"],
-                    date=current_date,
-                    total_sales=revenue,
-                    units_sold=units,
-                    revenue=revenue
-                )
-                db.session.add(sales)
-                
-                # Generate ad metrics data
-                base_ad_spend = revenue * 0.15  # 15% of revenue as ad spend
-                impressions = int(units * 50 * variation)  # 50 impressions per unit sold
-                clicks = int(impressions * 0.03)  # 3% CTR
-                conversions = int(clicks * 0.1)  # 10% conversion rate
-                ad_revenue = revenue * 0.8  # 80% of total revenue attributed to ads
-                
-                cpc = base_ad_spend / clicks if clicks > 0 else 0
-                ctr = (clicks / impressions * 100) if impressions > 0 else 0
-                roas = (ad_revenue / base_ad_spend * 100) if base_ad_spend > 0 else 0
-                
-                ad_metrics = ProductAdMetrics(
-                    product_id=prod_data["product_id"],
-                    date=current_date,
-                    ad_spend=base_ad_spend,
-                    impressions=impressions,
-                    clicks=clicks,
-                    conversions=conversions,
-                    ad_revenue=ad_revenue,
-                    cpc=round(cpc, 2),
-                    ctr=round(ctr, 2),
-                    roas=round(roas, 2)
-                )
-                db.session.add(ad_metrics)
-        
-        db.session.commit()
-        logging.info("Sample data loaded successfully!")
-        
-    except Exception as e:
-        logging.error(f"Error loading sample data: {e}")
-        db.session.rollback()
-        raise e
+    rng = random.Random(f"{seed}:item:{item_id}")
+    profile = _item_profile(rng)
+    ad_rows, sales_rows = [], []
+
+    for offset in range(days):
+        day = start_date + timedelta(days=offset)
+        impressions = clicks = ad_units = 0
+        ad_spend = ad_sales = 0.0
+        if profile['advertiser'] and rng.random() < AD_ACTIVE_DAY_PROBABILITY:
+            impressions = min(100000, int(profile['impression_scale'] * rng.lognormvariate(0, 0.8)))
+            clicks = min(impressions, _poisson(rng, impressions * profile['ctr']))
+            if clicks:
+                ad_spend = clicks * profile['cpc'] * rng.uniform(0.8, 1.2)
+            elif impressions and rng.random() < SPEND_WITHOUT_CLICKS_PROBABILITY:
+                ad_spend = impressions * 0.003
+            ad_units = _poisson(rng, clicks * profile['conversion'])
+            ad_sales = ad_units * profile['price'] * rng.uniform(0.9, 1.1)
+
+        ad_rows.append({
+            'date': day,
+            'item_id': item_id,
+            'ad_sales': round(ad_sales, 2),
+            'impressions': impressions,
+            'ad_spend': round(ad_spend, 2),
+            'clicks': clicks,
+            'units_sold': ad_units,
+        })
+
+        # Total sales include ad-attributed units, so any day with ad units has a sales row
+        if ad_units or (profile['seller'] and rng.random() < profile['sales_day_probability']):
+            if profile['seller'] and not ad_units and rng.random() < RETURN_PROBABILITY:
+                units = -rng.randint(1, 5)
+            else:
+                units = max(ad_units, 1 + _poisson(rng, profile['demand']))
+            sales_rows.append({
+                'date': day,
+                'item_id': item_id,
+                'total_sales': round(units * profile['price'] * rng.uniform(0.95, 1.05), 2),
+                'total_units_ordered': units,
+            })
+    return ad_rows, sales_rows
+
+def generate_eligibility_rows(item_id, snapshots, start_date=DEFAULT_START_DATE, seed=0):
+    """One eligibility row per daily snapshot for an item; statuses rarely change between snapshots"""
+    rng = random.Random(f"{seed}:eligibility:{item_id}")
+    eligible = rng.random() >= INELIGIBLE_FRACTION
+    message = _pick_message(rng)
+    rows = []
+    for offset in range(snapshots):
+        if rng.random() < STATUS_FLIP_PROBABILITY:
+            eligible = not eligible
+            message = _pick_message(rng)
+        # Snapshots are taken around 08:50 UTC each day
+        checked_at = datetime.combine(start_date + timedelta(days=offset), dt_time(8, 50, 6 + offset % 40))
+        rows.append({
+            'item_id': item_id,
+            'eligibility_datetime': checked_at,
+            'eligibility': eligible,
+            'message': None if eligible else message,
+        })
+    return rows
+
+def _pick_message(rng):
+    threshold, cumulative = rng.random(), 0.0
+    for weight, message in INELIGIBLE_MESSAGES:
+        cumulative += weight
+        if threshold < cumulative:
+            return message
+    return INELIGIBLE_MESSAGES[-1][1]
+
+def generate_dataset(scale=1.0, days=DEFAULT_DAYS, start_date=DEFAULT_START_DATE, seed=0):
+    """
+    Yield (dataset, row) pairs for a synthetic catalogue scale times the size of the real one.
+    dataset is 'sales', 'ad_metrics' or 'eligibility'; rows are produced item by item, so memory
+    stays flat at any scale.
+    """
+    ad_items = max(1, round(BASE_AD_ITEMS * scale))
+    eligibility_items = max(ad_items, round(BASE_ELIGIBILITY_ITEMS * scale))
+    # The real eligibility table has one snapshot fewer than there are days of metrics
+    snapshots = max(1, days - 1)
+
+    for item_id in range(eligibility_items):
+        if item_id < ad_items:
+            ad_rows, sales_rows = generate_item_rows(item_id, days, start_date, seed)
+            for row in ad_rows:
+                yield 'ad_metrics', row
+            for row in sales_rows:
+                yield 'sales', row
+        for row in generate_eligibility_rows(item_id, snapshots, start_date, seed):
+            yield 'eligibility', row
 
-def get_database_schema():
+def _csv_row(name, row):
+    if name == 'eligibility':
+        return [row['eligibility_datetime'].strftime('%Y-%m-%d %H:%M:%S'), row['item_id'],
+                'TRUE' if row['eligibility'] else 'FALSE', row['message'] or '']
+    return [row[column].isoformat() if column == 'date' else row[column] for column in CSV_COLUMNS[name]]
+
+def write_csv(output_dir, scale=1.0, days=DEFAULT_DAYS, start_date=DEFAULT_START_DATE, seed=0):
+    """
+    Write the synthetic catalogue as three CSV files with the same columns as the real exports.
+    Returns dataset -> (path, rows written).
     """
-    Return database schema information for the AI agent
+    os.makedirs(output_dir, exist_ok=True)
+    files, writers, counts = {}, {}, {}
+    try:
+        for name, file_name in CSV_FILE_NAMES.items():
+            files[name] = open(os.path.join(output_dir, file_name), 'w', newline='', encoding='utf-8')
+            writers[name] = csv.writer(files[name])
+            writers[name].writerow(CSV_COLUMNS[name])
+            counts[name] = 0
+        for name, row in generate_dataset(scale, days, start_date, seed):
+            writers[name].writerow(_csv_row(name, row))
+            counts[name] += 1
+    finally:
+        for file in files.values():
+            file.close()
+    return {name: (os.path.join(output_dir, CSV_FILE_NAMES[name]), counts[name]) for name in CSV_FILE_NAMES}
+
+def load_sample_data(scale=1.0, days=DEFAULT_DAYS, start_date=DEFAULT_START_DATE, seed=0):
     """
-    schema_info = """
-    Tables and their columns:
-    
-    1. product_eligibility:
-       - id (INTEGER, PRIMARY KEY)
-       - product_id (VARCHAR(50), UNIQUE)
-       - product_name (VARCHAR(200))
-       - category (VARCHAR(100))
-       - brand (VARCHAR(100))
-       - is_eligible_for_ads (BOOLEAN)
-       - created_at (DATETIME)
-    
-    2. product_sales:
-       - id (INTEGER, PRIMARY KEY)
-       - product_id (VARCHAR(50))
-       - date (DATE)
-       - total_sales (FLOAT)
-       - units_sold (INTEGER)
-       - revenue (FLOAT)
-       - created_at (DATETIME)
-    
-    3. product_ad_metrics:
-       - id (INTEGER, PRIMARY KEY)
-       - product_id (VARCHAR(50))
-       - date (DATE)
-       - ad_spend (FLOAT)
-       - impressions (INTEGER)
-       - clicks (INTEGER)
-       - conversions (INTEGER)
-       - ad_revenue (FLOAT)
-       - cpc (FLOAT) -- Cost Per Click
-       - ctr (FLOAT) -- Click Through Rate
-       - roas (FLOAT) -- Return on Ad Spend
-       - created_at (DATETIME)
-    
-    Note: 
-    - product_sales.product_id and product_ad_metrics.product_id reference product_eligibility.product_id
-    - Use JOINs to get product names and details
-    - RoAS is calculated as (ad_revenue / ad_spend) * 100
+    Replace the database contents with a synthetic catalogue scale times the size of the real one.
+    Rows are inserted in batches as they are generated. The generator interleaves the datasets
+    item by item, so all three are inserted in a single transaction (a failed load leaves the
+    tables empty, not half filled); then the data version is bumped and the rollups rebuilt.
+    Must run in an app context.
     """
-    return schema_info
+    from app import db
+    from models import ProductSales, ProductAdMetrics, ProductEligibility, IngestionState, FullLoadState
+    from data_version import bump_data_version
+    from real_data_loader import bulk_insert, INGEST_BATCH_SIZE
+    from rollups import refresh_rollups
+
+    models = {'sales': ProductSales, 'ad_metrics': ProductAdMetrics, 'eligibility': ProductEligibility}
+    print(f"Generating synthetic data at {scale:g}x scale over {days} days...")
+    started = time.perf_counter()
+
+    for model in models.values():
+        model.query.delete()
+    # The tables no longer hold what the CSV files contain, so the next incremental run reloads them
+    # and their snapshots are not read in place of the tables
+    IngestionState.query.delete()
+    FullLoadState.query.delete()
+    db.session.commit()
+    bump_data_version()
+
+    buffers = {name: [] for name in models}
+    counts = {name: 0 for name in models}
+    try:
+        for name, row in generate_dataset(scale, days, start_date, seed):
+            buffer = buffers[name]
+            buffer.append(row)
+            if len(buffer) >= INGEST_BATCH_SIZE:
+                counts[name] += bulk_insert(models[name], buffer)
+                buffer.clear()
+        for name, buffer in buffers.items():
+            counts[name] += bulk_insert(models[name], buffer)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    bump_data_version()
+    refresh_rollups()
+
+    elapsed = time.perf_counter() - started
+    total = sum(counts.values())
+    print(f"Loaded {total} synthetic rows in {elapsed:.2f}s ({total / elapsed if elapsed > 0 else total:,.0f} rows/sec)")
+    print(f"- Product Sales Records: {counts['sales']}")
+    print(f"- Product Ad Metrics Records: {counts['ad_metrics']}")
+    print(f"- Product Eligibility Records: {counts['eligibility']}")
+    return counts
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic e-commerce catalogue shaped like the real CSVs")
+    parser.add_argument("--scale", type=float, default=1.0, help="catalogue size relative to the real data (1 to 1000)")
+    parser.add_argument("--days", type=int, default=DEFAULT_DAYS, help=f"days of metrics (default {DEFAULT_DAYS})")
+    parser.add_argument("--start-date", type=date.fromisoformat, default=DEFAULT_START_DATE,
+                        help="first day of metrics, YYYY-MM-DD")
+    parser.add_argument("--seed", type=int, default=0, help="random seed; the same seed gives the same data")
+    parser.add_argument("--format", choices=["csv", "db"], default="csv",
+                        help="write CSV files or load straight into DATABASE_URL")
+    parser.add_argument("--output-dir", default="synthetic_data", help="directory for --format csv")
+    args = parser.parse_args()
+
+    if not 0 < args.scale <= 1000:
+        parser.error("--scale must be greater than 0 and at most 1000")
+
+    if args.format == "csv":
+        started = time.perf_counter()
+        written = write_csv(args.output_dir, args.scale, args.days, args.start_date, args.seed)
+        for name, (path, count) in written.items():
+            print(f"Wrote {count} rows to {path}")
+        print(f"Done in {time.perf_counter() - started:.2f}s")
+    else:
+        from app import app
+        from quick_answers import refresh_after_ingestion
+        with app.app_context():
+            load_sample_data(args.scale, args.days, args.start_date, args.seed)
+            refresh_after_ingestion()
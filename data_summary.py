@@ -0,0 +1,90 @@
+import logging
+from datetime import date, datetime
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from app import db
+from metrics import timed
+from models import DataSummary
+
+# Single row read by /api/data/summary
+DATA_SUMMARY_ID = 1
+
+def _as_date(value):
+    # SQLite returns dates from raw SQL as text
+    if value is None or isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+def _as_datetime(value):
+    if value is None or isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(str(value))
+
+@timed("refresh_data_summary")
+def refresh_data_summary(data_version: int = None) -> DataSummary:
+    """
+    Rebuild the summary row and commit. Sales and ad figures come from item_rollup and
+    daily_rollup, so call this after the rollups are rebuilt; only product_eligibility is
+    read directly. data_version defaults to the current one.
+    """
+    from data_version import get_data_version
+
+    totals = db.session.execute(text("""
+        SELECT COALESCE(SUM(sales_rows), 0), COALESCE(SUM(CASE WHEN sales_rows > 0 THEN 1 ELSE 0 END), 0),
+               COALESCE(SUM(ad_rows), 0), COALESCE(SUM(CASE WHEN ad_rows > 0 THEN 1 ELSE 0 END), 0)
+        FROM item_rollup
+    """)).one()
+    ranges = db.session.execute(text("""
+        SELECT MIN(CASE WHEN sales_rows > 0 THEN date END), MAX(CASE WHEN sales_rows > 0 THEN date END),
+               MIN(CASE WHEN ad_rows > 0 THEN date END), MAX(CASE WHEN ad_rows > 0 THEN date END)
+        FROM daily_rollup
+    """)).one()
+    eligibility = db.session.execute(text("""
+        SELECT COUNT(*), COUNT(DISTINCT item_id), MIN(eligibility_datetime), MAX(eligibility_datetime)
+        FROM product_eligibility
+    """)).one()
+    split = db.session.execute(text("""
+        SELECT COALESCE(SUM(CASE WHEN e.eligibility THEN 1 ELSE 0 END), 0),
+               COALESCE(SUM(CASE WHEN e.eligibility THEN 0 ELSE 1 END), 0)
+        FROM product_eligibility e
+        JOIN (SELECT item_id, MAX(eligibility_datetime) AS latest FROM product_eligibility GROUP BY item_id) l
+          ON e.item_id = l.item_id AND e.eligibility_datetime = l.latest
+    """)).one()
+
+    summary = db.session.get(DataSummary, DATA_SUMMARY_ID)
+    if summary is None:
+        summary = DataSummary(id=DATA_SUMMARY_ID)
+        db.session.add(summary)
+    summary.data_version = get_data_version() if data_version is None else data_version
+    summary.sales_rows, summary.sales_items, summary.ad_rows, summary.ad_items = (int(value) for value in totals)
+    summary.sales_start, summary.sales_end, summary.ad_start, summary.ad_end = (_as_date(value) for value in ranges)
+    summary.eligibility_rows, summary.eligibility_items = int(eligibility[0]), int(eligibility[1])
+    summary.eligibility_start, summary.eligibility_end = _as_datetime(eligibility[2]), _as_datetime(eligibility[3])
+    summary.eligible_items, summary.ineligible_items = int(split[0]), int(split[1])
+    summary.refreshed_at = datetime.utcnow()
+    db.session.commit()
+    logging.info(f"Data summary refreshed at data version {summary.data_version}")
+    return summary
+
+def data_summary_is_fresh() -> bool:
+    """True when the summary row was built at the current data version; False if the table is missing"""
+    from data_version import get_data_version
+
+    try:
+        built_at = db.session.execute(
+            text("SELECT data_version FROM data_summary WHERE id = :id"), {"id": DATA_SUMMARY_ID}
+        ).scalar()
+    except (OperationalError, ProgrammingError):
+        db.session.rollback()
+        return False
+    return built_at is not None and built_at == get_data_version()
+
+def load_data_summary() -> DataSummary:
+    """
+    The stored summary row. It is only built here when it does not exist yet (e.g. a database
+    loaded before the table was added); otherwise ingestion keeps it current.
+    """
+    summary = db.session.get(DataSummary, DATA_SUMMARY_ID)
+    if summary is None:
+        summary = refresh_data_summary()
+    return summary
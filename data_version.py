@@ -0,0 +1,36 @@
+import logging
+from sqlalchemy import select, update
+from app import db
+from models import DataVersion
+
+# Single row holding the counter; every worker reads the same value
+DATA_VERSION_ID = 1
+
+def get_data_version() -> int:
+    """
+    Return the current data version, creating the counter row on first use
+    """
+    version = db.session.execute(
+        select(DataVersion.version).where(DataVersion.id == DATA_VERSION_ID)
+    ).scalar()
+    if version is None:
+        db.session.add(DataVersion(id=DATA_VERSION_ID, version=0))
+        db.session.commit()
+        version = 0
+    return version
+
+def bump_data_version() -> int:
+    """
+    Increment the data version after data has been ingested or cleared.
+    Anything keyed on the previous version (e.g. cached query results) becomes unreachable.
+    """
+    get_data_version()
+    db.session.execute(
+        update(DataVersion)
+        .where(DataVersion.id == DATA_VERSION_ID)
+        .values(version=DataVersion.version + 1)
+    )
+    db.session.commit()
+    version = get_data_version()
+    logging.info(f"Data version bumped to {version}")
+    return version
@@ -1,75 +1,349 @@
 import json
 import logging
 import os
-from google import genai
-from google.genai import types
+import threading
+import time
+from collections import deque
 from pydantic import BaseModel
+from metrics import LLM_CALLS, LLM_TOKENS
 
-# Initialize Gemini client
-client = genai.Client(api_key=os.environ.get("GEMINI_API_KEY", "default_key"))
+# The google-genai SDK takes most of a second to import, so it is imported and the client
+# built on first use (or by warm_up() in the background) instead of when this module loads
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    """The Gemini client, created on first use"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from google import genai
+                _client = genai.Client(api_key=os.environ.get("GEMINI_API_KEY", "default_key"))
+    return _client
+
+def set_client(new_client):
+    """
+    Replace the Gemini client used by every call in this module, e.g. with the fake client in
+    benchmark.py. It must provide models.generate_content, models.generate_content_stream
+    and caches.create like genai.Client.
+    """
+    global _client
+    with _client_lock:
+        _client = new_client
+    # A cache created through the previous client means nothing to the new one
+    _prompt_cache.reset()
+
+def warm_up():
+    """Import the SDK, types included, and build the client ahead of the first question"""
+    import google.genai.types
+    get_client()
 
 class SQLQuery(BaseModel):
     query: str
     explanation: str
 
-def generate_sql_query(question: str, schema_info: str) -> SQLQuery:
+SQL_MODEL = "gemini-2.5-pro"
+
+# Reuse the static system prompt through Gemini's cached content when the model accepts it
+GEMINI_PROMPT_CACHE_ENABLED = os.environ.get("GEMINI_PROMPT_CACHE_ENABLED", "true").lower() == "true"
+GEMINI_PROMPT_CACHE_TTL_SECONDS = int(os.environ.get("GEMINI_PROMPT_CACHE_TTL_SECONDS", "3600"))
+# Wait before trying again after creating the cache failed for a reason that may pass (network, quota)
+GEMINI_PROMPT_CACHE_RETRY_SECONDS = int(os.environ.get("GEMINI_PROMPT_CACHE_RETRY_SECONDS", "300"))
+# Number of recent SQL-generation calls kept for the prompt size report
+PROMPT_STATS_HISTORY = int(os.environ.get("PROMPT_STATS_HISTORY", "200"))
+
+# Static part of the SQL prompt. The per-question schema goes in the request contents,
+# so this text is identical on every call and can be served from the prompt cache.
+SQL_SYSTEM_PROMPT = """You are an expert SQL analyst for an e-commerce database. Convert natural language questions to SQL queries.
+Each request gives the relevant part of the database schema followed by the question.
+
+Rules:
+1. Generate valid SQLite queries only, using only the tables and columns listed in the request
+2. Join product_sales and product_ad_metrics on both item_id and date
+3. Include appropriate aggregations and filters, and guard divisions against zero denominators
+4. Return JSON with 'query' and 'explanation' fields
+5. For RoAS: SUM(ad_sales) / SUM(ad_spend) * 100 from product_ad_metrics
+6. For total sales: SUM(total_sales) from product_sales
+7. For CPC: ad_spend / clicks from product_ad_metrics (there is no cpc column)
+8. Products are identified by item_id; always use proper column names and table aliases
+
+Example questions and expected approach:
+- "What is my total sales?" -> SELECT SUM(total_sales) FROM product_sales
+- "Calculate the RoAS" -> SELECT SUM(ad_sales) / SUM(ad_spend) * 100 FROM product_ad_metrics WHERE ad_spend > 0
+- "Which product had the highest CPC?" -> SELECT item_id, ad_spend / clicks AS cpc FROM product_ad_metrics WHERE clicks > 0 ORDER BY cpc DESC LIMIT 1
+"""
+
+def estimate_tokens(text: str) -> int:
+    # Rough count used when the API does not report usage (about four characters per token)
+    return max(1, len(text) // 4)
+
+def _count_call(purpose: str, response=None):
+    """Count a Gemini call and its token usage for /metrics"""
+    LLM_CALLS.inc(purpose=purpose)
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return
+    for kind, value in (("prompt", usage.prompt_token_count), ("cached", usage.cached_content_token_count),
+                        ("output", usage.candidates_token_count)):
+        if value:
+            LLM_TOKENS.inc(value, purpose=purpose, kind=kind)
+
+class PromptStats:
+    """Prompt size and latency of recent SQL-generation calls"""
+
+    def __init__(self, history: int = PROMPT_STATS_HISTORY):
+        self._entries = deque(maxlen=history)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+
+    def record(self, question: str, tables: list, prompt_tokens: int, cached_tokens: int,
+               output_tokens: int, latency_ms: float, prompt_cache: bool, estimated: bool):
+        entry = {
+            "question": question,
+            "tables": tables,
+            "prompt_tokens": prompt_tokens,
+            "cached_tokens": cached_tokens,
+            "output_tokens": output_tokens,
+            "latency_ms": round(latency_ms, 1),
+            "prompt_cache": prompt_cache,
+            "estimated": estimated
+        }
+        with self._lock:
+            self._entries.append(entry)
+            self.calls += 1
+            self.prompt_tokens += prompt_tokens
+            self.cached_tokens += cached_tokens
+
+    def stats(self) -> dict:
+        with self._lock:
+            recent = list(self._entries)
+            calls, prompt_tokens, cached_tokens = self.calls, self.prompt_tokens, self.cached_tokens
+        return {
+            "calls": calls,
+            "avg_prompt_tokens": round(prompt_tokens / calls, 1) if calls else 0,
+            "avg_cached_tokens": round(cached_tokens / calls, 1) if calls else 0,
+            "avg_latency_ms": round(sum(e["latency_ms"] for e in recent) / len(recent), 1) if recent else 0,
+            "system_prompt_tokens": estimate_tokens(SQL_SYSTEM_PROMPT),
+            "prompt_cache": _prompt_cache.stats(),
+            "recent": recent[::-1]
+        }
+
+prompt_stats = PromptStats()
+
+class _SystemPromptCache:
     """
-    Convert natural language question to SQL query using Gemini
+    Gemini cached content holding SQL_SYSTEM_PROMPT. Created on first use and recreated shortly
+    before its TTL runs out. Disabled for the life of the process only when the API says cached
+    content cannot work here (for example when the prompt is below the model's minimum cacheable
+    size); other failures are retried after GEMINI_PROMPT_CACHE_RETRY_SECONDS.
     """
-    try:
-        system_prompt = f"""
-        You are an expert SQL analyst for an e-commerce database. Convert natural language questions to SQL queries.
-        
-        Database Schema:
-        {schema_info}
-        
-        Rules:
-        1. Generate valid SQLite queries only
-        2. Use proper table joins when needed
-        3. Include appropriate aggregations and filters
-        4. Return JSON with 'query' and 'explanation' fields
-        5. For RoAS calculations: (ad_revenue / ad_spend) * 100
-        6. For total sales: sum revenue from product_sales table
-        7. For CPC analysis: use cpc column from product_ad_metrics
-        8. Always use proper column names and table aliases
-        
-        Example questions and expected approach:
-        - "What is my total sales?" -> SUM(revenue) FROM product_sales
-        - "Calculate the RoAS" -> SELECT (SUM(ad_revenue) / SUM(ad_spend)) * 100 FROM product_ad_metrics
-        - "Which product had the highest CPC?" -> SELECT product_id, MAX(cpc) FROM product_ad_metrics
-        """
 
-        response = client.models.generate_content(
-            model="gemini-2.5-pro",
-            contents=[
-                types.Content(role="user", parts=[types.Part(text=f"Question: {question}")])
-            ],
-            config=types.GenerateContentConfig(
-                system_instruction=system_prompt,
-                response_mime_type="application/json",
-                response_schema=SQLQuery,
+    def __init__(self, enabled: bool = GEMINI_PROMPT_CACHE_ENABLED, ttl_seconds: int = GEMINI_PROMPT_CACHE_TTL_SECONDS,
+                 retry_seconds: int = GEMINI_PROMPT_CACHE_RETRY_SECONDS):
+        self.enabled = enabled
+        self.ttl_seconds = ttl_seconds
+        self.retry_seconds = retry_seconds
+        self.name = None
+        self._expires_at = 0.0
+        self._retry_at = 0.0
+        self._creating = False
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.unavailable_reason = None
+        self.last_error = None
+
+    def get(self):
+        """Name of a live cached content for the system prompt, or None to send it inline"""
+        if not self.enabled or self.unavailable_reason:
+            return None
+        with self._lock:
+            now = time.monotonic()
+            # Refresh a minute early so an in-flight request never references an expired cache
+            if self.name is not None and now < self._expires_at - 60:
+                return self.name
+            # One caller creates the cache; the others send the prompt inline meanwhile
+            if self._creating or now < self._retry_at:
+                return None
+            self._creating = True
+            generation = self._generation
+
+        # The API call happens outside the lock, so other requests never wait on it
+        name, error = None, None
+        try:
+            name = self._create()
+        except Exception as e:
+            error = e
+
+        with self._lock:
+            self._creating = False
+            if generation != self._generation:
+                # reset() ran meanwhile (e.g. a new client); the result belongs to the old one
+                return None
+            if error is None:
+                self.name = name
+                self._expires_at = time.monotonic() + self.ttl_seconds
+                self.last_error = None
+                logging.info(f"Created Gemini prompt cache {self.name}")
+                return self.name
+            self.name = None
+            self.last_error = str(error)
+            if _cache_unsupported(error):
+                self.unavailable_reason = str(error)
+                logging.warning(f"Gemini prompt cache unsupported, sending the system prompt inline: {error}")
+            else:
+                self._retry_at = time.monotonic() + self.retry_seconds
+                logging.warning(f"Could not create the Gemini prompt cache, retrying in {self.retry_seconds}s: {error}")
+            return None
+
+    def _create(self) -> str:
+        from google.genai import types
+        cached = get_client().caches.create(
+            model=SQL_MODEL,
+            config=types.CreateCachedContentConfig(
+                display_name="sql-system-prompt",
+                system_instruction=SQL_SYSTEM_PROMPT,
+                ttl=f"{self.ttl_seconds}s",
             ),
         )
+        return cached.name
+
+    def reset(self):
+        """Forget the current cache and any earlier failure, so the next call tries again"""
+        with self._lock:
+            self.name = None
+            self._expires_at = 0.0
+            self._retry_at = 0.0
+            self._generation += 1
+            self.unavailable_reason = None
+            self.last_error = None
+
+    def drop(self, name: str):
+        """Forget a cached content the API rejected, so the next call creates a new one"""
+        with self._lock:
+            if self.name == name:
+                self.name = None
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "name": self.name,
+            "unavailable_reason": self.unavailable_reason,
+            "last_error": self.last_error
+        }
+
+def _cache_unsupported(error: Exception) -> bool:
+    """
+    True for errors that creating the cache again cannot fix: the prompt is below the model's
+    minimum cacheable size, or the model or API does not support cached content
+    """
+    message = str(error).lower()
+    if any(phrase in message for phrase in ("too small", "min_total_token_count", "not supported", "unsupported")):
+        return True
+    # INVALID_ARGUMENT / NOT_FOUND (google.genai.errors.ClientError); throttling and timeouts are retried
+    return getattr(error, "code", None) in (400, 404)
+
+_prompt_cache = _SystemPromptCache()
+
+def _sql_config(cache_name, response_schema=SQLQuery):
+    from google.genai import types
+    if cache_name:
+        return types.GenerateContentConfig(
+            cached_content=cache_name,
+            response_mime_type="application/json",
+            response_schema=response_schema,
+        )
+    return types.GenerateContentConfig(
+        system_instruction=SQL_SYSTEM_PROMPT,
+        response_mime_type="application/json",
+        response_schema=response_schema,
+    )
+
+def _generate_sql_json(prompt: str, question: str, tables: list, response_schema=SQLQuery,
+                       purpose: str = "sql") -> str:
+    """
+    Send a prompt under the SQL system prompt (cached when possible), record its size and
+    latency in prompt_stats and return the raw JSON text
+    """
+    from google.genai import types
+    contents = [types.Content(role="user", parts=[types.Part(text=prompt)])]
+
+    start = time.perf_counter()
+    cache_name = _prompt_cache.get()
+    client = get_client()
+    try:
+        response = client.models.generate_content(model=SQL_MODEL, contents=contents,
+                                                  config=_sql_config(cache_name, response_schema))
+    except Exception as e:
+        if not cache_name:
+            raise
+        # The cache may have been evicted server-side; retry once with the prompt inline
+        logging.warning(f"Gemini call with prompt cache {cache_name} failed, retrying inline: {e}")
+        _prompt_cache.drop(cache_name)
+        cache_name = None
+        response = client.models.generate_content(model=SQL_MODEL, contents=contents,
+                                                  config=_sql_config(None, response_schema))
+    latency_ms = (time.perf_counter() - start) * 1000
+    _count_call(purpose, response)
+
+    raw_json = response.text
+    logging.info(f"Generated SQL JSON: {raw_json}")
 
-        raw_json = response.text
-        logging.info(f"Generated SQL JSON: {raw_json}")
+    usage = getattr(response, "usage_metadata", None)
+    if usage is not None and usage.prompt_token_count:
+        prompt_stats.record(question, tables or [], usage.prompt_token_count,
+                            usage.cached_content_token_count or 0, usage.candidates_token_count or 0,
+                            latency_ms, bool(cache_name), estimated=False)
+    else:
+        system_tokens = estimate_tokens(SQL_SYSTEM_PROMPT)
+        prompt_stats.record(question, tables or [], system_tokens + estimate_tokens(prompt),
+                            system_tokens if cache_name else 0, estimate_tokens(raw_json or ""),
+                            latency_ms, bool(cache_name), estimated=True)
 
-        if raw_json:
-            data = json.loads(raw_json)
-            return SQLQuery(**data)
-        else:
-            raise ValueError("Empty response from model")
+    if not raw_json:
+        raise ValueError("Empty response from model")
+    return raw_json
+
+def generate_sql_query(question: str, schema_info: str, tables: list = None) -> SQLQuery:
+    """
+    Convert natural language question to SQL query using Gemini.
+    schema_info should be the compact schema for this question (see schema_index.build_schema_prompt);
+    tables lists the tables it covers, for the prompt size report.
+    """
+    try:
+        prompt = f"Database Schema:\n{schema_info}\n\nQuestion: {question}"
+        data = json.loads(_generate_sql_json(prompt, question, tables))
+        return SQLQuery(**data)
 
     except Exception as e:
         logging.error(f"Failed to generate SQL query: {e}")
         raise Exception(f"Failed to generate SQL query: {e}")
 
-def format_response(question: str, sql_result: list, explanation: str = "") -> str:
+def generate_sql_queries(questions: list, schema_info: str, tables: list = None) -> list:
     """
-    Format SQL results into human-readable response using Gemini
+    Convert several questions to SQL in a single Gemini call.
+    Returns one SQLQuery per question, in the same order.
     """
     try:
-        prompt = f"""
+        numbered = "\n".join(f"{i}. {question}" for i, question in enumerate(questions, 1))
+        prompt = (f"Database Schema:\n{schema_info}\n\n"
+                  f"Answer each of the {len(questions)} numbered questions below with its own query. "
+                  f"Return a JSON list with exactly one object per question, in the same order.\n\n"
+                  f"Questions:\n{numbered}")
+        data = json.loads(_generate_sql_json(prompt, f"[batch of {len(questions)}] {questions[0]}",
+                                             tables, response_schema=list[SQLQuery], purpose="sql_batch"))
+        if not isinstance(data, list) or len(data) != len(questions):
+            raise ValueError(f"Expected {len(questions)} queries, got {len(data) if isinstance(data, list) else 'none'}")
+        return [SQLQuery(**item) for item in data]
+
+    except Exception as e:
+        logging.error(f"Failed to generate SQL queries: {e}")
+        raise Exception(f"Failed to generate SQL queries: {e}")
+
+def _format_prompt(question: str, sql_result: list, explanation: str = "") -> str:
+    return f"""
         Question: {question}
         SQL Result: {sql_result}
         SQL Explanation: {explanation}
@@ -80,13 +354,88 @@ def format_response(question: str, sql_result: list, explanation: str = "") -> s
         If it's multiple rows, organize the information logically.
         """
 
-        response = client.models.generate_content(
+def format_response(question: str, sql_result: list, explanation: str = "") -> str:
+    """
+    Format SQL results into human-readable response using Gemini
+    """
+    try:
+        prompt = _format_prompt(question, sql_result, explanation)
+
+        response = get_client().models.generate_content(
             model="gemini-2.5-flash",
             contents=prompt
         )
+        _count_call("format", response)
 
         return response.text or "Unable to format the response"
 
     except Exception as e:
         logging.error(f"Failed to format response: {e}")
         return f"Raw data: {sql_result}"
+
+def format_response_stream(question: str, sql_result: list, explanation: str = ""):
+    """
+    Format SQL results using Gemini's streaming API, yielding text chunks as they arrive
+    """
+    produced = False
+    try:
+        prompt = _format_prompt(question, sql_result, explanation)
+
+        last_chunk = None
+        for chunk in get_client().models.generate_content_stream(
+            model="gemini-2.5-flash",
+            contents=prompt
+        ):
+            # Usage totals arrive on the final chunk
+            last_chunk = chunk
+            if chunk.text:
+                produced = True
+                yield chunk.text
+
+        _count_call("format_stream", last_chunk)
+        if not produced:
+            yield "Unable to format the response"
+
+    except Exception as e:
+        logging.error(f"Failed to stream formatted response: {e}")
+        if not produced:
+            yield f"Raw data: {sql_result}"
+
+def format_responses(items: list) -> list:
+    """
+    Format several (question, sql_result, explanation) tuples in a single Gemini call.
+    Returns one answer per item; items the model leaves out fall back to their raw data.
+    """
+    from google.genai import types
+    try:
+        sections = "\n".join(
+            f"{i}. Question: {question}\n   SQL Result: {sql_result}\n   SQL Explanation: {explanation}"
+            for i, (question, sql_result, explanation) in enumerate(items, 1)
+        )
+        prompt = f"""
+        Format each numbered result below into a clear, human-readable answer to its question.
+        Include relevant numbers, percentages, and insights.
+        Return a JSON list of {len(items)} strings, one answer per item, in the same order.
+
+        {sections}
+        """
+
+        response = get_client().models.generate_content(
+            model="gemini-2.5-flash",
+            contents=prompt,
+            config=types.GenerateContentConfig(
+                response_mime_type="application/json",
+                response_schema=list[str],
+            ),
+        )
+        _count_call("format_batch", response)
+        answers = json.loads(response.text or "[]")
+
+    except Exception as e:
+        logging.error(f"Failed to format responses: {e}")
+        answers = []
+
+    return [
+        answers[i] if i < len(answers) and answers[i] else f"Raw data: {sql_result}"
+        for i, (_, sql_result, _) in enumerate(items)
+    ]
@@ -0,0 +1,409 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from sqlalchemy import text, inspect, Date, DateTime
+from app import db
+from result_cache import canonicalize_sql
+
+INDEX_ADVISOR_ENABLED = os.environ.get("INDEX_ADVISOR_ENABLED", "true").lower() == "true"
+INDEX_ADVISOR_MAX_STATEMENTS = int(os.environ.get("INDEX_ADVISOR_MAX_STATEMENTS", "500"))
+# Executions of full-scan statements on a table before an index is recommended for it
+INDEX_ADVISOR_MIN_SCANS = int(os.environ.get("INDEX_ADVISOR_MIN_SCANS", "3"))
+# Create recommended indexes automatically once a statement reaches INDEX_ADVISOR_MIN_SCANS
+INDEX_ADVISOR_AUTO_CREATE = os.environ.get("INDEX_ADVISOR_AUTO_CREATE", "false").lower() == "true"
+INDEX_ADVISOR_MAX_INDEX_COLUMNS = int(os.environ.get("INDEX_ADVISOR_MAX_INDEX_COLUMNS", "6"))
+
+# SQLite EXPLAIN QUERY PLAN detail lines
+_SQLITE_SCAN_RE = re.compile(
+    r"^(?P<operation>SCAN|SEARCH)\s+(?:TABLE\s+)?(?P<table>\w+)(?:\s+AS\s+\w+)?"
+    r"(?:\s+USING\s+(?P<covering>COVERING\s+)?(?:INDEX\s+(?P<index>\w+)|(?:INTEGER\s+)?PRIMARY\s+KEY))?",
+    re.IGNORECASE
+)
+_SQLITE_TEMP_BTREE_RE = re.compile(r"^USE TEMP B-TREE FOR (?P<purpose>.+)$", re.IGNORECASE)
+
+# Postgres EXPLAIN node types
+_PG_FULL_SCAN_NODES = {"Seq Scan"}
+_PG_INDEX_SCAN_NODES = {"Index Scan", "Index Only Scan", "Bitmap Heap Scan", "Bitmap Index Scan"}
+_PG_SORT_NODES = {"Sort", "Incremental Sort"}
+
+_STRING_LITERAL_RE = re.compile(r"'(?:[^']|'')*'")
+_TABLE_REF_RE = re.compile(r"\b(?:from|join)\s+(\w+)(?:\s+(?:as\s+)?(\w+))?", re.IGNORECASE)
+_CLAUSE_RE = re.compile(r"\b(?:where|group\s+by|having|order\s+by|limit)\b", re.IGNORECASE)
+_COLUMN_RE = r"(?:(\w+)\.)?(\w+)"
+_EQUALITY_RE = re.compile(_COLUMN_RE + r"\s*(?:=|==|\bin\b|\bis\b)", re.IGNORECASE)
+_RANGE_RE = re.compile(_COLUMN_RE + r"\s*(?:<=|>=|<|>|\bbetween\b)", re.IGNORECASE)
+_REFERENCE_RE = re.compile(r"(?<![:\w])" + _COLUMN_RE + r"\b(?!\s*\()", re.IGNORECASE)
+_ALIAS_KEYWORDS = {"where", "group", "order", "limit", "having", "join", "inner", "left", "right", "full",
+                   "cross", "on", "using", "natural", "union", "as"}
+
+def _mask_literals(sql: str) -> str:
+    return _STRING_LITERAL_RE.sub("''", sql)
+
+def _split_clauses(sql: str) -> dict:
+    """Map "select", "where", "group by", "having", "order by" to the text of that clause"""
+    matches = list(_CLAUSE_RE.finditer(sql))
+    head_end = matches[0].start() if matches else len(sql)
+    clauses = {"select": sql[:head_end]}
+    for index, clause_match in enumerate(matches):
+        end = matches[index + 1].start() if index + 1 < len(matches) else len(sql)
+        keyword = " ".join(clause_match.group(0).lower().split())
+        clauses[keyword] = clauses.get(keyword, "") + " " + sql[clause_match.end():end]
+    return clauses
+
+def _table_aliases(sql: str, tables) -> dict:
+    """Map every name a statement uses for a known table (the table itself and its aliases) to the table"""
+    aliases = {}
+    for table, alias in _TABLE_REF_RE.findall(sql):
+        table = table.lower()
+        if table not in tables:
+            continue
+        aliases[table] = table
+        if alias and alias.lower() not in _ALIAS_KEYWORDS:
+            aliases[alias.lower()] = table
+    return aliases
+
+def _columns_for_table(matches, table, table_columns, aliases) -> list:
+    """Column names (in order of appearance, deduplicated) that a clause references on one table"""
+    columns = []
+    for qualifier, column in matches:
+        column = column.lower()
+        if qualifier and aliases.get(qualifier.lower()) != table:
+            continue
+        if column in table_columns and column not in columns:
+            columns.append(column)
+    return columns
+
+def suggest_index_columns(sql_query: str, table: str, table_columns) -> list:
+    """
+    Propose index columns for one table referenced by a statement:
+    equality-filtered columns first, then one range-filtered column (or the GROUP BY columns when
+    there is no range filter), then the other referenced columns so the index covers the query.
+    table_columns is the table's column collection, used to resolve names and prefer date ranges.
+    Returns an empty list when nothing filters or groups on the table.
+    """
+    masked = _mask_literals(sql_query)
+    aliases = _table_aliases(masked, set(db.metadata.tables))
+    if table not in aliases.values():
+        return []
+    clauses = _split_clauses(masked)
+    where = clauses.get("where", "")
+
+    equality = _columns_for_table(_EQUALITY_RE.findall(where), table, table_columns, aliases)
+    ranges = [column for column in _columns_for_table(_RANGE_RE.findall(where), table, table_columns, aliases)
+              if column not in equality]
+    # Date ranges are usually far more selective than guards such as clicks > 0
+    ranges.sort(key=lambda column: not isinstance(table_columns[column].type, (Date, DateTime)))
+    grouping = _columns_for_table(_REFERENCE_RE.findall(clauses.get("group by", "")), table, table_columns, aliases)
+
+    key = list(equality)
+    if ranges:
+        key.append(ranges[0])
+    else:
+        key += [column for column in grouping if column not in key]
+    if not key:
+        return []
+
+    referenced = _columns_for_table(_REFERENCE_RE.findall(masked), table, table_columns, aliases)
+    covering = key + [column for column in referenced if column not in key and column != "id"]
+    if len(covering) <= INDEX_ADVISOR_MAX_INDEX_COLUMNS:
+        return covering
+    return key[:INDEX_ADVISOR_MAX_INDEX_COLUMNS]
+
+def index_name(table: str, columns) -> str:
+    name = f"ix_advisor_{table}_{'_'.join(columns)}"
+    if len(name) <= 60:
+        return name
+    digest = hashlib.sha1(name.encode()).hexdigest()[:8]
+    return f"{name[:51]}_{digest}"
+
+def explain_query_plan(sql_query: str, params: dict = None) -> list:
+    """
+    Run EXPLAIN QUERY PLAN (SQLite) or EXPLAIN (Postgres) for a statement.
+    Returns plan steps as dicts with operation full_scan, index_scan, search or temp_btree,
+    the table involved (None for sorts) and the planner's own description.
+    """
+    dialect = db.engine.dialect.name
+    if dialect == "postgresql":
+        plan = db.session.execute(text(f"EXPLAIN (FORMAT JSON) {sql_query}"), params or {}).scalar()
+        steps = []
+        _walk_postgres_plan(plan[0]["Plan"], steps)
+        return steps
+
+    # SQLite reports aliased tables under their alias
+    aliases = _table_aliases(_mask_literals(sql_query), set(db.metadata.tables))
+    steps = []
+    rows = db.session.execute(text(f"EXPLAIN QUERY PLAN {sql_query}"), params or {}).fetchall()
+    for row in rows:
+        detail = row[-1]
+        temp_match = _SQLITE_TEMP_BTREE_RE.match(detail)
+        if temp_match:
+            steps.append({"operation": "temp_btree", "table": None, "detail": detail})
+            continue
+        scan_match = _SQLITE_SCAN_RE.match(detail)
+        if not scan_match or scan_match.group("table").lower() == "constant":
+            continue
+        if scan_match.group("operation").upper() == "SEARCH":
+            operation = "search"
+        elif scan_match.group("index") or scan_match.group("covering"):
+            operation = "index_scan"
+        else:
+            operation = "full_scan"
+        name = scan_match.group("table").lower()
+        steps.append({"operation": operation, "table": aliases.get(name, name), "detail": detail})
+    return steps
+
+def _walk_postgres_plan(node: dict, steps: list):
+    node_type = node.get("Node Type")
+    table = node.get("Relation Name")
+    if node_type in _PG_FULL_SCAN_NODES:
+        steps.append({"operation": "full_scan", "table": table, "detail": f"{node_type} on {table}"})
+    elif node_type in _PG_INDEX_SCAN_NODES and table:
+        operation = "search" if node.get("Index Cond") or node.get("Recheck Cond") else "index_scan"
+        steps.append({"operation": operation, "table": table, "detail": f"{node_type} on {table}"})
+    elif node_type in _PG_SORT_NODES:
+        steps.append({"operation": "temp_btree", "table": None, "detail": f"{node_type} by {node.get('Sort Key')}"})
+    for child in node.get("Plans", []):
+        _walk_postgres_plan(child, steps)
+
+def _resolve_sort_tables(steps: list) -> list:
+    # A sort belongs to the table being scanned when the statement reads a single table
+    tables = {step["table"] for step in steps if step["table"]}
+    if len(tables) != 1:
+        return steps
+    table = tables.pop()
+    return [dict(step, table=table) if step["operation"] == "temp_btree" else step for step in steps]
+
+def summarize_plans(statements) -> dict:
+    """
+    Count full scans, index scans and temp B-tree sorts over (plan steps, executions) pairs,
+    weighting each statement by how often it ran
+    """
+    totals = {"full_scans": 0, "index_scans": 0, "searches": 0, "temp_btrees": 0, "by_table": {}}
+    keys = {"full_scan": "full_scans", "index_scan": "index_scans", "search": "searches", "temp_btree": "temp_btrees"}
+    for steps, executions in statements:
+        for step in steps:
+            key = keys[step["operation"]]
+            totals[key] += executions
+            table_totals = totals["by_table"].setdefault(step["table"] or "(sort)", dict.fromkeys(keys.values(), 0))
+            table_totals[key] += executions
+    return totals
+
+class IndexAdvisor:
+    """
+    Records the statements execute_query runs together with their query plans, and proposes
+    indexes for tables that are repeatedly read with full scans or sorted through temp B-trees.
+
+    Plans are captured once per distinct statement (the first time it runs); later executions
+    only bump its counter, so the overhead is one EXPLAIN per new statement.
+    """
+
+    def __init__(self, max_statements=INDEX_ADVISOR_MAX_STATEMENTS, min_scans=INDEX_ADVISOR_MIN_SCANS,
+                 auto_create=INDEX_ADVISOR_AUTO_CREATE, enabled=INDEX_ADVISOR_ENABLED):
+        self.max_statements = max_statements
+        self.min_scans = min_scans
+        self.auto_create = auto_create
+        self.enabled = enabled
+        self._statements = OrderedDict()
+        self._lock = threading.Lock()
+        self.created_indexes = []
+        self.explain_failures = 0
+
+    def record(self, sql_query: str, params: dict = None):
+        """
+        Count one execution of a statement, capturing its query plan the first time it is seen.
+        Never raises: a failed EXPLAIN is logged and the statement is simply not tracked.
+        """
+        if not self.enabled:
+            return
+
+        key = canonicalize_sql(sql_query)
+        with self._lock:
+            entry = self._statements.get(key)
+            if entry is not None:
+                self._statements.move_to_end(key)
+                entry["executions"] += 1
+                entry["last_seen"] = datetime.utcnow()
+                reached_threshold = entry["executions"] == self.min_scans
+        if entry is not None:
+            if reached_threshold and self.auto_create and self._has_full_scan(entry["plan_before"]):
+                self._auto_create(entry)
+            return
+
+        try:
+            steps = _resolve_sort_tables(explain_query_plan(sql_query, params))
+        except Exception as e:
+            db.session.rollback()
+            with self._lock:
+                self.explain_failures += 1
+            logging.warning(f"Index advisor could not explain statement: {e}")
+            return
+
+        now = datetime.utcnow()
+        with self._lock:
+            self._statements[key] = {
+                "sql": sql_query,
+                "params": dict(params or {}),
+                "executions": 1,
+                "plan_before": steps,
+                "plan_current": steps,
+                "first_seen": now,
+                "last_seen": now
+            }
+            while len(self._statements) > self.max_statements:
+                self._statements.popitem(last=False)
+
+    def proposals(self) -> list:
+        """
+        Candidate indexes derived from recorded statements that full-scan or temp-sort a table,
+        most executed first. Candidates already covered by an existing index are marked exists=True.
+        """
+        existing = self._existing_indexes()
+        candidates = {}
+        for entry in self._snapshot():
+            for table in {step["table"] for step in entry["plan_current"]
+                          if step["table"] and step["operation"] in ("full_scan", "temp_btree")}:
+                if table not in db.metadata.tables:
+                    continue
+                columns = suggest_index_columns(entry["sql"], table, db.metadata.tables[table].columns)
+                if not columns:
+                    continue
+                candidate = candidates.setdefault((table, tuple(columns)), {
+                    "table": table,
+                    "columns": columns,
+                    "name": index_name(table, columns),
+                    "statements": 0,
+                    "executions": 0
+                })
+                candidate["statements"] += 1
+                candidate["executions"] += entry["executions"]
+
+        proposals = []
+        for (table, columns), candidate in candidates.items():
+            candidate["exists"] = any(list(index_columns[:len(columns)]) == list(columns)
+                                      for index_columns in existing.get(table, []))
+            candidate["recommended"] = not candidate["exists"] and candidate["executions"] >= self.min_scans
+            candidate["sql"] = f"CREATE INDEX IF NOT EXISTS {candidate['name']} ON {table} ({', '.join(columns)})"
+            proposals.append(candidate)
+        proposals.sort(key=lambda candidate: candidate["executions"], reverse=True)
+        return proposals
+
+    def create_indexes(self, names=None) -> list:
+        """
+        Create the recommended indexes (or only those named) and re-plan every recorded statement.
+        Returns the names of the indexes created.
+        """
+        created = []
+        tables = set()
+        for proposal in self.proposals():
+            wanted = proposal["name"] in names if names is not None else proposal["recommended"]
+            if not wanted or proposal["exists"]:
+                continue
+            try:
+                db.session.execute(text(proposal["sql"]))
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                logging.error(f"Failed to create index {proposal['name']}: {e}")
+                continue
+            logging.info(f"Index advisor created {proposal['name']} on {proposal['table']}{tuple(proposal['columns'])}")
+            created.append(proposal["name"])
+            tables.add(proposal["table"])
+
+        if created:
+            # Refresh planner statistics so the new indexes are considered
+            for table in tables:
+                db.session.execute(text(f"ANALYZE {table}"))
+            db.session.commit()
+            with self._lock:
+                self.created_indexes.extend(created)
+            self.replan()
+        return created
+
+    def replan(self):
+        """Re-run EXPLAIN for every recorded statement so plan_current reflects the current indexes"""
+        for key, entry in self._snapshot_items():
+            try:
+                steps = _resolve_sort_tables(explain_query_plan(entry["sql"], entry["params"]))
+            except Exception as e:
+                db.session.rollback()
+                logging.warning(f"Index advisor could not re-explain statement: {e}")
+                continue
+            with self._lock:
+                if key in self._statements:
+                    self._statements[key]["plan_current"] = steps
+
+    def report(self, replan: bool = False) -> dict:
+        """
+        Scan counts when each statement was first seen ("before") and under the current indexes
+        ("after"), the proposed indexes, and the statements responsible for the most full scans.
+        "after" uses the plans from the last replan (create_indexes replans); pass replan=True to
+        re-run EXPLAIN for every recorded statement first, e.g. after indexes changed elsewhere.
+        """
+        if replan and self.enabled:
+            self.replan()
+        entries = self._snapshot()
+
+        top_statements = sorted(
+            (entry for entry in entries if self._has_full_scan(entry["plan_current"])),
+            key=lambda entry: entry["executions"], reverse=True
+        )[:10]
+        with self._lock:
+            created_indexes = list(self.created_indexes)
+            explain_failures = self.explain_failures
+
+        return {
+            "enabled": self.enabled,
+            "dialect": db.engine.dialect.name,
+            "statements": len(entries),
+            "executions": sum(entry["executions"] for entry in entries),
+            "min_scans": self.min_scans,
+            "auto_create": self.auto_create,
+            "explain_failures": explain_failures,
+            "before": summarize_plans((entry["plan_before"], entry["executions"]) for entry in entries),
+            "after": summarize_plans((entry["plan_current"], entry["executions"]) for entry in entries),
+            "proposals": self.proposals(),
+            "created_indexes": created_indexes,
+            "top_full_scan_statements": [{
+                "sql": entry["sql"],
+                "executions": entry["executions"],
+                "plan": [step["detail"] for step in entry["plan_current"]],
+                "last_seen": entry["last_seen"].isoformat()
+            } for entry in top_statements]
+        }
+
+    def clear(self):
+        with self._lock:
+            self._statements.clear()
+
+    def _snapshot(self) -> list:
+        return [entry for _, entry in self._snapshot_items()]
+
+    def _snapshot_items(self) -> list:
+        with self._lock:
+            return [(key, dict(entry)) for key, entry in self._statements.items()]
+
+    def _has_full_scan(self, steps) -> bool:
+        return any(step["operation"] == "full_scan" for step in steps)
+
+    def _existing_indexes(self) -> dict:
+        inspector = inspect(db.engine)
+        existing = {}
+        for table in db.metadata.tables:
+            try:
+                indexes = [index["column_names"] for index in inspector.get_indexes(table)]
+                primary_key = inspector.get_pk_constraint(table).get("constrained_columns") or []
+            except Exception:
+                continue
+            existing[table] = indexes + ([primary_key] if primary_key else [])
+        return existing
+
+    def _auto_create(self, entry):
+        tables = {step["table"] for step in entry["plan_before"] if step["operation"] == "full_scan"}
+        names = [proposal["name"] for proposal in self.proposals()
+                 if proposal["recommended"] and proposal["table"] in tables]
+        if names:
+            self.create_indexes(names)
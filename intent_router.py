@@ -0,0 +1,301 @@
+import calendar
+import re
+from datetime import date, timedelta
+from pydantic import BaseModel
+from query_cache import normalize_question
+
+class IntentMatch(BaseModel):
+    """
+    SQL for a recognised question, shaped like gemini.SQLQuery plus bind parameters.
+    Ranked intents (rank_*) also carry their sort direction; their row limit is params["limit"].
+    """
+    intent: str
+    query: str
+    explanation: str
+    params: dict = {}
+    descending: bool = None
+
+# Additive metrics name the column to SUM(); ratio metrics carry an aggregate expression,
+# a per-record expression and the guard that avoids division by zero.
+METRICS = {
+    "total_sales": {"table": "product_sales", "label": "sales", "column": "total_sales"},
+    "total_units_ordered": {"table": "product_sales", "label": "units ordered", "column": "total_units_ordered"},
+    "ad_sales": {"table": "product_ad_metrics", "label": "ad sales", "column": "ad_sales"},
+    "ad_spend": {"table": "product_ad_metrics", "label": "ad spend", "column": "ad_spend"},
+    "impressions": {"table": "product_ad_metrics", "label": "impressions", "column": "impressions"},
+    "clicks": {"table": "product_ad_metrics", "label": "clicks", "column": "clicks"},
+    "units_sold": {"table": "product_ad_metrics", "label": "units sold through ads", "column": "units_sold"},
+    "roas": {
+        "table": "product_ad_metrics", "label": "RoAS",
+        "aggregate": "(SUM(ad_sales) / SUM(ad_spend)) * 100",
+        "per_record": "(ad_sales / ad_spend) * 100",
+        "guard": "ad_spend > 0"
+    },
+    "cpc": {
+        "table": "product_ad_metrics", "label": "CPC",
+        "aggregate": "SUM(ad_spend) / SUM(clicks)",
+        "per_record": "ad_spend / clicks",
+        "guard": "clicks > 0"
+    },
+    "ctr": {
+        "table": "product_ad_metrics", "label": "CTR",
+        "aggregate": "(SUM(clicks) * 100.0) / SUM(impressions)",
+        "per_record": "(clicks * 100.0) / impressions",
+        "guard": "impressions > 0"
+    },
+}
+
+# Checked in order; each match is removed from the text before the next pattern runs,
+# so "return on ad spend" is not also read as ad spend.
+_METRIC_PATTERNS = [
+    ("roas", r"\broas\b|return on (?:ad|advertising) spend"),
+    ("cpc", r"\bcpc\b|cost per click"),
+    ("ctr", r"\bctr\b|click ?through rate"),
+    ("units_sold", r"units sold (?:through|from|via) (?:ads|advertising)|ad units(?: sold)?"),
+    ("ad_sales", r"\bad (?:sales|revenue)\b|advertising (?:sales|revenue)|(?:sales|revenue) from (?:ads|advertising)"),
+    ("ad_spend", r"\bad spend\b|advertising spend|(?:spend|spent|spending) on (?:ads|advertising)|\bspend\b|\bspent\b|\bspending\b"),
+    ("total_units_ordered", r"\bunits(?: ordered| sold)?\b"),
+    ("impressions", r"\bimpressions\b"),
+    ("clicks", r"\bclicks\b"),
+    ("total_sales", r"\b(?:total )?(?:sales|revenue)\b"),
+]
+
+_NUMBER_WORDS = {
+    "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8,
+    "nine": 9, "ten": 10, "eleven": 11, "twelve": 12, "fifteen": 15, "twenty": 20
+}
+_NUMBER = r"(\d+|" + "|".join(_NUMBER_WORDS) + r")"
+_ISO_DATE = r"(\d{4}-\d{2}-\d{2})"
+_MONTHS = {name.lower(): index for index, name in enumerate(calendar.month_name) if name}
+
+_RANK_DESC_RE = re.compile(r"\b(?:top|best|highest|most|largest|biggest|maximum|max)\b")
+_RANK_ASC_RE = re.compile(r"\b(?:bottom|worst|lowest|least|smallest|minimum|min)\b")
+_ENTITY_RE = re.compile(r"\b(?:products?|items?|skus?)\b")
+_LIMIT_RE = re.compile(r"\b(?:top|bottom|best|worst|first|last)\s+" + _NUMBER + r"\b|\b" + _NUMBER + r"\s+(?:\w+\s+)?(?:products|items|skus)\b")
+_SINGLE_ENTITY_RE = re.compile(r"\b(?:which|what)\s+(?:product|item|sku)\b")
+_ITEM_RE = re.compile(r"\b(?:item_id|item id|product id|item|product|sku)\s+(\d+)\b")
+
+# Anything left in the question after metric phrases are removed that asks for a shape
+# the router does not produce (grouping, trends, comparisons, counts, exclusions, periods
+# it could not parse...) sends it to the LLM.
+_BLOCKER_RE = re.compile(
+    r"\b(?:daily|weekly|monthly|per|each|every|by (?:day|date|week|month)|trend\w*|over time|compare\w*|comparison|"
+    r"versus|vs|average|avg|mean|median|distribution|correlat\w*|eligib\w*|why|share|growth|change\w*|"
+    r"breakdown|list all|all (?:products|items)|group\w*|join|ratio|percent of|and|"
+    r"how many|number of|count\w*|no|zero|none|without|exclud\w*|except|not|non|organic|only|"
+    r"(?:19|20)\d{2}|days?|dates?|weeks?|months?|quarters?|years?)\b"
+)
+# Words a supported question may contain besides its metric, period, ranking and item;
+# any other word left over means the router would be ignoring part of the question
+_FILLER_WORDS = {
+    "what", "whats", "s", "is", "are", "was", "were", "my", "our", "the", "a", "an", "of", "for", "me",
+    "show", "tell", "give", "get", "calculate", "compute", "find", "how", "much", "did", "do", "does",
+    "we", "i", "have", "has", "had", "in", "on", "to", "overall", "total", "sum", "amount", "value",
+    "current", "please", "can", "you", "which", "by", "with", "generated", "earned", "made", "ever",
+    "so", "far", "all", "time", "alltime", "performing",
+}
+# "and" is fine inside an explicit date range
+_DATE_RANGE_RE = re.compile(r"\b(?:between|from)\s+" + _ISO_DATE + r"\s+(?:and|to|until|through)\s+" + _ISO_DATE + r"\b")
+
+DEFAULT_TOP_N = 10
+MAX_TOP_N = 100
+
+def _parse_number(token: str) -> int:
+    return int(token) if token.isdigit() else _NUMBER_WORDS[token]
+
+def _parse_iso_date(token: str) -> date:
+    return date.fromisoformat(token)
+
+def _month_range(year: int, month: int):
+    return date(year, month, 1), date(year, month, calendar.monthrange(year, month)[1])
+
+def extract_date_range(text: str, today: date = None):
+    """
+    Find a date range in a normalized question.
+    Returns (start_date, end_date, matched_text, label) where either bound may be None,
+    or None when the question has no date filter.
+    """
+    today = today or date.today()
+
+    match = _DATE_RANGE_RE.search(text)
+    if match:
+        start, end = _parse_iso_date(match.group(1)), _parse_iso_date(match.group(2))
+        return start, end, match.group(0), f"from {start.isoformat()} to {end.isoformat()}"
+
+    match = re.search(r"\b(?:since|after|from)\s+" + _ISO_DATE + r"\b", text)
+    if match:
+        start = _parse_iso_date(match.group(1))
+        if match.group(0).startswith("after"):
+            start += timedelta(days=1)
+        return start, None, match.group(0), f"since {start.isoformat()}"
+
+    match = re.search(r"\b(?:before|until|through)\s+" + _ISO_DATE + r"\b", text)
+    if match:
+        end = _parse_iso_date(match.group(1))
+        if match.group(0).startswith("before"):
+            end -= timedelta(days=1)
+        return None, end, match.group(0), f"up to {end.isoformat()}"
+
+    match = re.search(r"\bon\s+" + _ISO_DATE + r"\b", text)
+    if match:
+        day = _parse_iso_date(match.group(1))
+        return day, day, match.group(0), f"on {day.isoformat()}"
+
+    match = re.search(r"\b(?:in|during)\s+(" + "|".join(_MONTHS) + r")(?:\s+(\d{4}))?\b", text)
+    if match:
+        month = _MONTHS[match.group(1)]
+        if match.group(2):
+            year = int(match.group(2))
+        else:
+            year = today.year if month <= today.month else today.year - 1
+        start, end = _month_range(year, month)
+        return start, end, match.group(0), f"in {calendar.month_name[month]} {year}"
+
+    match = re.search(r"\b(?:last|past|previous)\s+" + _NUMBER + r"\s+days\b", text)
+    if match:
+        days = _parse_number(match.group(1))
+        if days < 1:
+            raise ValueError("Day count must be positive")
+        start = today - timedelta(days=days - 1)
+        return start, today, match.group(0), f"in the last {days} days"
+
+    match = re.search(r"\b(?:this|current) (month|week|year)\b|\b(?:last|previous|past) (month|week|year)\b|\b(today|yesterday)\b", text)
+    if match:
+        if match.group(3) == "today":
+            return today, today, match.group(0), "today"
+        if match.group(3) == "yesterday":
+            day = today - timedelta(days=1)
+            return day, day, match.group(0), "yesterday"
+
+        period = match.group(1) or match.group(2)
+        current = match.group(1) is not None
+        if period == "month":
+            if current:
+                return _month_range(today.year, today.month)[0], today, match.group(0), "this month"
+            previous = today.replace(day=1) - timedelta(days=1)
+            start, end = _month_range(previous.year, previous.month)
+            return start, end, match.group(0), "last month"
+        if period == "week":
+            week_start = today - timedelta(days=today.weekday())
+            if current:
+                return week_start, today, match.group(0), "this week"
+            return week_start - timedelta(days=7), week_start - timedelta(days=1), match.group(0), "last week"
+        if current:
+            return date(today.year, 1, 1), today, match.group(0), "this year"
+        return date(today.year - 1, 1, 1), date(today.year - 1, 12, 31), match.group(0), "last year"
+
+    return None
+
+def _detect_metrics(text: str):
+    found = []
+    for metric, pattern in _METRIC_PATTERNS:
+        if re.search(pattern, text):
+            found.append(metric)
+            text = re.sub(pattern, " ", text)
+    return found, text
+
+def _only_filler(residual: str) -> bool:
+    """True when nothing but filler remains once the ranking and item phrases are removed"""
+    for pattern in (_LIMIT_RE, _ITEM_RE, _RANK_DESC_RE, _RANK_ASC_RE, _ENTITY_RE):
+        residual = pattern.sub(" ", residual)
+    return all(word in _FILLER_WORDS for word in residual.split())
+
+def _build_where(conditions: list) -> str:
+    return f" WHERE {' AND '.join(conditions)}" if conditions else ""
+
+def route_question(question: str, today: date = None):
+    """
+    Match a question against the canonical metric intents.
+    Returns an IntentMatch with hand-written parameterised SQL, or None so the caller falls back to Gemini.
+    """
+    text = normalize_question(question)
+
+    try:
+        date_range = extract_date_range(text, today)
+    except (ValueError, KeyError):
+        return None
+
+    params = {}
+    conditions = []
+    period_label = ""
+    residual = text
+    if date_range:
+        start, end, matched_text, period_label = date_range
+        if start and end and start > end:
+            return None
+        if start:
+            conditions.append("date >= :start_date")
+            params["start_date"] = start.isoformat()
+        if end:
+            conditions.append("date <= :end_date")
+            params["end_date"] = end.isoformat()
+        residual = residual.replace(matched_text, " ")
+
+    metrics, residual = _detect_metrics(residual)
+
+    descending = bool(_RANK_DESC_RE.search(residual))
+    ascending = bool(_RANK_ASC_RE.search(residual))
+    ranked = (descending or ascending) and (_ENTITY_RE.search(residual) or "which" in residual.split())
+    if ranked and not metrics and "performing" in residual:
+        metrics = ["total_sales"]
+
+    if len(metrics) != 1 or _BLOCKER_RE.search(residual) or (descending and ascending):
+        return None
+    # "highest sales" or "top sales day" rank something other than products
+    if (descending or ascending) and not ranked:
+        return None
+    if not _only_filler(residual):
+        return None
+
+    metric = metrics[0]
+    spec = METRICS[metric]
+    table = spec["table"]
+    is_ratio = "aggregate" in spec
+    if is_ratio:
+        conditions.insert(0, spec["guard"])
+
+    item_match = _ITEM_RE.search(residual)
+
+    if ranked:
+        if item_match:
+            return None
+
+        if _SINGLE_ENTITY_RE.search(residual):
+            limit = 1
+        else:
+            limit_match = _LIMIT_RE.search(residual)
+            limit = _parse_number(limit_match.group(1) or limit_match.group(2)) if limit_match else DEFAULT_TOP_N
+        if not 1 <= limit <= MAX_TOP_N:
+            return None
+        params["limit"] = limit
+
+        # Ties are broken by item and day, so the rows kept at the limit do not depend on storage order
+        direction = "DESC" if descending else "ASC"
+        order_word = "highest" if descending else "lowest"
+        if is_ratio:
+            # Ratios are ranked per daily record, matching the sample queries in the schema
+            query = (f"SELECT item_id, date, {spec['per_record']} AS {metric} FROM {table}"
+                     f"{_build_where(conditions)} ORDER BY {metric} {direction}, item_id, date LIMIT :limit")
+            explanation = f"Daily records with the {order_word} {spec['label']}"
+        else:
+            query = (f"SELECT item_id, SUM({spec['column']}) AS {metric} FROM {table}"
+                     f"{_build_where(conditions)} GROUP BY item_id ORDER BY {metric} {direction}, item_id LIMIT :limit")
+            explanation = f"Products ranked by {order_word} {spec['label']}"
+        if period_label:
+            explanation += f" {period_label}"
+        return IntentMatch(intent=f"rank_{metric}", query=query, explanation=explanation, params=params,
+                           descending=descending)
+
+    if item_match:
+        conditions.append("item_id = :item_id")
+        params["item_id"] = int(item_match.group(1))
+
+    expression = spec["aggregate"] if is_ratio else f"SUM({spec['column']})"
+    query = f"SELECT {expression} AS {metric} FROM {table}{_build_where(conditions)}"
+    explanation = f"{'Overall' if is_ratio else 'Total'} {spec['label']}"
+    if item_match:
+        explanation += f" for item {params['item_id']}"
+    if period_label:
+        explanation += f" {period_label}"
+    return IntentMatch(intent=metric, query=query,
+                       explanation=explanation, params=params)
@@ -0,0 +1,266 @@
+import bisect
+import functools
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "true").lower() == "true"
+# Recent observations per series used for the p50/p95/p99 quantiles
+METRICS_QUANTILE_WINDOW = int(os.environ.get("METRICS_QUANTILE_WINDOW", "1024"))
+
+METRIC_PREFIX = "ecommerce_"
+# Latency buckets in seconds, from cache hits up to slow model calls and data loads
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+QUANTILES = (0.5, 0.95, 0.99)
+
+def _label_text(names, values, extra=None):
+    pairs = list(zip(names, values)) + list(extra or [])
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """Monotonic counter with optional labels, exported in Prometheus text format"""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = METRIC_PREFIX + name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        lines += [f"{self.name}{_label_text(self.labelnames, key)} {_format_value(value)}" for key, value in values]
+        return lines
+
+class Histogram:
+    """
+    Latency histogram with optional labels. Exported as a Prometheus histogram (cumulative
+    buckets, _sum and _count), plus a <name>_quantile summary with p50/p95/p99 computed over
+    the most recent observations of each series in this worker.
+    """
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS,
+                 window=METRICS_QUANTILE_WINDOW):
+        self.name = METRIC_PREFIX + name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.window = window
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {
+                    "counts": [0] * len(self.buckets), "sum": 0.0, "count": 0,
+                    "recent": deque(maxlen=self.window)
+                }
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series["counts"][index] += 1
+            series["sum"] += value
+            series["count"] += 1
+            series["recent"].append(value)
+
+    def quantiles(self, **labels) -> dict:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            recent = sorted(self._series[key]["recent"]) if key in self._series else []
+        return _quantiles(recent)
+
+    def snapshot(self) -> dict:
+        """Count, sum and recent quantiles per series, keyed by the tuple of label values"""
+        with self._lock:
+            series = [(key, s["count"], s["sum"], sorted(s["recent"])) for key, s in self._series.items()]
+        return {key: {"count": count, "sum": total, "quantiles": _quantiles(recent)}
+                for key, count, total, recent in series}
+
+    def expose(self):
+        with self._lock:
+            snapshot = [(key, list(s["counts"]), s["sum"], s["count"], sorted(s["recent"]))
+                        for key, s in sorted(self._series.items())]
+
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for key, counts, total, count, _ in snapshot:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_label_text(self.labelnames, key, [('le', _format_value(float(bound)))])} {cumulative}")
+            lines.append(f"{self.name}_bucket{_label_text(self.labelnames, key, [('le', '+Inf')])} {count}")
+            lines.append(f"{self.name}_sum{_label_text(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_label_text(self.labelnames, key)} {count}")
+
+        quantile_name = f"{self.name}_quantile"
+        lines += [f"# HELP {quantile_name} {self.documentation} (recent p50/p95/p99 in this worker)",
+                  f"# TYPE {quantile_name} summary"]
+        for key, _, total, count, recent in snapshot:
+            for quantile, value in _quantiles(recent).items():
+                lines.append(f"{quantile_name}{_label_text(self.labelnames, key, [('quantile', quantile)])} {_format_value(value)}")
+            lines.append(f"{quantile_name}_sum{_label_text(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{quantile_name}_count{_label_text(self.labelnames, key)} {count}")
+        return lines
+
+def _quantiles(sorted_values) -> dict:
+    if not sorted_values:
+        return {}
+    last = len(sorted_values) - 1
+    return {str(q): sorted_values[min(last, int(round(q * last)))] for q in QUANTILES}
+
+# Stage timings: pipeline stages, loaders and model calls
+STAGE_SECONDS = Histogram("stage_duration_seconds", "Time spent in each pipeline stage", ["stage"])
+# Whole HTTP requests per route
+REQUEST_SECONDS = Histogram("http_request_duration_seconds", "HTTP request latency per route", ["endpoint", "method"])
+REQUESTS = Counter("http_requests_total", "HTTP requests per route and status", ["endpoint", "method", "status"])
+LLM_CALLS = Counter("llm_calls_total", "Gemini calls per purpose", ["purpose"])
+LLM_TOKENS = Counter("llm_tokens_total", "Gemini tokens per purpose and kind (prompt, cached, output)", ["purpose", "kind"])
+ROWS_RETURNED = Counter("rows_returned_total", "Result rows returned to clients per source", ["source"])
+ERRORS = Counter("errors_total", "Errors per pipeline stage", ["stage"])
+
+class StartupTimer:
+    """
+    Wall-clock seconds of each startup phase in this worker, in the order they ran. Exported
+    as a gauge and logged once by report(), so slow boots show which phase to look at.
+    """
+
+    def __init__(self, name="startup_phase_seconds", documentation="Seconds spent in each startup phase of this worker"):
+        self.name = METRIC_PREFIX + name
+        self.documentation = documentation
+        self._phases = {}
+        self._lock = threading.Lock()
+
+    def record(self, phase: str, seconds: float):
+        with self._lock:
+            self._phases[phase] = seconds
+
+    @contextmanager
+    def phase(self, phase: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(phase, time.perf_counter() - start)
+
+    def phases(self) -> dict:
+        with self._lock:
+            return dict(self._phases)
+
+    def report(self) -> str:
+        phases = self.phases()
+        return ", ".join(f"{phase} {seconds:.2f}s" for phase, seconds in phases.items()) + \
+            f" (total {sum(phases.values()):.2f}s)"
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        lines += [f"{self.name}{_label_text(['phase'], [phase])} {_format_value(float(seconds))}"
+                  for phase, seconds in self.phases().items()]
+        return lines
+
+STARTUP = StartupTimer()
+
+REGISTRY = [STAGE_SECONDS, REQUEST_SECONDS, REQUESTS, LLM_CALLS, LLM_TOKENS, ROWS_RETURNED, ERRORS, STARTUP]
+
+# flask is imported inside the functions that need it, so the loader CLIs and their parser
+# processes can use the timers without paying for it
+def _record_timing(stage, seconds):
+    from flask import g, has_app_context
+
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    # Per-request breakdown for the optional timings block in /api/ask
+    if has_app_context():
+        timings = g.setdefault("stage_timings", {})
+        timings[stage] = round(timings.get(stage, 0) + seconds * 1000, 2)
+
+@contextmanager
+def span(stage: str):
+    """Time a block as the given stage; failures are counted in errors_total and re-raised"""
+    if not METRICS_ENABLED:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    except GeneratorExit:
+        raise
+    except Exception:
+        ERRORS.inc(stage=stage)
+        raise
+    finally:
+        _record_timing(stage, time.perf_counter() - start)
+
+def timed(stage: str):
+    """Decorator form of span"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def request_timings() -> dict:
+    """Stage timings (ms) recorded so far in the current request"""
+    from flask import g, has_app_context
+
+    return dict(g.get("stage_timings", {})) if has_app_context() else {}
+
+def init_app(app):
+    """Time every request and count it by route and status"""
+    from flask import g, request
+
+    if not METRICS_ENABLED:
+        return
+
+    @app.before_request
+    def _start_request_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def _observe_request(response):
+        started = g.get("request_started")
+        if started is not None:
+            endpoint = request.endpoint or "unmatched"
+            REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint, method=request.method)
+            REQUESTS.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+        return response
+
+def render_metrics(collectors=()) -> str:
+    """
+    All registered metrics in Prometheus text format. collectors are callables returning extra
+    exposition lines (e.g. counters kept by the caches themselves).
+    """
+    lines = []
+    for metric in REGISTRY:
+        lines += metric.expose()
+    for collector in collectors:
+        lines += collector()
+    return "\n".join(lines) + "\n"
+
+def counter_lines(name, documentation, labelnames, samples) -> list:
+    """
+    Exposition lines for counters kept elsewhere (e.g. cache stats).
+    samples maps a tuple of label values, in labelnames order, to the current value.
+    """
+    full_name = METRIC_PREFIX + name
+    lines = [f"# HELP {full_name} {documentation}", f"# TYPE {full_name} counter"]
+    lines += [f"{full_name}{_label_text(labelnames, key)} {_format_value(value)}" for key, value in samples.items()]
+    return lines
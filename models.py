@@ -4,6 +4,10 @@ from sqlalchemy import func
 
 class ProductEligibility(db.Model):
     __tablename__ = 'product_eligibility'
+    __table_args__ = (
+        # Natural key used by incremental ingestion to upsert rows
+        db.Index('uq_product_eligibility_datetime_item', 'eligibility_datetime', 'item_id', unique=True),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     item_id = db.Column(db.Integer, nullable=False, index=True)
@@ -23,6 +27,9 @@ class ProductEligibility(db.Model):
 
 class ProductSales(db.Model):
     __tablename__ = 'product_sales'
+    __table_args__ = (
+        db.Index('uq_product_sales_date_item', 'date', 'item_id', unique=True),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     date = db.Column(db.Date, nullable=False)
@@ -42,6 +49,9 @@ class ProductSales(db.Model):
 
 class ProductAdMetrics(db.Model):
     __tablename__ = 'product_ad_metrics'
+    __table_args__ = (
+        db.Index('uq_product_ad_metrics_date_item', 'date', 'item_id', unique=True),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     date = db.Column(db.Date, nullable=False)
@@ -83,3 +93,227 @@ class ProductAdMetrics(db.Model):
             'ctr': self.ctr,
             'roas': self.roas
         }
+
+class CachedSQLQuery(db.Model):
+    __tablename__ = 'cached_sql_queries'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    cache_key = db.Column(db.String(64), nullable=False, unique=True, index=True)
+    normalized_question = db.Column(db.Text, nullable=False)
+    schema_hash = db.Column(db.String(64), nullable=False)
+    sql_query = db.Column(db.Text, nullable=False)
+    explanation = db.Column(db.Text, nullable=True)
+    hit_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_used_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'normalized_question': self.normalized_question,
+            'schema_hash': self.schema_hash,
+            'sql_query': self.sql_query,
+            'explanation': self.explanation,
+            'hit_count': self.hit_count,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'last_used_at': self.last_used_at.isoformat() if self.last_used_at else None
+        }
+
+class DataVersion(db.Model):
+    __tablename__ = 'data_version'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'version': self.version,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+class DataReadiness(db.Model):
+    """Marker set once the datasets are loaded, so workers can skip the startup load with one lookup"""
+    __tablename__ = 'data_readiness'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    ready = db.Column(db.Boolean, nullable=False, default=False)
+    source = db.Column(db.String(50), nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'ready': self.ready,
+            'source': self.source,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+class IngestionState(db.Model):
+    __tablename__ = 'ingestion_state'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    dataset = db.Column(db.String(50), nullable=False, unique=True)
+    file_path = db.Column(db.Text, nullable=False)
+    content_hash = db.Column(db.String(64), nullable=False)
+    watermark = db.Column(db.DateTime, nullable=True)
+    rows_loaded = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'dataset': self.dataset,
+            'file_path': self.file_path,
+            'content_hash': self.content_hash,
+            'watermark': self.watermark.isoformat() if self.watermark else None,
+            'rows_loaded': self.rows_loaded,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+class FullLoadState(db.Model):
+    """
+    Source file content a dataset's table holds exactly, recorded by a full reload. Any other load
+    removes the row, since the table then also holds rows the file does not (or lacks some it has).
+    """
+    __tablename__ = 'full_load_state'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    dataset = db.Column(db.String(50), nullable=False, unique=True)
+    content_hash = db.Column(db.String(64), nullable=False)
+    loaded_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'dataset': self.dataset,
+            'content_hash': self.content_hash,
+            'loaded_at': self.loaded_at.isoformat() if self.loaded_at else None
+        }
+
+class ItemDailyFact(db.Model):
+    """Sales and ad metrics joined per item per day, rebuilt from the base tables during ingestion"""
+    __tablename__ = 'item_daily_fact'
+    __table_args__ = (
+        db.Index('uq_item_daily_fact_date_item', 'date', 'item_id', unique=True),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    date = db.Column(db.Date, nullable=False)
+    item_id = db.Column(db.Integer, nullable=False, index=True)
+    total_sales = db.Column(db.Float, nullable=False, default=0.0)
+    total_units_ordered = db.Column(db.Integer, nullable=False, default=0)
+    ad_sales = db.Column(db.Float, nullable=False, default=0.0)
+    ad_spend = db.Column(db.Float, nullable=False, default=0.0)
+    impressions = db.Column(db.Integer, nullable=False, default=0)
+    clicks = db.Column(db.Integer, nullable=False, default=0)
+    units_sold = db.Column(db.Integer, nullable=False, default=0)
+    sales_rows = db.Column(db.Integer, nullable=False, default=0)
+    ad_rows = db.Column(db.Integer, nullable=False, default=0)
+
+class ItemRollup(db.Model):
+    """All-time totals per item"""
+    __tablename__ = 'item_rollup'
+    
+    item_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    total_sales = db.Column(db.Float, nullable=False, default=0.0)
+    total_units_ordered = db.Column(db.Integer, nullable=False, default=0)
+    ad_sales = db.Column(db.Float, nullable=False, default=0.0)
+    ad_spend = db.Column(db.Float, nullable=False, default=0.0)
+    impressions = db.Column(db.Integer, nullable=False, default=0)
+    clicks = db.Column(db.Integer, nullable=False, default=0)
+    units_sold = db.Column(db.Integer, nullable=False, default=0)
+    sales_rows = db.Column(db.Integer, nullable=False, default=0)
+    ad_rows = db.Column(db.Integer, nullable=False, default=0)
+
+class DailyRollup(db.Model):
+    """Totals across all items per day"""
+    __tablename__ = 'daily_rollup'
+    
+    date = db.Column(db.Date, primary_key=True)
+    total_sales = db.Column(db.Float, nullable=False, default=0.0)
+    total_units_ordered = db.Column(db.Integer, nullable=False, default=0)
+    ad_sales = db.Column(db.Float, nullable=False, default=0.0)
+    ad_spend = db.Column(db.Float, nullable=False, default=0.0)
+    impressions = db.Column(db.Integer, nullable=False, default=0)
+    clicks = db.Column(db.Integer, nullable=False, default=0)
+    units_sold = db.Column(db.Integer, nullable=False, default=0)
+    sales_rows = db.Column(db.Integer, nullable=False, default=0)
+    ad_rows = db.Column(db.Integer, nullable=False, default=0)
+
+class RollupState(db.Model):
+    """Data version the rollup tables were last rebuilt at"""
+    __tablename__ = 'rollup_state'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    data_version = db.Column(db.Integer, nullable=False, default=0)
+    refreshed_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class DataSummary(db.Model):
+    """Row counts, date ranges and eligibility split of the datasets, rebuilt during ingestion"""
+    __tablename__ = 'data_summary'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    data_version = db.Column(db.Integer, nullable=False, default=0)
+    sales_rows = db.Column(db.Integer, nullable=False, default=0)
+    sales_items = db.Column(db.Integer, nullable=False, default=0)
+    sales_start = db.Column(db.Date, nullable=True)
+    sales_end = db.Column(db.Date, nullable=True)
+    ad_rows = db.Column(db.Integer, nullable=False, default=0)
+    ad_items = db.Column(db.Integer, nullable=False, default=0)
+    ad_start = db.Column(db.Date, nullable=True)
+    ad_end = db.Column(db.Date, nullable=True)
+    eligibility_rows = db.Column(db.Integer, nullable=False, default=0)
+    eligibility_items = db.Column(db.Integer, nullable=False, default=0)
+    eligibility_start = db.Column(db.DateTime, nullable=True)
+    eligibility_end = db.Column(db.DateTime, nullable=True)
+    eligible_items = db.Column(db.Integer, nullable=False, default=0)
+    ineligible_items = db.Column(db.Integer, nullable=False, default=0)
+    refreshed_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def to_dict(self):
+        def iso(value):
+            return value.isoformat() if value else None
+        
+        return {
+            'total_products': self.eligibility_rows,
+            'total_sales_records': self.sales_rows,
+            'total_ad_records': self.ad_rows,
+            'date_range': {
+                'sales_start': iso(self.sales_start),
+                'sales_end': iso(self.sales_end)
+            },
+            'tables': {
+                'product_sales': {'rows': self.sales_rows, 'items': self.sales_items,
+                                  'start': iso(self.sales_start), 'end': iso(self.sales_end)},
+                'product_ad_metrics': {'rows': self.ad_rows, 'items': self.ad_items,
+                                       'start': iso(self.ad_start), 'end': iso(self.ad_end)},
+                'product_eligibility': {'rows': self.eligibility_rows, 'items': self.eligibility_items,
+                                        'start': iso(self.eligibility_start), 'end': iso(self.eligibility_end)}
+            },
+            # Items by their most recent eligibility snapshot
+            'eligibility': {
+                'eligible_items': self.eligible_items,
+                'ineligible_items': self.ineligible_items
+            },
+            'data_version': self.data_version,
+            'refreshed_at': iso(self.refreshed_at)
+        }
+
+class PrecomputedAnswer(db.Model):
+    """Quick-answer and pinned-question responses computed in the background and served as stored"""
+    __tablename__ = 'precomputed_answers'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(100), nullable=False, unique=True, index=True)
+    question = db.Column(db.Text, nullable=False)
+    response = db.Column(db.Text, nullable=False)
+    success = db.Column(db.Boolean, nullable=False, default=True)
+    data_version = db.Column(db.Integer, nullable=False, default=0)
+    computed_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'key': self.key,
+            'question': self.question,
+            'success': self.success,
+            'data_version': self.data_version,
+            'computed_at': self.computed_at.isoformat() if self.computed_at else None
+        }
@@ -0,0 +1,219 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from gemini import SQLQuery
+# db and the models are imported where they are used, so modules that only need
+# normalize_question (the intent router, the quick answers) can be imported before the app
+
+SQL_CACHE_ENABLED = os.environ.get("SQL_CACHE_ENABLED", "true").lower() == "true"
+SQL_CACHE_MAX_ENTRIES = int(os.environ.get("SQL_CACHE_MAX_ENTRIES", "256"))
+SQL_CACHE_PERSISTENT_MAX_ENTRIES = int(os.environ.get("SQL_CACHE_PERSISTENT_MAX_ENTRIES", "5000"))
+SQL_CACHE_TTL_SECONDS = int(os.environ.get("SQL_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+
+# Punctuation is dropped unless it sits between two digits (keeps "1.5" and "2025-06-01" intact)
+_PUNCTUATION_RE = re.compile(r"(?<!\d)[^\w\s]|[^\w\s](?!\d)")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+def normalize_question(question: str) -> str:
+    """
+    Normalize a question so that trivial variations share a cache entry
+    """
+    normalized = unicodedata.normalize("NFKC", question).lower()
+    normalized = _PUNCTUATION_RE.sub(" ", normalized)
+    return _WHITESPACE_RE.sub(" ", normalized).strip()
+
+def schema_fingerprint(schema_info: str) -> str:
+    """Hash of the schema text, so cached SQL is dropped when the schema changes"""
+    return hashlib.sha256(schema_info.encode("utf-8")).hexdigest()
+
+class QuestionSQLCache:
+    """
+    Two-tier cache mapping normalized questions to generated SQL.
+
+    The first tier is an in-process LRU, the second is the cached_sql_queries
+    table so entries survive restarts and are shared between workers.
+    """
+
+    def __init__(self, max_entries=SQL_CACHE_MAX_ENTRIES,
+                 persistent_max_entries=SQL_CACHE_PERSISTENT_MAX_ENTRIES,
+                 ttl_seconds=SQL_CACHE_TTL_SECONDS, enabled=SQL_CACHE_ENABLED):
+        self.max_entries = max_entries
+        self.persistent_max_entries = persistent_max_entries
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def make_key(self, question: str, schema_hash: str) -> str:
+        return hashlib.sha256(f"{schema_hash}:{normalize_question(question)}".encode("utf-8")).hexdigest()
+
+    def get(self, question: str, schema_hash: str):
+        """
+        Return the cached SQLQuery for a question, or None on a miss
+        """
+        if not self.enabled:
+            return None
+
+        key = self.make_key(question, schema_hash)
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                sql_response, stored_at = entry
+                if now - stored_at <= self.ttl_seconds:
+                    self._entries.move_to_end(key)
+                    self.memory_hits += 1
+                    return sql_response
+                del self._entries[key]
+
+        sql_response = self._get_persistent(key)
+        with self._lock:
+            if sql_response is None:
+                self.misses += 1
+                return None
+            self.persistent_hits += 1
+        self._store_memory(key, sql_response, now)
+        return sql_response
+
+    def put(self, question: str, schema_hash: str, sql_response: SQLQuery):
+        """
+        Store generated SQL for a question in both tiers
+        """
+        if not self.enabled:
+            return
+
+        key = self.make_key(question, schema_hash)
+        self._store_memory(key, sql_response, time.time())
+        self._put_persistent(key, normalize_question(question), schema_hash, sql_response)
+
+    def invalidate(self, question: str, schema_hash: str):
+        """
+        Drop a cached entry, e.g. when its SQL failed to execute
+        """
+        from app import db
+        from models import CachedSQLQuery
+
+        key = self.make_key(question, schema_hash)
+        with self._lock:
+            self._entries.pop(key, None)
+        try:
+            CachedSQLQuery.query.filter_by(cache_key=key).delete()
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Failed to invalidate cached SQL: {e}")
+
+    def clear(self):
+        from app import db
+        from models import CachedSQLQuery
+
+        with self._lock:
+            self._entries.clear()
+        try:
+            CachedSQLQuery.query.delete()
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Failed to clear SQL cache: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self.memory_hits + self.persistent_hits
+            lookups = hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "memory_entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": hits,
+                "memory_hits": self.memory_hits,
+                "persistent_hits": self.persistent_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0
+            }
+
+    def _store_memory(self, key, sql_response, stored_at):
+        with self._lock:
+            self._entries[key] = (sql_response, stored_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def _get_persistent(self, key):
+        from app import db
+        from models import CachedSQLQuery
+
+        try:
+            entry = CachedSQLQuery.query.filter_by(cache_key=key).first()
+            if entry is None:
+                return None
+
+            now = datetime.utcnow()
+            if entry.created_at and now - entry.created_at > timedelta(seconds=self.ttl_seconds):
+                db.session.delete(entry)
+                db.session.commit()
+                return None
+
+            entry.hit_count = (entry.hit_count or 0) + 1
+            entry.last_used_at = now
+            db.session.commit()
+            return SQLQuery(query=entry.sql_query, explanation=entry.explanation or "")
+
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"SQL cache lookup failed: {e}")
+            return None
+
+    def _put_persistent(self, key, normalized_question, schema_hash, sql_response):
+        from app import db
+        from models import CachedSQLQuery
+
+        try:
+            entry = CachedSQLQuery.query.filter_by(cache_key=key).first()
+            now = datetime.utcnow()
+            if entry is None:
+                entry = CachedSQLQuery(cache_key=key, normalized_question=normalized_question,
+                                       schema_hash=schema_hash, created_at=now)
+                db.session.add(entry)
+            entry.sql_query = sql_response.query
+            entry.explanation = sql_response.explanation
+            entry.last_used_at = now
+            db.session.commit()
+            self._evict_persistent()
+
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Failed to store cached SQL: {e}")
+
+    def _evict_persistent(self):
+        from app import db
+        from models import CachedSQLQuery
+
+        cutoff = datetime.utcnow() - timedelta(seconds=self.ttl_seconds)
+        expired = CachedSQLQuery.query.filter(CachedSQLQuery.created_at < cutoff).delete()
+
+        overflow = CachedSQLQuery.query.count() - self.persistent_max_entries
+        if overflow > 0:
+            stale_ids = [row.id for row in CachedSQLQuery.query
+                         .order_by(CachedSQLQuery.last_used_at.asc())
+                         .limit(overflow).all()]
+            CachedSQLQuery.query.filter(CachedSQLQuery.id.in_(stale_ids)).delete(synchronize_session=False)
+
+        if expired or overflow > 0:
+            with self._lock:
+                self.evictions += expired + max(overflow, 0)
+        db.session.commit()
@@ -0,0 +1,363 @@
+import logging
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from sqlalchemy import create_engine, event, text
+from app import db
+from data_summary import DATA_SUMMARY_ID, _as_date
+from data_version import get_data_version
+from result_cache import canonicalize_sql
+
+QUERY_GOVERNOR_ENABLED = os.environ.get("QUERY_GOVERNOR_ENABLED", "true").lower() == "true"
+# Wall-clock limit for one agent statement, including fetching its rows
+QUERY_TIMEOUT_SECONDS = float(os.environ.get("QUERY_TIMEOUT_SECONDS", "10"))
+# Limit for streaming a full result export, which is paced by the client
+QUERY_EXPORT_TIMEOUT_SECONDS = float(os.environ.get("QUERY_EXPORT_TIMEOUT_SECONDS", "300"))
+# Statements whose plan is estimated to touch more rows than this are refused (SQLite)
+QUERY_MAX_ESTIMATED_ROWS = float(os.environ.get("QUERY_MAX_ESTIMATED_ROWS", "50000000"))
+# Statements whose planner total cost exceeds this are refused (Postgres)
+QUERY_MAX_PLANNER_COST = float(os.environ.get("QUERY_MAX_PLANNER_COST", "10000000"))
+# Separate read-only pool for agent queries
+QUERY_POOL_SIZE = int(os.environ.get("QUERY_POOL_SIZE", "5"))
+QUERY_POOL_MAX_OVERFLOW = int(os.environ.get("QUERY_POOL_MAX_OVERFLOW", "5"))
+
+# SQLite VM instructions between deadline checks
+_PROGRESS_HANDLER_INTERVAL = 1000
+# Postgres SQLSTATE for query_canceled (statement_timeout)
+_PG_QUERY_CANCELED = "57014"
+# Cost estimates remembered per data version
+_MAX_CACHED_ESTIMATES = 1000
+
+_SEARCH_RE = re.compile(
+    r"^(?:SCAN|SEARCH)\s+(?:TABLE\s+)?(?P<table>\w+)(?:\s+AS\s+\w+)?"
+    r"(?:\s+USING\s+(?:COVERING\s+)?(?:INDEX\s+(?P<index>\w+)|(?P<rowid>INTEGER\s+PRIMARY\s+KEY)|PRIMARY\s+KEY))?"
+    r"(?:\s+\((?P<condition>[^)]*)\))?",
+    re.IGNORECASE
+)
+_SUBQUERY_NAME_RE = re.compile(r"^(?:CO-ROUTINE|MATERIALIZE)\s+(\w+)", re.IGNORECASE)
+_EQUALITY_RE = re.compile(r"(?<![<>!])=\?")
+_RANGE_RE = re.compile(r"[<>]")
+# FROM / JOIN / comma-join table references with an optional alias
+_TABLE_REF_RE = re.compile(r"(?:\bfrom|\bjoin|,)\s+(\w+)(?:\s+(?:as\s+)?(\w+))?", re.IGNORECASE)
+
+class QueryRejected(Exception):
+    """Raised before execution when a statement's estimated cost is over the limit"""
+
+class QueryTimeout(Exception):
+    """Raised when a statement is stopped for running past its deadline"""
+
+class QueryGovernor:
+    """
+    Runs agent SQL on a separate read-only connection pool with a cost check and a deadline.
+
+    Before execution the statement is EXPLAINed and refused if its estimated cost is too high.
+    During execution a SQLite progress handler (or Postgres statement_timeout) stops it at the
+    deadline, so one pathological query cannot hold a worker or block ingestion.
+    """
+
+    def __init__(self, timeout=QUERY_TIMEOUT_SECONDS, max_estimated_rows=QUERY_MAX_ESTIMATED_ROWS,
+                 max_planner_cost=QUERY_MAX_PLANNER_COST, enabled=QUERY_GOVERNOR_ENABLED):
+        self.timeout = timeout
+        self.max_estimated_rows = max_estimated_rows
+        self.max_planner_cost = max_planner_cost
+        self.enabled = enabled
+        self._engine = None
+        self._engine_checked = False
+        self._lock = threading.Lock()
+        self._estimates = {}
+        self._estimates_version = None
+        self._table_stats = None
+        self.executed = 0
+        self.rejected = 0
+        self.killed = 0
+        self.failed = 0
+
+    def read_engine(self):
+        """
+        Engine of the read-only pool, created on first use.
+        None for in-memory SQLite, where a second pool would see a different database.
+        """
+        with self._lock:
+            if self._engine_checked:
+                return self._engine
+            self._engine_checked = True
+
+            url = db.engine.url
+            dialect = db.engine.dialect.name
+            if dialect == "sqlite" and url.database in (None, "", ":memory:"):
+                logging.info("In-memory SQLite database, agent queries share the main connection pool")
+                return None
+
+            options = {"pool_size": QUERY_POOL_SIZE, "max_overflow": QUERY_POOL_MAX_OVERFLOW,
+                       "pool_recycle": 300, "pool_pre_ping": True}
+            if dialect == "postgresql":
+                options["connect_args"] = {"options": "-c default_transaction_read_only=on"}
+            engine = create_engine(url, **options)
+
+            if dialect == "sqlite":
+                @event.listens_for(engine, "connect")
+                def _read_only(dbapi_connection, connection_record):
+                    dbapi_connection.execute("PRAGMA query_only = ON")
+
+                # WAL lets readers and the ingestion writer proceed without blocking each other
+                try:
+                    with db.engine.connect() as connection:
+                        connection.exec_driver_sql("PRAGMA journal_mode=WAL")
+                except Exception as e:
+                    logging.warning(f"Could not enable SQLite WAL mode: {e}")
+
+            self._engine = engine
+            return engine
+
+    @contextmanager
+    def execute(self, sql_query: str, params: dict = None, timeout: float = None):
+        """
+        Cost-check and execute a statement on the read-only pool, yielding the streaming result.
+        Raises QueryRejected if it is estimated too expensive and QueryTimeout if the deadline
+        passes while executing or fetching rows.
+        """
+        if not self.enabled:
+            yield db.session.execute(text(sql_query), params or {}, execution_options={"stream_results": True})
+            return
+
+        timeout = self.timeout if timeout is None else timeout
+        engine = self.read_engine()
+        connection = engine.connect() if engine is not None else db.session.connection()
+        result = None
+        try:
+            self.check_cost(connection, sql_query, params)
+            with self._deadline(connection, timeout):
+                try:
+                    result = connection.execute(text(sql_query), params or {},
+                                                execution_options={"stream_results": True})
+                    with self._lock:
+                        self.executed += 1
+                    yield result
+                except Exception as e:
+                    if self._is_timeout(e):
+                        with self._lock:
+                            self.killed += 1
+                        logging.warning(f"Query stopped after exceeding {timeout:g}s: {sql_query}")
+                        raise QueryTimeout(f"Query exceeded the {timeout:g}s time limit and was stopped") from e
+                    with self._lock:
+                        self.failed += 1
+                    raise
+        finally:
+            if result is not None:
+                result.close()
+            if engine is not None:
+                # Read-only work: end the transaction and hand the connection back to the pool
+                connection.rollback()
+                connection.close()
+
+    def check_cost(self, connection, sql_query: str, params: dict = None):
+        """Raise QueryRejected when the statement's estimated cost is over the limit"""
+        estimate = self.estimate_cost(connection, sql_query, params)
+        if estimate is None:
+            return
+        limit = self.max_planner_cost if estimate["unit"] == "cost" else self.max_estimated_rows
+        if estimate["value"] > limit:
+            with self._lock:
+                self.rejected += 1
+            logging.warning(f"Query rejected, estimated {estimate['unit']} {estimate['value']:,.0f} > {limit:,.0f}: {sql_query}")
+            raise QueryRejected(
+                f"This query is too expensive to run (estimated {estimate['value']:,.0f} "
+                f"{'planner cost' if estimate['unit'] == 'cost' else 'rows examined'}, limit {limit:,.0f}). "
+                f"Try narrowing it, for example with a date range or fewer joins."
+            )
+
+    def estimate_cost(self, connection, sql_query: str, params: dict = None):
+        """
+        EXPLAIN-based estimate {"value", "unit"}: planner total cost on Postgres, or rows examined
+        on SQLite (table sizes multiplied across nested loops). None if EXPLAIN fails;
+        the statement then runs under the deadline only (on Postgres the EXPLAIN runs in a
+        savepoint, so its failure leaves the connection's transaction usable).
+        """
+        data_version = get_data_version()
+        key = canonicalize_sql(sql_query)
+        with self._lock:
+            if self._estimates_version != data_version:
+                self._estimates = {}
+                self._table_stats = None
+                self._estimates_version = data_version
+            if key in self._estimates:
+                return self._estimates[key]
+
+        try:
+            if connection.dialect.name == "postgresql":
+                # A failed statement aborts the whole transaction on Postgres; the savepoint confines a
+                # failed EXPLAIN so the statement itself still runs and reports its own error
+                with connection.begin_nested():
+                    plan = connection.execute(text(f"EXPLAIN (FORMAT JSON) {sql_query}"), params or {}).scalar()
+                estimate = {"value": float(plan[0]["Plan"]["Total Cost"]), "unit": "cost"}
+            else:
+                rows = connection.execute(text(f"EXPLAIN QUERY PLAN {sql_query}"), params or {}).fetchall()
+                estimate = {"value": float(self._estimate_sqlite_rows(connection, sql_query, rows)), "unit": "rows"}
+        except Exception as e:
+            logging.warning(f"Could not estimate query cost: {e}")
+            return None
+
+        with self._lock:
+            if len(self._estimates) >= _MAX_CACHED_ESTIMATES:
+                self._estimates.clear()
+            self._estimates[key] = estimate
+        return estimate
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "read_only_pool": self._engine is not None,
+                "timeout_seconds": self.timeout,
+                "max_estimated_rows": self.max_estimated_rows,
+                "max_planner_cost": self.max_planner_cost,
+                "executed": self.executed,
+                "rejected": self.rejected,
+                "killed": self.killed,
+                "failed": self.failed
+            }
+
+    @contextmanager
+    def _deadline(self, connection, timeout: float):
+        if connection.dialect.name == "postgresql":
+            # SET LOCAL lasts until the end of the current transaction only
+            connection.exec_driver_sql(f"SET LOCAL statement_timeout = {int(timeout * 1000)}")
+            yield
+            return
+
+        if connection.dialect.name != "sqlite":
+            yield
+            return
+
+        dbapi_connection = connection.connection.dbapi_connection
+        deadline = time.monotonic() + timeout
+        # A non-zero return makes SQLite abort the statement with "interrupted"
+        dbapi_connection.set_progress_handler(lambda: 1 if time.monotonic() > deadline else 0,
+                                              _PROGRESS_HANDLER_INTERVAL)
+        try:
+            yield
+        finally:
+            dbapi_connection.set_progress_handler(None, 0)
+
+    def _is_timeout(self, error) -> bool:
+        original = getattr(error, "orig", error)
+        if getattr(original, "pgcode", None) == _PG_QUERY_CANCELED:
+            return True
+        return "interrupted" in str(original).lower()
+
+    def _sqlite_table_stats(self, connection) -> tuple:
+        """
+        (row count per table, sqlite_stat1 rows per (table, index)) for the current data version.
+        Counts come from the data summary row, which ingestion keeps current, and from sqlite_stat1
+        (written by ANALYZE) for other tables, so no table is scanned on the request path. Tables
+        with neither are left out and estimated as large as the largest one.
+        """
+        if self._table_stats is not None:
+            return self._table_stats
+        counts = {}
+        index_stats = {}
+        try:
+            for table, index, stat in connection.execute(text("SELECT tbl, idx, stat FROM sqlite_stat1")):
+                values = [int(value) for value in stat.split() if value.isdigit()]
+                if values:
+                    # The first number is the table's row count when ANALYZE ran
+                    counts.setdefault(table, values[0])
+                if index:
+                    index_stats[(table, index)] = values
+        except Exception:
+            pass  # ANALYZE has never run
+        counts.update(self._summary_counts(connection))
+        self._table_stats = (counts, index_stats)
+        return self._table_stats
+
+    def _summary_counts(self, connection) -> dict:
+        """Row counts of the base, rollup and fact tables derived from the data_summary row"""
+        try:
+            summary = connection.execute(text(
+                "SELECT sales_rows, sales_items, sales_start, sales_end, ad_rows, ad_items, ad_start, ad_end, "
+                "eligibility_rows FROM data_summary WHERE id = :id"
+            ), {"id": DATA_SUMMARY_ID}).mappings().first()
+        except Exception as e:
+            logging.warning(f"Could not read the data summary for cost estimates: {e}")
+            return {}
+        if summary is None:
+            return {}
+
+        starts = [_as_date(summary[column]) for column in ("sales_start", "ad_start") if summary[column]]
+        ends = [_as_date(summary[column]) for column in ("sales_end", "ad_end") if summary[column]]
+        days = (max(ends) - min(starts)).days + 1 if starts and ends else 0
+        return {
+            "product_sales": summary["sales_rows"],
+            "product_ad_metrics": summary["ad_rows"],
+            "product_eligibility": summary["eligibility_rows"],
+            # Rollups hold the union of both tables' items / days / (date, item) pairs
+            "item_rollup": max(summary["sales_items"], summary["ad_items"]),
+            "daily_rollup": days,
+            "item_daily_fact": max(summary["sales_rows"], summary["ad_rows"]),
+        }
+
+    def _estimate_sqlite_rows(self, connection, sql_query: str, plan_rows) -> float:
+        # EXPLAIN QUERY PLAN rows are (id, parent, notused, detail). Table steps that share a parent
+        # are nested loops, so their row estimates multiply; subqueries and compound members add.
+        counts, index_stats = self._sqlite_table_stats(connection)
+        aliases = {}
+        for table, alias in _TABLE_REF_RE.findall(sql_query):
+            if table.lower() in counts:
+                aliases[table.lower()] = table.lower()
+                if alias:
+                    aliases[alias.lower()] = table.lower()
+
+        children = {}
+        for node_id, parent, _, detail in plan_rows:
+            children.setdefault(parent, []).append((node_id, detail))
+        subquery_rows = {}
+
+        def step_rows(detail):
+            match = _SEARCH_RE.match(detail)
+            if not match:
+                return None
+            name = match.group("table").lower()
+            if name in subquery_rows:
+                return subquery_rows[name]
+            if name == "constant":
+                return 1.0
+            # Names that can't be resolved are assumed to be as large as the largest table
+            table = aliases.get(name, name)
+            if table not in counts:
+                return float(max(counts.values(), default=1))
+            total = float(max(counts[table], 1))
+            if not detail.upper().startswith("SEARCH"):
+                return total
+            condition = match.group("condition") or ""
+            equalities = len(_EQUALITY_RE.findall(condition))
+            ranges = len(_RANGE_RE.findall(condition))
+            # Equality lookups on the rowid or a primary key / unique constraint index find one row
+            unique_lookup = match.group("rowid") or "autoindex" in (match.group("index") or "")
+            if unique_lookup and equalities:
+                return 1.0
+            stats = index_stats.get((table, match.group("index")))
+            if stats and 0 < equalities < len(stats):
+                estimate = float(stats[equalities])
+            else:
+                estimate = total / (10 ** equalities)
+            # SQLite's own planner assumes each range bound keeps about a quarter of the rows
+            return max(estimate / (4 ** ranges), 1.0)
+
+        def node_cost(parent):
+            loop_rows, has_loop, extra = 1.0, False, 0.0
+            for node_id, detail in children.get(parent, []):
+                rows = step_rows(detail)
+                if rows is not None:
+                    loop_rows *= rows
+                    has_loop = True
+                    continue
+                cost = node_cost(node_id)
+                name_match = _SUBQUERY_NAME_RE.match(detail)
+                if name_match:
+                    subquery_rows[name_match.group(1).lower()] = max(cost, 1.0)
+                extra += cost
+            return extra + (loop_rows if has_loop else 0.0)
+
+        return node_cost(0)
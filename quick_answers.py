@@ -0,0 +1,157 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from metrics import timed
+from query_cache import normalize_question
+
+# Dashboard tiles served by /api/quick-answers
+QUICK_ANSWER_QUESTIONS = {
+    "total_sales": "What is my total sales?",
+    "roas": "Calculate the RoAS (Return on Ad Spend)",
+    "highest_cpc": "Which product had the highest CPC (Cost Per Click)?",
+}
+# Further questions answered ahead of time and served with the tiles, separated by "|"
+PINNED_QUESTIONS = [question.strip() for question in os.environ.get("PINNED_QUESTIONS", "").split("|") if question.strip()]
+# Stored answers older than this are recomputed by the background schedule (0 turns the schedule off);
+# they are also recomputed after every ingestion and whenever the data version changes
+QUICK_ANSWERS_REFRESH_SECONDS = int(os.environ.get("QUICK_ANSWERS_REFRESH_SECONDS", "900"))
+QUICK_ANSWERS_REFRESH_ON_INGEST = os.environ.get("QUICK_ANSWERS_REFRESH_ON_INGEST", "true").lower() == "true"
+# Per-question deadline for running the SQL while refreshing, in seconds
+QUICK_ANSWER_TIMEOUT = float(os.environ.get("QUICK_ANSWER_TIMEOUT", "30"))
+
+# app, its models and data_version are imported inside the functions: app imports this module
+# (through routes) while it starts, so importing them here would make the import circular
+
+# One refresh at a time in this worker; others wait and then find the answers fresh
+_refresh_lock = threading.Lock()
+
+def pinned_key(question: str) -> str:
+    return "pinned:" + hashlib.sha256(normalize_question(question).encode("utf-8")).hexdigest()[:32]
+
+def configured_questions() -> dict:
+    """Storage key -> question for the quick answers followed by the pinned questions"""
+    questions = dict(QUICK_ANSWER_QUESTIONS)
+    for question in PINNED_QUESTIONS:
+        questions.setdefault(pinned_key(question), question)
+    return questions
+
+def answers_are_stale() -> bool:
+    """
+    True when a configured question has no stored answer, or an answer failed, was computed at
+    an older data version or is older than QUICK_ANSWERS_REFRESH_SECONDS
+    """
+    from app import db
+    from data_version import get_data_version
+    from models import PrecomputedAnswer
+
+    stored = db.session.query(PrecomputedAnswer.key, PrecomputedAnswer.success,
+                              PrecomputedAnswer.data_version, PrecomputedAnswer.computed_at).all()
+    if {row.key for row in stored} != set(configured_questions()):
+        return True
+    data_version = get_data_version()
+    cutoff = datetime.utcnow() - timedelta(seconds=QUICK_ANSWERS_REFRESH_SECONDS) if QUICK_ANSWERS_REFRESH_SECONDS > 0 else None
+    return any(not row.success or row.data_version != data_version or (cutoff and row.computed_at < cutoff)
+               for row in stored)
+
+@timed("refresh_quick_answers")
+def refresh_quick_answers(agent=None, force: bool = True) -> bool:
+    """
+    Answer every configured question in one batch through the agent and store the responses,
+    replacing the previous ones. Without force, nothing happens unless answers_are_stale().
+    Returns True when the answers were recomputed. Must run in an app context.
+    """
+    from app import db
+    from data_version import get_data_version
+    from models import PrecomputedAnswer
+
+    with _refresh_lock:
+        if not force and not answers_are_stale():
+            return False
+        if agent is None:
+            from routes import get_ai_agent
+            agent = get_ai_agent()
+
+        questions = configured_questions()
+        data_version = get_data_version()
+        started = time.perf_counter()
+        batch = agent.process_batch(list(questions.values()), timeout=QUICK_ANSWER_TIMEOUT)
+
+        computed_at = datetime.utcnow()
+        stored = {answer.key: answer for answer in PrecomputedAnswer.query.all()}
+        try:
+            for (key, question), response in zip(questions.items(), batch["results"]):
+                answer = stored.pop(key, None)
+                if answer is None:
+                    answer = PrecomputedAnswer(key=key)
+                    db.session.add(answer)
+                answer.question = question
+                answer.response = current_app.json.dumps(response)
+                answer.success = bool(response.get("success"))
+                answer.data_version = data_version
+                answer.computed_at = computed_at
+            # Questions that are no longer pinned
+            for answer in stored.values():
+                db.session.delete(answer)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+    logging.info(f"Precomputed {len(questions)} quick answers at data version {data_version} "
+                 f"in {time.perf_counter() - started:.2f}s ({batch['failed']} failed)")
+    return True
+
+def refresh_after_ingestion():
+    """
+    Recompute the stored answers if a load changed the data (or they are otherwise stale), so
+    workers serve answers for the new data without waiting for the schedule. Failures are logged
+    rather than raised, since the load itself succeeded.
+    """
+    from app import db
+
+    if not QUICK_ANSWERS_REFRESH_ON_INGEST:
+        return
+    try:
+        refresh_quick_answers(force=False)
+    except Exception as e:
+        db.session.rollback()
+        logging.warning(f"Could not refresh the quick answers after ingestion: {e}")
+
+def stored_answers() -> dict:
+    """Storage key -> stored response (with its computed_at and data_version) for the configured questions"""
+    from models import PrecomputedAnswer
+
+    keys = list(configured_questions())
+    answers = {}
+    for answer in PrecomputedAnswer.query.filter(PrecomputedAnswer.key.in_(keys)).all():
+        answers[answer.key] = dict(json.loads(answer.response),
+                                   computed_at=answer.computed_at.isoformat() if answer.computed_at else None,
+                                   data_version=answer.data_version)
+    return answers
+
+def start_refresh_schedule(app, interval: int = QUICK_ANSWERS_REFRESH_SECONDS):
+    """
+    Refresh stale answers every interval seconds in a daemon thread. Each worker runs one, but
+    a worker that finds the answers already refreshed by another skips the work. Returns the
+    thread, or None when the schedule is turned off.
+    """
+    if interval <= 0:
+        return None
+
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                with app.app_context():
+                    refresh_quick_answers(force=False)
+            except Exception as e:
+                logging.warning(f"Scheduled quick answer refresh failed: {e}")
+
+    thread = threading.Thread(target=run, name="quick-answers-refresh", daemon=True)
+    thread.start()
+    return thread
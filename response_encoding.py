@@ -0,0 +1,169 @@
+import decimal
+import gzip
+import os
+import re
+from datetime import date, datetime
+from flask import request
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # falls back to the standard library encoder
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+# Compress JSON responses at least this large when the client accepts gzip or br
+RESPONSE_COMPRESSION_ENABLED = os.environ.get("RESPONSE_COMPRESSION_ENABLED", "true").lower() == "true"
+RESPONSE_COMPRESSION_MIN_BYTES = int(os.environ.get("RESPONSE_COMPRESSION_MIN_BYTES", "2048"))
+RESPONSE_GZIP_LEVEL = int(os.environ.get("RESPONSE_GZIP_LEVEL", "6"))
+RESPONSE_BROTLI_QUALITY = int(os.environ.get("RESPONSE_BROTLI_QUALITY", "5"))
+
+COLUMNAR = "columnar"
+
+_COMPRESSIBLE_MIMETYPES = {"application/json", "application/x-ndjson"}
+# SQLite hands dates and timestamps back as text
+_ISO_DATE_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+_ISO_DATETIME_RE = re.compile(r"^\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}(:\d{2}(\.\d+)?)?$")
+
+def _default(o):
+    # Dates as ISO 8601 whichever encoder runs (Flask's own default would send HTTP dates)
+    if isinstance(o, (date, datetime)):
+        return o.isoformat()
+    return DefaultJSONProvider.default(o)
+
+def _orjson_default(o):
+    if isinstance(o, decimal.Decimal):
+        return str(o)
+    return _default(o)
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    Flask JSON provider that encodes with orjson when it is installed, otherwise with the
+    standard library. Both encode values the same way: sorted keys, ISO dates, Decimals as strings.
+    """
+
+    default = staticmethod(_default)
+
+    def dumps(self, obj, **kwargs) -> str:
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        return self._orjson_dumps(obj).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        if orjson is None:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self._orjson_dumps(obj, pretty=self._pretty()) + b"\n",
+                                        mimetype=self.mimetype)
+
+    def _pretty(self) -> bool:
+        return self.compact is False or (self.compact is None and self._app.debug)
+
+    def _orjson_dumps(self, obj, pretty: bool = False) -> bytes:
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if pretty:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=_orjson_default, option=option)
+
+def _column_type(value) -> str:
+    if isinstance(value, bool):
+        return "boolean"
+    if isinstance(value, int):
+        return "integer"
+    if isinstance(value, (float, decimal.Decimal)):
+        return "number"
+    if isinstance(value, datetime):
+        return "datetime"
+    if isinstance(value, date):
+        return "date"
+    if isinstance(value, str):
+        if _ISO_DATE_RE.match(value):
+            return "date"
+        if _ISO_DATETIME_RE.match(value):
+            return "datetime"
+    return "string"
+
+def columnar_result(columns, rows) -> dict:
+    """
+    {"columns", "types", "rows"} for rows given as value sequences in column order.
+    Types come from each column's first non-null value (integer, number, boolean, date,
+    datetime or string); Decimal columns are sent as numbers.
+    """
+    rows = rows if isinstance(rows, list) else list(rows)
+    samples = [next((row[index] for row in rows if row[index] is not None), None) for index in range(len(columns))]
+    types = ["null" if value is None else _column_type(value) for value in samples]
+
+    decimal_columns = [index for index, value in enumerate(samples) if isinstance(value, decimal.Decimal)]
+    if decimal_columns:
+        rows = [list(row) for row in rows]
+        for row in rows:
+            for index in decimal_columns:
+                if row[index] is not None:
+                    row[index] = float(row[index])
+    return {"columns": list(columns), "types": types, "rows": rows}
+
+def columnar_from_dicts(rows: list) -> dict:
+    """columnar_result for a list of row dicts sharing the same keys (as the agent produces them)"""
+    columns = list(rows[0]) if rows else []
+    return columnar_result(columns, [list(row.values()) for row in rows])
+
+def _accepted_encoding(accept_encoding: str):
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    if brotli is not None and accepted.get("br", 0) > 0:
+        return "br"
+    if accepted.get("gzip", 0) > 0:
+        return "gzip"
+    return None
+
+def compress_response(response, accept_encoding: str):
+    """Compress a buffered JSON response in place when it is large enough and the client accepts it"""
+    if (response.direct_passthrough or response.is_streamed or response.status_code < 200
+            or response.status_code in (204, 304) or "Content-Encoding" in response.headers
+            or response.mimetype not in _COMPRESSIBLE_MIMETYPES):
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = _accepted_encoding(accept_encoding or "")
+    body = response.get_data()
+    if encoding is None or len(body) < RESPONSE_COMPRESSION_MIN_BYTES:
+        return response
+
+    if encoding == "br":
+        response.set_data(brotli.compress(body, quality=RESPONSE_BROTLI_QUALITY))
+    else:
+        response.set_data(gzip.compress(body, compresslevel=RESPONSE_GZIP_LEVEL))
+    response.headers["Content-Encoding"] = encoding
+    # The bytes differ from the uncompressed representation, so a strong validator becomes weak
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+def init_app(app):
+    """Encode JSON with FastJSONProvider and compress large JSON responses"""
+    app.json = FastJSONProvider(app)
+    if not RESPONSE_COMPRESSION_ENABLED:
+        return
+
+    @app.after_request
+    def _compress(response):
+        return compress_response(response, request.headers.get("Accept-Encoding", ""))
@@ -0,0 +1,141 @@
+import logging
+import os
+import re
+import sys
+import threading
+from collections import OrderedDict
+
+RESULT_CACHE_ENABLED = os.environ.get("RESULT_CACHE_ENABLED", "true").lower() == "true"
+RESULT_CACHE_MAX_BYTES = int(os.environ.get("RESULT_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+RESULT_CACHE_MAX_ENTRY_BYTES = int(os.environ.get("RESULT_CACHE_MAX_ENTRY_BYTES", str(4 * 1024 * 1024)))
+
+# String literals, quoted identifiers, comments, or anything else
+_SQL_TOKEN_RE = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|--[^\n]*|/\*.*?\*/|[^'\"\-/]+|.)", re.DOTALL)
+_WHITESPACE_RE = re.compile(r"\s+")
+
+def canonicalize_sql(sql_query: str) -> str:
+    """
+    Canonical form of a SQL statement for cache keys: comments removed,
+    whitespace collapsed and case folded outside of quoted literals
+    """
+    parts = []
+    for token in _SQL_TOKEN_RE.findall(sql_query):
+        if token.startswith(("'", '"')):
+            parts.append(token)
+        elif token.startswith("--") or token.startswith("/*"):
+            parts.append(" ")
+        else:
+            parts.append(token.lower())
+    canonical = _WHITESPACE_RE.sub(" ", "".join(parts)).strip()
+    return canonical.rstrip(";").strip()
+
+def estimate_result_size(rows: list) -> int:
+    """
+    Rough in-memory size of a list of row dicts, in bytes
+    """
+    size = sys.getsizeof(rows)
+    for row in rows:
+        size += sys.getsizeof(row)
+        for key, value in row.items():
+            size += sys.getsizeof(key) + sys.getsizeof(value)
+    return size
+
+class QueryResultCache:
+    """
+    LRU cache of query results keyed on canonical SQL, bind parameters and the data version.
+
+    Eviction is by total estimated result size rather than entry count, so a
+    few large results cannot push the process out of memory.
+    """
+
+    def __init__(self, max_bytes=RESULT_CACHE_MAX_BYTES, max_entry_bytes=RESULT_CACHE_MAX_ENTRY_BYTES,
+                 enabled=RESULT_CACHE_ENABLED):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.enabled = enabled
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._data_version = None
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.oversized = 0
+
+    def make_key(self, sql_query: str, data_version: int, params: dict = None):
+        return (canonicalize_sql(sql_query), tuple(sorted((params or {}).items())), data_version)
+
+    def get(self, sql_query: str, data_version: int, params: dict = None):
+        """
+        Return cached rows for a statement at the given data version, or None
+        """
+        if not self.enabled:
+            return None
+
+        key = self.make_key(sql_query, data_version, params)
+        with self._lock:
+            self._drop_stale_versions(data_version)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, sql_query: str, data_version: int, rows: list, params: dict = None):
+        """
+        Cache rows for a statement, evicting least recently used results to stay under the byte budget
+        """
+        if not self.enabled:
+            return
+
+        size = estimate_result_size(rows)
+        if size > self.max_entry_bytes:
+            with self._lock:
+                self.oversized += 1
+            logging.info(f"Result of {size} bytes exceeds cache entry limit, not caching")
+            return
+
+        key = self.make_key(sql_query, data_version, params)
+        with self._lock:
+            self._drop_stale_versions(data_version)
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.current_bytes -= previous[1]
+            self._entries[key] = (rows, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes and self._entries:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "data_version": self._data_version,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "oversized": self.oversized,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+    def _drop_stale_versions(self, data_version):
+        # Called with the lock held. Results from older versions can never be served again.
+        if self._data_version == data_version:
+            return
+        if self._data_version is not None:
+            self._entries.clear()
+            self.current_bytes = 0
+        self._data_version = data_version
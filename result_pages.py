@@ -0,0 +1,49 @@
+import os
+from flask import current_app
+from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
+
+# Rows returned inline in raw_result (and per page); the rest is fetched with a continuation token
+RESULT_ROW_CAP = int(os.environ.get("RESULT_ROW_CAP", "500"))
+# Rows fetched from the database cursor at a time while streaming
+RESULT_FETCH_CHUNK_SIZE = int(os.environ.get("RESULT_FETCH_CHUNK_SIZE", "1000"))
+# Seconds a continuation or export token stays valid
+RESULT_TOKEN_MAX_AGE = int(os.environ.get("RESULT_TOKEN_MAX_AGE", "3600"))
+
+_TOKEN_SALT = "result-page"
+
+class InvalidPageToken(Exception):
+    """Raised for a continuation token that is malformed, tampered with or expired"""
+
+class StalePageToken(Exception):
+    """Raised when the data changed after a continuation token was issued, so its offset no longer lines up"""
+
+def _serializer():
+    return URLSafeTimedSerializer(current_app.secret_key, salt=_TOKEN_SALT)
+
+def make_page_token(sql_query: str, params: dict, offset: int, data_version: int) -> str:
+    """
+    Signed, opaque token identifying a result and a row offset into it.
+    The signature stops clients from substituting their own SQL.
+    """
+    return _serializer().dumps({
+        "sql": sql_query,
+        "params": params or {},
+        "offset": offset,
+        "version": data_version
+    })
+
+def read_page_token(token: str, data_version: int = None) -> dict:
+    """
+    Decode a token from make_page_token into {"sql", "params", "offset", "version"}.
+    With data_version, also reject tokens issued against different data.
+    """
+    try:
+        page = _serializer().loads(token, max_age=RESULT_TOKEN_MAX_AGE)
+    except SignatureExpired:
+        raise InvalidPageToken("Result token has expired, please ask the question again")
+    except BadSignature:
+        raise InvalidPageToken("Invalid result token")
+
+    if data_version is not None and page["version"] != data_version:
+        raise StalePageToken("The data has changed since this result was produced, please ask the question again")
+    return page
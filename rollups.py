@@ -0,0 +1,231 @@
+import logging
+import os
+import re
+from datetime import date
+from sqlalchemy import text
+from app import db
+from data_version import get_data_version
+from data_summary import refresh_data_summary
+from metrics import timed
+from models import RollupState
+
+ROLLUP_REWRITE_ENABLED = os.environ.get("ROLLUP_REWRITE_ENABLED", "true").lower() == "true"
+
+# Single row recording the data version the rollups were built at
+ROLLUP_STATE_ID = 1
+
+MEASURE_COLUMNS = ("total_sales", "total_units_ordered", "ad_sales", "ad_spend", "impressions", "clicks", "units_sold")
+
+# Base table -> (its additive measure columns, rollup column counting base rows)
+BASE_TABLES = {
+    "product_sales": (("total_sales", "total_units_ordered"), "sales_rows"),
+    "product_ad_metrics": (("ad_sales", "ad_spend", "impressions", "clicks", "units_sold"), "ad_rows"),
+}
+
+ROLLUP_SCHEMA = """
+    4. Pre-aggregated rollup tables (kept in sync with the tables above during data loading).
+       Prefer them for totals and rankings; they are much smaller than the base tables.
+       Each has the measure columns total_sales, total_units_ordered, ad_sales, ad_spend,
+       impressions, clicks, units_sold, plus sales_rows / ad_rows counting the underlying daily records.
+       - item_rollup: one row per item_id with all-time totals
+       - daily_rollup: one row per date with totals across all items
+       - item_daily_fact: one row per (date, item_id) joining product_sales and product_ad_metrics
+         (measures are 0 where a table had no record for that day)
+       Examples:
+       - Total sales: SELECT SUM(total_sales) FROM item_rollup;
+       - Sales and ad spend per item: SELECT item_id, total_sales, ad_spend FROM item_rollup WHERE sales_rows > 0 OR ad_rows > 0;
+       - Daily RoAS: SELECT date, (ad_sales / ad_spend) * 100 AS roas FROM daily_rollup WHERE ad_spend > 0 ORDER BY date;
+    """
+
+def _fact_select(since_clause: str) -> str:
+    return f"""
+        SELECT date, item_id,
+               SUM(total_sales), SUM(total_units_ordered),
+               SUM(ad_sales), SUM(ad_spend), SUM(impressions), SUM(clicks), SUM(units_sold),
+               SUM(sales_rows), SUM(ad_rows)
+        FROM (
+            SELECT date, item_id, total_sales, total_units_ordered,
+                   0.0 AS ad_sales, 0.0 AS ad_spend, 0 AS impressions, 0 AS clicks, 0 AS units_sold,
+                   1 AS sales_rows, 0 AS ad_rows
+            FROM product_sales {since_clause}
+            UNION ALL
+            SELECT date, item_id, 0.0, 0, ad_sales, ad_spend, impressions, clicks, units_sold, 0, 1
+            FROM product_ad_metrics {since_clause}
+        ) combined
+        GROUP BY date, item_id
+    """
+
+_ROLLUP_COLUMNS = ", ".join(MEASURE_COLUMNS + ("sales_rows", "ad_rows"))
+_ROLLUP_SUMS = ", ".join(f"SUM({column})" for column in MEASURE_COLUMNS + ("sales_rows", "ad_rows"))
+
+@timed("refresh_rollups")
+def refresh_rollups(since: date = None):
+    """
+    Rebuild the rollup tables from product_sales and product_ad_metrics.
+    With since, only days on or after it are rebuilt in item_daily_fact and daily_rollup
+    (item_rollup is always recomputed from the fact table, which is already aggregated).
+    Records the current data version so the query rewriter knows the rollups are fresh.
+    """
+    params = {}
+    since_clause = ""
+    if since is not None:
+        since_clause = "WHERE date >= :since"
+        params["since"] = since.isoformat()
+
+    try:
+        db.session.execute(text(f"DELETE FROM item_daily_fact {since_clause}"), params)
+        db.session.execute(text(
+            f"INSERT INTO item_daily_fact (date, item_id, {_ROLLUP_COLUMNS}) {_fact_select(since_clause)}"
+        ), params)
+
+        db.session.execute(text(f"DELETE FROM daily_rollup {since_clause}"), params)
+        db.session.execute(text(
+            f"INSERT INTO daily_rollup (date, {_ROLLUP_COLUMNS}) "
+            f"SELECT date, {_ROLLUP_SUMS} FROM item_daily_fact {since_clause} GROUP BY date"
+        ), params)
+
+        db.session.execute(text("DELETE FROM item_rollup"))
+        db.session.execute(text(
+            f"INSERT INTO item_rollup (item_id, {_ROLLUP_COLUMNS}) "
+            f"SELECT item_id, {_ROLLUP_SUMS} FROM item_daily_fact GROUP BY item_id"
+        ))
+
+        version = mark_rollups_fresh()
+        logging.info(f"Rollups refreshed at data version {version}"
+                     f"{f' from {since.isoformat()}' if since else ''}")
+
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Failed to refresh rollups: {e}")
+        raise
+
+def mark_rollups_fresh() -> int:
+    """
+    Stamp the rollups with the current data version, e.g. after a load that only touched
+    product_eligibility and so could not have changed them. The data summary is rebuilt in the
+    same transaction, since every load ends here.
+    """
+    state = db.session.get(RollupState, ROLLUP_STATE_ID)
+    if state is None:
+        state = RollupState(id=ROLLUP_STATE_ID)
+        db.session.add(state)
+    state.data_version = get_data_version()
+    refresh_data_summary(state.data_version)
+    return state.data_version
+
+def rollups_are_fresh() -> bool:
+    """True when the rollups were built at the current data version"""
+    built_at = db.session.execute(
+        text("SELECT data_version FROM rollup_state WHERE id = :id"), {"id": ROLLUP_STATE_ID}
+    ).scalar()
+    return built_at is not None and built_at == get_data_version()
+
+_STRING_LITERAL_RE = re.compile(r"'(?:[^']|'')*'")
+_SIMPLE_SELECT_RE = re.compile(
+    r"^\s*select\s+(?P<select>.+?)\s+from\s+(?P<table>product_sales|product_ad_metrics)"
+    r"(?P<rest>(?:\s+(?:where|group\s+by|having|order\s+by|limit)\b.*)?)\s*;?\s*$",
+    re.IGNORECASE | re.DOTALL
+)
+_WHERE_RE = re.compile(r"\bwhere\b", re.IGNORECASE)
+_CLAUSE_AFTER_WHERE_RE = re.compile(r"\b(?:group\s+by|having|order\s+by|limit)\b", re.IGNORECASE)
+_CLAUSE_RE = re.compile(r"\b(?:where|group\s+by|having|order\s+by|limit)\b", re.IGNORECASE)
+_FORBIDDEN_RE = re.compile(
+    r"\b(?:select|from|join|union|intersect|except|over|distinct)\b|\b(?:count|avg|min|max|total|group_concat)\s*\(",
+    re.IGNORECASE
+)
+_IDENTIFIER_RE = re.compile(r"(?<![:\w.])([a-z_][a-z0-9_]*)\b(?!\s*\()", re.IGNORECASE)
+_ALIAS_RE = re.compile(r"\bas\s+([a-z_][a-z0-9_]*)", re.IGNORECASE)
+_KEYWORDS = {
+    "as", "and", "or", "not", "in", "is", "null", "between", "like", "where", "group", "by", "having",
+    "order", "asc", "desc", "limit", "offset", "case", "when", "then", "else", "end", "real", "float",
+    "integer", "numeric", "decimal", "true", "false"
+}
+
+def _mask_literals(sql: str) -> str:
+    """Blank out string literals while keeping offsets, so clause positions stay valid"""
+    return _STRING_LITERAL_RE.sub(lambda literal: "'" + " " * (len(literal.group(0)) - 2) + "'", sql)
+
+def _split_clauses(rest: str) -> dict:
+    """Map clause keyword (where, group by, having, order by, limit) to its text"""
+    clauses = {}
+    matches = list(_CLAUSE_RE.finditer(rest))
+    for index, clause_match in enumerate(matches):
+        end = matches[index + 1].start() if index + 1 < len(matches) else len(rest)
+        keyword = " ".join(clause_match.group(0).lower().split())
+        clauses[keyword] = rest[clause_match.end():end]
+    return clauses
+
+def _identifiers(sql: str) -> set:
+    return {identifier.lower() for identifier in _IDENTIFIER_RE.findall(sql)}
+
+def rewrite_for_rollups(sql_query: str):
+    """
+    Redirect a single-table SUM() aggregate over product_sales or product_ad_metrics to a rollup table.
+    Only queries whose measure columns appear exclusively inside SUM() and which filter/group by
+    nothing but date and item_id are rewritten; returns None when the query is not eligible.
+    """
+    match = _SIMPLE_SELECT_RE.match(sql_query)
+    if not match:
+        return None
+
+    table = match.group("table").lower()
+    measures, presence_column = BASE_TABLES[table]
+    select_list = _mask_literals(match.group("select"))
+    rest = match.group("rest")
+    masked_rest = _mask_literals(rest)
+    if _FORBIDDEN_RE.search(select_list) or _FORBIDDEN_RE.search(masked_rest):
+        return None
+
+    clauses = _split_clauses(masked_rest)
+    sum_re = re.compile(r"\bsum\s*\(\s*(?:" + "|".join(measures) + r")\s*\)", re.IGNORECASE)
+
+    # Result aliases may be referenced from the select list and ORDER BY; WHERE, GROUP BY and
+    # HAVING resolve names to base columns first, so aliases get no exemption there
+    aliases = {alias.lower() for alias in _ALIAS_RE.findall(select_list)}
+    lenient = " ".join([select_list, clauses.get("order by", ""), clauses.get("limit", "")])
+    strict = " ".join([clauses.get("where", ""), clauses.get("group by", ""), clauses.get("having", "")])
+    if not sum_re.search(lenient + " " + strict):
+        return None
+
+    # Every measure must be summed directly; no row-level filters or expressions on measures
+    columns = (_identifiers(sum_re.sub(" ", lenient)) - aliases) | _identifiers(sum_re.sub(" ", strict))
+    columns -= _KEYWORDS
+    if not columns <= {"date", "item_id"} or {"date", "item_id"} <= columns:
+        return None
+    target = "daily_rollup" if "date" in columns else "item_rollup"
+
+    # Rollups also hold days/items that only appear in the other base table
+    where_match = _WHERE_RE.search(masked_rest)
+    if where_match:
+        condition_start = where_match.end()
+        clause_match = _CLAUSE_AFTER_WHERE_RE.search(masked_rest, condition_start)
+        condition_end = clause_match.start() if clause_match else len(rest)
+        rest = (f"{rest[:where_match.start()]}WHERE {presence_column} > 0 AND ({rest[condition_start:condition_end].strip()})"
+                f"{' ' + rest[condition_end:] if clause_match else ''}")
+    else:
+        rest = f" WHERE {presence_column} > 0{rest}"
+
+    return f"SELECT {match.group('select')} FROM {target}{rest}"
+
+def apply_rollup_rewrite(sql_query: str) -> str:
+    """
+    Return the rollup-backed equivalent of sql_query when it is eligible and the rollups are fresh,
+    otherwise the query unchanged
+    """
+    if not ROLLUP_REWRITE_ENABLED:
+        return sql_query
+
+    rewritten = rewrite_for_rollups(sql_query)
+    if rewritten is None:
+        return sql_query
+
+    try:
+        if not rollups_are_fresh():
+            return sql_query
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Could not check rollup freshness: {e}")
+        return sql_query
+
+    logging.info(f"Rewrote query to use rollups: {rewritten}")
+    return rewritten
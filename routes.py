@@ -1,11 +1,38 @@
 import logging
-from flask import render_template, request, jsonify
+import os
+import threading
+from flask import render_template, request, jsonify, Response, stream_with_context
 from app import app
-from ai_agent import EcommerceAIAgent
-from models import ProductEligibility, ProductSales, ProductAdMetrics
+from result_pages import RESULT_ROW_CAP, InvalidPageToken, StalePageToken, make_page_token, read_page_token
+from data_version import get_data_version
+from data_summary import load_data_summary
+from quick_answers import QUICK_ANSWER_QUESTIONS, configured_questions, refresh_quick_answers, stored_answers
+from query_governor import QUERY_EXPORT_TIMEOUT_SECONDS
+from gemini import prompt_stats, estimate_tokens
+from schema_index import build_schema_prompt
+from metrics import render_metrics, counter_lines, request_timings
+from response_encoding import COLUMNAR, columnar_result, columnar_from_dicts
 
-# Initialize AI Agent
-ai_agent = EcommerceAIAgent()
+# Largest number of questions accepted by /api/ask/batch, and the deadline for running their SQL
+BATCH_MAX_QUESTIONS = int(os.environ.get("BATCH_MAX_QUESTIONS", "50"))
+BATCH_QUERY_TIMEOUT = float(os.environ.get("BATCH_QUERY_TIMEOUT", "30"))
+# Seconds browsers may reuse /api/data/summary before revalidating it against its ETag
+DATA_SUMMARY_MAX_AGE = int(os.environ.get("DATA_SUMMARY_MAX_AGE", "60"))
+
+# The AI agent pulls in the query engines (NumPy, PyArrow) and the Gemini SDK, so it is
+# built on the first request that needs it or by the startup warm-up
+_ai_agent = None
+_ai_agent_lock = threading.Lock()
+
+def get_ai_agent():
+    """The shared EcommerceAIAgent, created on first use"""
+    global _ai_agent
+    if _ai_agent is None:
+        with _ai_agent_lock:
+            if _ai_agent is None:
+                from ai_agent import EcommerceAIAgent
+                _ai_agent = EcommerceAIAgent()
+    return _ai_agent
 
 @app.route('/')
 def index():
@@ -14,38 +41,224 @@ def index():
     """
     return render_template('index.html')
 
+def _read_question():
+    """
+    Validate the JSON body of a question request.
+    Returns (data, question, None) or (None, None, error_response).
+    """
+    data = request.get_json(silent=True)
+    if not data or 'question' not in data:
+        return None, None, (jsonify({
+            "success": False,
+            "error": "Question is required"
+        }), 400)
+    
+    question = str(data['question']).strip()
+    if not question:
+        return None, None, (jsonify({
+            "success": False,
+            "error": "Question cannot be empty"
+        }), 400)
+    
+    return data, question, None
+
+def _result_format(data: dict = None):
+    """
+    "columnar" when the client asked for results as columns + rows arrays (result_format in
+    the JSON body or ?format=), otherwise None for one object per row
+    """
+    requested = (data or {}).get('result_format') or request.args.get('format')
+    return COLUMNAR if requested == COLUMNAR else None
+
+def _with_result_format(response: dict, result_format) -> dict:
+    # The agent's responses may be shared (single flight, batches), so a converted copy is returned
+    if result_format != COLUMNAR or not isinstance(response.get('raw_result'), list):
+        return response
+    return dict(response, raw_result=columnar_from_dicts(response['raw_result']), result_format=COLUMNAR)
+
 @app.route('/api/ask', methods=['POST'])
 def ask_question():
     """
     API endpoint to process natural language questions
     """
     try:
-        data = request.get_json()
-        if not data or 'question' not in data:
+        data, question, error_response = _read_question()
+        if error_response:
+            return error_response
+        
+        # Process the question with AI agent
+        result = get_ai_agent().process_question(question, llm_format=bool(data.get('llm_format', False)))
+        result = _with_result_format(result, _result_format(data))
+        
+        # Optional per-stage breakdown (ms) for debugging slow answers
+        if data.get('timings') or request.args.get('timings'):
+            result["timings"] = request_timings()
+        
+        return jsonify(result)
+        
+    except Exception as e:
+        logging.error(f"API error: {e}")
+        return jsonify({
+            "success": False,
+            "error": "Internal server error"
+        }), 500
+
+@app.route('/api/ask/batch', methods=['POST'])
+def ask_question_batch():
+    """
+    Answer a list of questions in one request, e.g. for a dashboard.
+    Body: {"questions": [...], "llm_format": false}. Each question gets its own result with
+    its own success flag, in the order given.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        questions = data.get('questions')
+        if not isinstance(questions, list) or not questions:
             return jsonify({
                 "success": False,
-                "error": "Question is required"
+                "error": "A non-empty list of questions is required"
             }), 400
-        
-        question = data['question'].strip()
-        if not question:
+        if len(questions) > BATCH_MAX_QUESTIONS:
             return jsonify({
                 "success": False,
-                "error": "Question cannot be empty"
+                "error": f"At most {BATCH_MAX_QUESTIONS} questions can be asked at once"
             }), 400
         
-        # Process the question with AI agent
-        result = ai_agent.process_question(question)
+        questions = [str(question).strip() for question in questions]
+        if not all(questions):
+            return jsonify({
+                "success": False,
+                "error": "Questions cannot be empty"
+            }), 400
         
-        return jsonify(result)
+        batch = get_ai_agent().process_batch(questions, llm_format=bool(data.get('llm_format', False)),
+                                       timeout=BATCH_QUERY_TIMEOUT)
+        result_format = _result_format(data)
+        batch["results"] = [_with_result_format(result, result_format) for result in batch["results"]]
+        return jsonify({"success": True, **batch})
         
     except Exception as e:
-        logging.error(f"API error: {e}")
+        logging.error(f"Batch API error: {e}")
         return jsonify({
             "success": False,
             "error": "Internal server error"
         }), 500
 
+def _sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {app.json.dumps(data)}\n\n"
+
+@app.route('/api/ask/stream', methods=['POST'])
+def ask_question_stream():
+    """
+    Streaming variant of /api/ask using Server-Sent Events.
+    Emits "sql", "result", "answer" (one or more chunks) and "done" events as each stage finishes.
+    """
+    data, question, error_response = _read_question()
+    if error_response:
+        return error_response
+    
+    llm_format = bool(data.get('llm_format', False))
+    result_format = _result_format(data)
+    
+    def generate():
+        try:
+            for event, payload in get_ai_agent().stream_question(question, llm_format=llm_format):
+                yield _sse_event(event, _with_result_format(payload, result_format))
+        except Exception as e:
+            logging.error(f"Streaming API error: {e}")
+            yield _sse_event("error", {
+                "success": False,
+                "error": "Internal server error"
+            })
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
+@app.route('/api/results/page', methods=['GET'])
+def get_result_page():
+    """
+    Fetch the next page of a truncated /api/ask result using its next_page_token.
+    With ?format=columnar the page is sent as columns, types and rows arrays.
+    """
+    token = request.args.get('token', '')
+    try:
+        data_version = get_data_version()
+        page = read_page_token(token, data_version)
+        limit = min(max(request.args.get('limit', RESULT_ROW_CAP, type=int), 1), RESULT_ROW_CAP)
+        
+        result_format = _result_format()
+        if result_format == COLUMNAR:
+            columns, rows, has_more = get_ai_agent().execute_query_page_columns(page["sql"], page["params"],
+                                                                                page["offset"], limit)
+            body = dict(columnar_result(columns, rows), result_format=COLUMNAR)
+        else:
+            rows, has_more = get_ai_agent().execute_query_page(page["sql"], page["params"], page["offset"], limit)
+            body = {"rows": rows}
+        next_offset = page["offset"] + len(rows)
+        
+        return jsonify({
+            "success": True,
+            "offset": page["offset"],
+            "row_count": len(rows),
+            **body,
+            "next_page_token": make_page_token(page["sql"], page["params"], next_offset, data_version) if has_more else None
+        })
+        
+    except InvalidPageToken as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 400
+    except StalePageToken as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 410
+    except Exception as e:
+        logging.error(f"Error fetching result page: {e}")
+        return jsonify({
+            "success": False,
+            "error": "Failed to fetch result page"
+        }), 500
+
+@app.route('/api/results/export', methods=['GET'])
+def export_result():
+    """
+    Stream the full result of an /api/ask query as NDJSON (one JSON object per line),
+    identified by its export_token. Rows are read from the cursor in chunks, so memory stays flat.
+    The query is re-run against the current data. With ?format=columnar the first line is
+    {"columns": [...]} and every following line is an array of values.
+    """
+    try:
+        page = read_page_token(request.args.get('token', ''))
+    except InvalidPageToken as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 400
+    
+    columnar = _result_format() == COLUMNAR
+    
+    def generate():
+        try:
+            rows = get_ai_agent().iter_query_rows(page["sql"], page["params"], timeout=QUERY_EXPORT_TIMEOUT_SECONDS,
+                                                  columnar=columnar)
+            if columnar:
+                yield app.json.dumps({"columns": next(rows)}) + "\n"
+            for row in rows:
+                yield app.json.dumps(row) + "\n"
+        except Exception as e:
+            # Headers are already sent, so the failure is reported as a final line
+            logging.error(f"Export error: {e}")
+            yield app.json.dumps({"error": "Export failed before the end of the result"}) + "\n"
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson', headers={
+        "Content-Disposition": "attachment; filename=result.ndjson",
+        "X-Accel-Buffering": "no"
+    })
+
 @app.route('/api/examples', methods=['GET'])
 def get_example_questions():
     """
@@ -90,31 +303,18 @@ def get_example_questions():
 @app.route('/api/data/summary', methods=['GET'])
 def get_data_summary():
     """
-    Get summary of available data
+    Get summary of available data, read from the summary row that ingestion maintains
     """
     try:
-        summary = {
-            "total_products": ProductEligibility.query.count(),
-            "total_sales_records": ProductSales.query.count(),
-            "total_ad_records": ProductAdMetrics.query.count(),
-            "date_range": {
-                "sales_start": None,
-                "sales_end": None
-            }
-        }
-        
-        # Get date range safely
-        first_sale = ProductSales.query.order_by(ProductSales.date.asc()).first()
-        last_sale = ProductSales.query.order_by(ProductSales.date.desc()).first()
-        
-        if first_sale and last_sale:
-            summary["date_range"]["sales_start"] = first_sale.date.isoformat()
-            summary["date_range"]["sales_end"] = last_sale.date.isoformat()
-        
-        return jsonify({
+        summary = load_data_summary()
+        response = jsonify({
             "success": True,
-            "summary": summary
+            "summary": summary.to_dict()
         })
+        # The row only changes when data is loaded, which bumps the data version
+        response.set_etag(f"summary-{summary.data_version}")
+        response.headers["Cache-Control"] = f"public, max-age={DATA_SUMMARY_MAX_AGE}"
+        return response.make_conditional(request)
         
     except Exception as e:
         logging.error(f"Error getting data summary: {e}")
@@ -126,27 +326,30 @@ def get_data_summary():
 @app.route('/api/quick-answers', methods=['GET'])
 def get_quick_answers():
     """
-    Get quick answers for the demo questions
+    Serve the precomputed answers to the demo questions and the pinned questions.
+    They are refreshed in the background; ?refresh=1 recomputes them before responding, and
+    they are computed here as well when some have never been stored.
     """
     try:
-        # Process the three main demo questions
-        results = {}
-        
-        # Total sales
-        total_sales_result = ai_agent.get_total_sales()
-        results['total_sales'] = total_sales_result
-        
-        # RoAS calculation
-        roas_result = ai_agent.calculate_roas()
-        results['roas'] = roas_result
+        answers = stored_answers()
+        questions = configured_questions()
+        if request.args.get('refresh') in ('1', 'true') or set(questions) - set(answers):
+            refresh_quick_answers(get_ai_agent())
+            answers = stored_answers()
         
-        # Highest CPC product
-        highest_cpc_result = ai_agent.get_highest_cpc_product()
-        results['highest_cpc'] = highest_cpc_result
+        results = {key: answers[key] for key in QUICK_ANSWER_QUESTIONS}
+        pinned = [answers[key] for key in questions if key not in QUICK_ANSWER_QUESTIONS]
+        data_version = get_data_version()
         
+        # Failed items are reported individually so the rest can still be shown
         return jsonify({
             "success": True,
-            "results": results
+            "partial": any(not answer.get("success") for answer in answers.values()),
+            "results": results,
+            "pinned": pinned,
+            "computed_at": min(answer["computed_at"] for answer in answers.values()),
+            # Answered before the latest load; the background refresh is about to replace them
+            "stale": any(answer["data_version"] != data_version for answer in answers.values())
         })
         
     except Exception as e:
@@ -156,6 +359,156 @@ def get_quick_answers():
             "error": "Failed to generate quick answers"
         }), 500
 
+@app.route('/api/cache/stats', methods=['GET'])
+def get_cache_stats():
+    """
+    Get hit/miss counters for the agent caches
+    """
+    try:
+        agent = get_ai_agent()
+        return jsonify({
+            "success": True,
+            "sql_cache": agent.sql_cache.stats(),
+            "result_cache": agent.result_cache.stats(),
+            "columnar_store": agent.columnar_store.stats(),
+            "single_flight": agent.single_flight.stats()
+        })
+        
+    except Exception as e:
+        logging.error(f"Error getting cache stats: {e}")
+        return jsonify({
+            "success": False,
+            "error": "Failed to load cache stats"
+        }), 500
+
+def _cache_metric_lines():
+    # Counters the caches, the query governor and the coalescer already keep, exported at scrape time
+    agent = get_ai_agent()
+    sql_cache = agent.sql_cache.stats()
+    result_cache = agent.result_cache.stats()
+    columnar = agent.columnar_store.stats()
+    single_flight = agent.single_flight.stats()
+    governor = agent.query_governor.stats()
+    return (
+        counter_lines("cache_lookups_total", "Cache lookups per cache and outcome", ("cache", "outcome"), {
+            ("sql", "hit"): sql_cache["hits"],
+            ("sql", "miss"): sql_cache["misses"],
+            ("result", "hit"): result_cache["hits"],
+            ("result", "miss"): result_cache["misses"],
+            ("columnar", "hit"): columnar["evaluations"],
+            ("columnar", "miss"): columnar["fallbacks"],
+        })
+        + counter_lines("coalesced_requests_total", "Requests answered by another in-flight pipeline",
+                        ("scope",), {
+            ("worker",): single_flight["coalesced"],
+            ("cross_worker",): single_flight["coalesced_cross_worker"],
+        })
+        + counter_lines("queries_total", "Statements handled by the query governor per outcome", ("outcome",), {
+            (outcome,): governor[outcome] for outcome in ("executed", "rejected", "killed", "failed")
+        })
+    )
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """
+    Stage latencies, request latencies and pipeline counters in Prometheus text format.
+    Values are per worker process; Prometheus aggregates across workers.
+    """
+    return Response(render_metrics([_cache_metric_lines]), mimetype="text/plain; version=0.0.4")
+
+@app.route('/api/prompt/stats', methods=['GET'])
+def get_prompt_stats():
+    """
+    Get prompt size, cached tokens and latency of recent SQL-generation calls
+    """
+    try:
+        schema_prompt, selection = build_schema_prompt(request.args.get('question', ''))
+        stats = prompt_stats.stats()
+        stats["full_schema_tokens"] = estimate_tokens(get_ai_agent().schema_info)
+        if request.args.get('question'):
+            # Preview of what would be sent for a question, without calling the model
+            stats["preview"] = {
+                "tables": selection["tables"],
+                "metrics": selection["metrics"],
+                "schema_tokens": estimate_tokens(schema_prompt),
+                "schema": schema_prompt
+            }
+        return jsonify({"success": True, **stats})
+
+    except Exception as e:
+        logging.error(f"Error getting prompt stats: {e}")
+        return jsonify({
+            "success": False,
+            "error": "Failed to load prompt stats"
+        }), 500
+
+@app.route('/api/query-governor/stats', methods=['GET'])
+def get_query_governor_stats():
+    """
+    Get counters for agent queries run, rejected as too expensive, or killed at their deadline
+    """
+    try:
+        return jsonify({
+            "success": True,
+            "query_governor": get_ai_agent().query_governor.stats()
+        })
+        
+    except Exception as e:
+        logging.error(f"Error getting query governor stats: {e}")
+        return jsonify({
+            "success": False,
+            "error": "Failed to load query governor stats"
+        }), 500
+
+@app.route('/api/index-advisor', methods=['GET'])
+def get_index_advisor_report():
+    """
+    Get full-scan / temp B-tree counts for executed SQL before and after index changes,
+    plus the indexes the advisor proposes. ?replan=1 re-explains every recorded statement first.
+    """
+    try:
+        replan = request.args.get('replan', '').lower() in ('1', 'true')
+        return jsonify({
+            "success": True,
+            "report": get_ai_agent().index_advisor.report(replan=replan)
+        })
+        
+    except Exception as e:
+        logging.error(f"Error building index advisor report: {e}")
+        return jsonify({
+            "success": False,
+            "error": "Failed to build index advisor report"
+        }), 500
+
+@app.route('/api/index-advisor/indexes', methods=['POST'])
+def create_advised_indexes():
+    """
+    Create the recommended indexes, or only those listed in {"indexes": [...]}
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        names = data.get('indexes')
+        if names is not None and not isinstance(names, list):
+            return jsonify({
+                "success": False,
+                "error": "indexes must be a list of index names"
+            }), 400
+        
+        created = get_ai_agent().index_advisor.create_indexes(names)
+        
+        return jsonify({
+            "success": True,
+            "created": created,
+            "report": get_ai_agent().index_advisor.report()
+        })
+        
+    except Exception as e:
+        logging.error(f"Error creating advised indexes: {e}")
+        return jsonify({
+            "success": False,
+            "error": "Failed to create indexes"
+        }), 500
+
 @app.errorhandler(404)
 def not_found(error):
     return jsonify({
@@ -0,0 +1,184 @@
+import re
+from query_cache import normalize_question
+
+_ROLLUP_MEASURES = {
+    "total_sales": ("REAL dollars", ()),
+    "total_units_ordered": ("INTEGER", ()),
+    "ad_sales": ("REAL dollars", ()),
+    "ad_spend": ("REAL dollars", ()),
+    "impressions": ("INTEGER", ()),
+    "clicks": ("INTEGER", ()),
+    "units_sold": ("INTEGER units sold through ads", ()),
+    "sales_rows": ("INTEGER product_sales records summed (0 if none)", ()),
+    "ad_rows": ("INTEGER product_ad_metrics records summed (0 if none)", ()),
+}
+
+# Compact, structured description of the tables the SQL generator may use.
+# Each column lists the words a question might use for it; table keywords select the whole table.
+# Rollup tables share their column names with the base tables, so only their keywords select them
+# (match_columns False); they are then sent with every column.
+SCHEMA_TABLES = {
+    "product_sales": {
+        "description": "daily total sales per product, one row per (date, item_id)",
+        "keywords": ("sales", "revenue", "sold", "orders", "ordered", "selling", "sellers", "performing", "earned"),
+        "columns": {
+            "date": ("DATE 'YYYY-MM-DD'", ("date", "day", "daily", "week", "month", "year", "when", "trend", "period")),
+            "item_id": ("INTEGER product id", ("item", "product", "sku", "id")),
+            "total_sales": ("REAL dollars", ("sales", "revenue", "earned", "income", "gmv")),
+            "total_units_ordered": ("INTEGER", ("units", "ordered", "orders", "quantity", "volume")),
+        },
+    },
+    "product_ad_metrics": {
+        "description": "daily advertising metrics per product, one row per (date, item_id)",
+        "keywords": ("ad", "ads", "advertising", "advertised", "campaign", "marketing", "sponsored", "promotion"),
+        "columns": {
+            "date": ("DATE 'YYYY-MM-DD'", ("date", "day", "daily", "week", "month", "year", "when", "trend", "period")),
+            "item_id": ("INTEGER product id", ("item", "product", "sku", "id")),
+            "ad_sales": ("REAL dollars of revenue attributed to ads", ("ad sales", "ad revenue", "attributed", "roas", "return")),
+            "impressions": ("INTEGER", ("impressions", "views", "reach", "ctr", "exposure")),
+            "ad_spend": ("REAL dollars spent on ads", ("spend", "spent", "spending", "cost", "budget", "roas", "cpc")),
+            "clicks": ("INTEGER", ("clicks", "clicked", "cpc", "ctr", "traffic")),
+            "units_sold": ("INTEGER units sold through ads", ("units sold through ads", "ad units", "conversions", "converted")),
+        },
+    },
+    "product_eligibility": {
+        "description": "advertising eligibility checks per product over time",
+        "keywords": ("eligible", "eligibility", "ineligible", "status", "reason", "why", "blocked", "allowed", "policy"),
+        "columns": {
+            "item_id": ("INTEGER product id", ("item", "product", "sku", "id")),
+            "eligibility_datetime": ("DATETIME of the check", ("when", "checked", "latest", "current", "date", "time")),
+            "eligibility": ("BOOLEAN, 1 if eligible for ads", ("eligible", "eligibility", "ineligible", "status")),
+            "message": ("TEXT reason when not eligible, empty otherwise", ("message", "reason", "why", "explanation")),
+        },
+    },
+    "item_rollup": {
+        "description": "all-time totals per product, one row per item_id (rollup of both daily tables)",
+        "keywords": ("total", "overall", "all time", "lifetime", "top", "bottom", "best", "worst", "highest",
+                     "lowest", "most", "least", "rank", "ranking", "ranked"),
+        "match_columns": False,
+        "columns": {"item_id": ("INTEGER product id", ()), **_ROLLUP_MEASURES},
+    },
+    "daily_rollup": {
+        "description": "totals across all products per day, one row per date (rollup of both daily tables)",
+        "keywords": ("per day", "daily", "by day", "by date", "each day", "day by day", "trend", "over time",
+                     "per date"),
+        "match_columns": False,
+        "columns": {"date": ("DATE 'YYYY-MM-DD'", ()), **_ROLLUP_MEASURES},
+    },
+}
+ROLLUP_TABLES = ("item_rollup", "daily_rollup")
+
+# Formulas the model should use, with the columns they need and the words that ask for them
+DERIVED_METRICS = {
+    "roas": {
+        "formula": "RoAS % = SUM(ad_sales) / SUM(ad_spend) * 100 (WHERE ad_spend > 0)",
+        "keywords": ("roas", "return on ad spend", "return on advertising"),
+        "columns": ("product_ad_metrics", ("ad_sales", "ad_spend")),
+    },
+    "cpc": {
+        "formula": "CPC = ad_spend / clicks per row, or SUM(ad_spend) / SUM(clicks) overall (WHERE clicks > 0)",
+        "keywords": ("cpc", "cost per click"),
+        "columns": ("product_ad_metrics", ("ad_spend", "clicks")),
+    },
+    "ctr": {
+        "formula": "CTR % = clicks * 100.0 / impressions (WHERE impressions > 0)",
+        "keywords": ("ctr", "click through", "clickthrough"),
+        "columns": ("product_ad_metrics", ("clicks", "impressions")),
+    },
+    "acos": {
+        "formula": "ACoS % = SUM(ad_spend) / SUM(ad_sales) * 100 (WHERE ad_sales > 0)",
+        "keywords": ("acos", "advertising cost of sales"),
+        "columns": ("product_ad_metrics", ("ad_spend", "ad_sales")),
+    },
+    "organic_sales": {
+        "formula": "Organic sales = product_sales.total_sales - product_ad_metrics.ad_sales on the same (date, item_id)",
+        "keywords": ("organic", "non ad", "without ads"),
+        "columns": ("product_sales", ("total_sales",)),
+        "also": ("product_ad_metrics", ("ad_sales",)),
+    },
+}
+
+# Always sent with their table: the join keys and the timestamp needed to find the latest eligibility row
+_KEY_COLUMNS = ("date", "item_id", "eligibility_datetime")
+
+def _phrase_re(phrases):
+    # Whole words or phrases, allowing a plural "s" / "es"
+    alternatives = "|".join(re.escape(phrase) for phrase in sorted(phrases, key=len, reverse=True))
+    return re.compile(r"\b(?:" + alternatives + r")(?:e?s)?\b")
+
+_TABLE_RES = {table: _phrase_re(spec["keywords"]) for table, spec in SCHEMA_TABLES.items()}
+_COLUMN_RES = {
+    (table, column): _phrase_re((column.replace("_", " "), column) + synonyms)
+    for table, spec in SCHEMA_TABLES.items() if spec.get("match_columns", True)
+    for column, (_, synonyms) in spec["columns"].items()
+}
+_METRIC_RES = {metric: _phrase_re(spec["keywords"]) for metric, spec in DERIVED_METRICS.items()}
+
+def select_schema(question: str) -> dict:
+    """
+    Pick the tables and columns a question needs using the local keyword index.
+    Returns {"tables": {table: [columns]}, "metrics": [derived metric names]}.
+    Falls back to every table when nothing in the question matches.
+    """
+    text = normalize_question(question).replace("_", " ")
+
+    metrics = [metric for metric, pattern in _METRIC_RES.items() if pattern.search(text)]
+    matched_columns = {}
+    for (table, column), pattern in _COLUMN_RES.items():
+        if column not in _KEY_COLUMNS and pattern.search(text):
+            matched_columns.setdefault(table, []).append(column)
+    for metric in metrics:
+        for table, columns in (DERIVED_METRICS[metric]["columns"], DERIVED_METRICS[metric].get("also", (None, ()))):
+            if table:
+                matched_columns.setdefault(table, []).extend(columns)
+
+    tables = {table for table, pattern in _TABLE_RES.items() if pattern.search(text)} | set(matched_columns)
+    # "sales" alone means total sales unless the question is about ads
+    if "product_ad_metrics" in tables and "product_sales" in tables and not _TABLE_RES["product_ad_metrics"].search(text) \
+            and set(matched_columns.get("product_ad_metrics", [])) <= {"ad_sales"} and not metrics:
+        tables.discard("product_ad_metrics")
+    if not tables:
+        tables = set(SCHEMA_TABLES)
+
+    selected = {}
+    for table in SCHEMA_TABLES:
+        if table not in tables:
+            continue
+        all_columns = list(SCHEMA_TABLES[table]["columns"])
+        wanted = set(matched_columns.get(table, []))
+        if not wanted:
+            # Only the table was mentioned, so every column may be relevant
+            selected[table] = all_columns
+        else:
+            selected[table] = [column for column in all_columns if column in _KEY_COLUMNS or column in wanted]
+    return {"tables": selected, "metrics": metrics}
+
+def build_schema_prompt(question: str) -> tuple:
+    """
+    Compact schema text for a question: selected tables and columns, their relationships and
+    the formulas it needs. Returns (schema_text, selection) where selection is from select_schema.
+    """
+    selection = select_schema(question)
+    lines = ["Tables (SQL types; only these columns are relevant):"]
+    for table, columns in selection["tables"].items():
+        spec = SCHEMA_TABLES[table]
+        column_text = ", ".join(f"{column} {spec['columns'][column][0]}" for column in columns)
+        lines.append(f"- {table}: {spec['description']}. Columns: {column_text}")
+
+    tables = set(selection["tables"])
+    if {"product_sales", "product_ad_metrics"} <= tables:
+        lines.append("- item_daily_fact: product_sales and product_ad_metrics pre-joined per (date, item_id), "
+                     "with total_sales, total_units_ordered, ad_sales, ad_spend, impressions, clicks, units_sold "
+                     "(0 where a table had no row)")
+        lines.append("Join product_sales and product_ad_metrics ON item_id AND date, or use item_daily_fact.")
+    if tables & set(ROLLUP_TABLES):
+        lines.append("Prefer item_rollup / daily_rollup for totals, rankings and daily trends; they are much smaller "
+                     "than the base tables and kept in sync with them. Filter sales_rows > 0 or ad_rows > 0 "
+                     "to skip items or days with no records in that table.")
+    if "product_eligibility" in tables and len(tables) > 1:
+        lines.append("Join product_eligibility ON item_id; the latest row per item (MAX(eligibility_datetime)) is its current status.")
+
+    if selection["metrics"]:
+        lines.append("Formulas:")
+        lines += [f"- {DERIVED_METRICS[metric]['formula']}" for metric in selection["metrics"]]
+    return "\n".join(lines), selection
@@ -0,0 +1,187 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows: coalescing stays within one worker
+    fcntl = None
+
+SINGLE_FLIGHT_ENABLED = os.environ.get("SINGLE_FLIGHT_ENABLED", "true").lower() == "true"
+# Also coalesce across gunicorn workers on this host through lock files
+SINGLE_FLIGHT_CROSS_WORKER = os.environ.get("SINGLE_FLIGHT_CROSS_WORKER", "false").lower() == "true"
+SINGLE_FLIGHT_LOCK_DIR = os.environ.get("SINGLE_FLIGHT_LOCK_DIR",
+                                        os.path.join(tempfile.gettempdir(), "ecommerce-single-flight"))
+# Longest a duplicate waits for the in-progress pipeline before running its own
+SINGLE_FLIGHT_WAIT_SECONDS = float(os.environ.get("SINGLE_FLIGHT_WAIT_SECONDS", "60"))
+
+# Result files older than this are removed when a worker writes a new one
+_RESULT_FILE_MAX_AGE = 600
+_PRUNE_EVERY = 100
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key so only one of them does the work.
+
+    Within a process, duplicates wait on the leader's call and share its result. With
+    cross_worker, the leader also holds an flock on a per-key lock file and writes its result
+    next to it, so a duplicate in another worker blocks on the lock and reads that result
+    instead of running the pipeline again. Results must be JSON-serializable for that.
+    """
+
+    def __init__(self, enabled=SINGLE_FLIGHT_ENABLED, cross_worker=SINGLE_FLIGHT_CROSS_WORKER,
+                 lock_dir=SINGLE_FLIGHT_LOCK_DIR, wait_seconds=SINGLE_FLIGHT_WAIT_SECONDS):
+        self.enabled = enabled
+        self.cross_worker = cross_worker and fcntl is not None
+        self.lock_dir = lock_dir
+        self.wait_seconds = wait_seconds
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+        self.coalesced_cross_worker = 0
+        self.wait_timeouts = 0
+        self._writes = 0
+        if cross_worker and fcntl is None:
+            logging.warning("Cross-worker coalescing needs fcntl; coalescing within this worker only")
+
+    def do(self, key: str, fn, encode=None, decode=None) -> tuple:
+        """
+        Run fn() unless an identical call is already in flight, in which case wait for it.
+        Returns (result, shared) where shared tells whether the result came from another call.
+        encode/decode convert the result to and from JSON-safe data for cross-worker sharing.
+        """
+        if not self.enabled:
+            return fn(), False
+
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            if call.done.wait(self.wait_seconds):
+                with self._lock:
+                    self.coalesced += 1
+                if call.error is not None:
+                    raise call.error
+                return call.result, True
+            with self._lock:
+                self.wait_timeouts += 1
+            logging.warning(f"Gave up waiting for an in-flight duplicate after {self.wait_seconds:g}s")
+            return fn(), False
+
+        try:
+            if self.cross_worker:
+                call.result, shared = self._do_cross_worker(key, fn, encode, decode)
+            else:
+                call.result, shared = fn(), False
+            if not shared:
+                with self._lock:
+                    self.leaders += 1
+            return call.result, shared
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def _do_cross_worker(self, key, fn, encode, decode):
+        os.makedirs(self.lock_dir, exist_ok=True)
+        path = os.path.join(self.lock_dir, hashlib.sha256(key.encode("utf-8")).hexdigest()[:32])
+        started = time.time()
+
+        with open(f"{path}.lock", "a+") as lock_file:
+            waited = False
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # Another worker is answering the same question; wait for it to release the lock
+                waited = True
+                deadline = started + self.wait_seconds
+                while True:
+                    time.sleep(0.05)
+                    try:
+                        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        break
+                    except BlockingIOError:
+                        if time.time() >= deadline:
+                            with self._lock:
+                                self.wait_timeouts += 1
+                            logging.warning(f"Gave up waiting for another worker after {self.wait_seconds:g}s")
+                            return fn(), False
+
+            try:
+                if waited:
+                    shared = self._read_result(path, started)
+                    if shared is not None:
+                        with self._lock:
+                            self.coalesced_cross_worker += 1
+                        return (decode(shared) if decode else shared), True
+                result = fn()
+                self._write_result(path, encode(result) if encode else result)
+                return result, False
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_result(self, path, started):
+        # Only a result finished while this call was waiting counts as the same flight
+        try:
+            with open(f"{path}.json") as result_file:
+                entry = json.load(result_file)
+        except (OSError, ValueError):
+            return None
+        return entry["result"] if entry.get("finished_at", 0) >= started else None
+
+    def _write_result(self, path, result):
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, "w") as result_file:
+                json.dump({"finished_at": time.time(), "result": result}, result_file)
+            os.replace(temp_path, f"{path}.json")
+        except (OSError, TypeError, ValueError) as e:
+            logging.warning(f"Could not share result with other workers: {e}")
+            return
+
+        with self._lock:
+            self._writes += 1
+            prune = self._writes % _PRUNE_EVERY == 0
+        if prune:
+            self._prune_results()
+
+    def _prune_results(self):
+        cutoff = time.time() - _RESULT_FILE_MAX_AGE
+        for name in os.listdir(self.lock_dir):
+            if not name.endswith(".json"):
+                continue
+            try:
+                if os.path.getmtime(os.path.join(self.lock_dir, name)) < cutoff:
+                    os.remove(os.path.join(self.lock_dir, name))
+            except OSError:
+                pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "cross_worker": self.cross_worker,
+                "in_flight": len(self._calls),
+                "leaders": self.leaders,
+                "coalesced": self.coalesced,
+                "coalesced_cross_worker": self.coalesced_cross_worker,
+                "wait_timeouts": self.wait_timeouts
+            }
@@ -0,0 +1,210 @@
+import argparse
+import os
+import threading
+import time
+from real_data_loader import DATASETS, file_sha256
+
+try:
+    import pyarrow as pa
+except ImportError:  # optional dependency: CSV parsing and database reads are used instead
+    pa = None
+
+SNAPSHOTS_ENABLED = os.environ.get("SNAPSHOTS_ENABLED", "true").lower() == "true"
+SNAPSHOT_DIR = os.environ.get("SNAPSHOT_DIR", "snapshots")
+
+# Bumped whenever the snapshot layout changes, so old files are rebuilt instead of misread
+SNAPSHOT_FORMAT_VERSION = "1"
+
+# Dataset name -> table the rows are loaded into
+DATASET_TABLES = {
+    'sales': 'product_sales',
+    'ad_metrics': 'product_ad_metrics',
+    'eligibility': 'product_eligibility',
+}
+
+def _schemas():
+    # Typed Arrow schema per dataset; field names match the parsed row dicts and table columns
+    return {
+        'sales': pa.schema([
+            ('date', pa.date32()),
+            ('item_id', pa.int64()),
+            ('total_sales', pa.float64()),
+            ('total_units_ordered', pa.int64()),
+        ]),
+        'ad_metrics': pa.schema([
+            ('date', pa.date32()),
+            ('item_id', pa.int64()),
+            ('ad_sales', pa.float64()),
+            ('impressions', pa.int64()),
+            ('ad_spend', pa.float64()),
+            ('clicks', pa.int64()),
+            ('units_sold', pa.int64()),
+        ]),
+        'eligibility': pa.schema([
+            ('item_id', pa.int64()),
+            ('eligibility_datetime', pa.timestamp('s')),
+            ('eligibility', pa.bool_()),
+            ('message', pa.string()),
+        ]),
+    }
+
+# Memory-mapped tables stay open while their file is unchanged; their buffers point into the
+# OS page cache, so every worker reading the same file shares one copy of the data.
+# Dataset name -> (file identity, table); another process replacing the file changes its identity.
+_open_tables = {}
+_open_lock = threading.Lock()
+
+def snapshots_available():
+    return SNAPSHOTS_ENABLED and pa is not None
+
+def snapshot_path(name):
+    return os.path.join(SNAPSHOT_DIR, f"{name}.arrow")
+
+def _source_stat(file_path):
+    stat = os.stat(file_path)
+    return str(stat.st_size), str(stat.st_mtime_ns)
+
+def write_snapshot(name, rows, source_hash=None):
+    """
+    Write parsed rows for a dataset as an uncompressed Arrow IPC file next to the other snapshots.
+    The source CSV's size, mtime and SHA-256 are stored in the schema metadata for staleness checks.
+    """
+    file_path = DATASETS[name][0]
+    size, mtime_ns = _source_stat(file_path)
+    schema = _schemas()[name].with_metadata({
+        'format_version': SNAPSHOT_FORMAT_VERSION,
+        'source_path': file_path,
+        'source_size': size,
+        'source_mtime_ns': mtime_ns,
+        'source_sha256': source_hash or file_sha256(file_path),
+    })
+    table = pa.Table.from_pylist(rows, schema=schema).combine_chunks()
+
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    path = snapshot_path(name)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with pa.OSFile(temp_path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    # Atomic swap so concurrent readers never see a half-written file
+    os.replace(temp_path, path)
+
+    with _open_lock:
+        _open_tables.pop(name, None)
+    return path
+
+def snapshot_metadata(name):
+    """Schema metadata of a snapshot file as a str dict, or None when there is no readable snapshot"""
+    path = snapshot_path(name)
+    if not snapshots_available() or not os.path.exists(path):
+        return None
+    try:
+        with pa.memory_map(path) as source:
+            metadata = pa.ipc.open_file(source).schema.metadata or {}
+    except (pa.ArrowInvalid, OSError):
+        return None
+    return {key.decode(): value.decode() for key, value in metadata.items()}
+
+def snapshot_is_fresh(name):
+    """
+    True when the snapshot was compiled from the current CSV file.
+    Size and mtime are checked first; the content hash is only computed when they differ.
+    """
+    metadata = snapshot_metadata(name)
+    file_path = DATASETS[name][0]
+    if metadata is None or metadata.get('format_version') != SNAPSHOT_FORMAT_VERSION or not os.path.exists(file_path):
+        return False
+    if (metadata.get('source_size'), metadata.get('source_mtime_ns')) == _source_stat(file_path):
+        return True
+    return metadata.get('source_sha256') == file_sha256(file_path)
+
+def _file_identity(path):
+    # write_snapshot swaps files in with os.replace, so a rewrite always gets a new inode
+    stat = os.stat(path)
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+def open_snapshot(name):
+    """
+    Memory-map a dataset's snapshot and return it as a pyarrow Table without copying the data.
+    The mapping is reused until the file is replaced, by this process or any other.
+    """
+    path = snapshot_path(name)
+    with _open_lock:
+        identity = _file_identity(path)
+        cached = _open_tables.get(name)
+        if cached is not None and cached[0] == identity:
+            return cached[1]
+        source = pa.memory_map(path)
+        table = pa.ipc.open_file(source).read_all()
+        _open_tables[name] = (identity, table)
+        return table
+
+def read_snapshot_rows(name):
+    """Rows of a snapshot as dicts in the same shape the CSV parsers produce"""
+    return open_snapshot(name).to_pylist()
+
+def snapshot_columns(name, columns):
+    """
+    Columns of a snapshot as NumPy arrays. Numeric columns are read-only views onto the
+    memory-mapped file; dates and booleans are converted.
+    """
+    table = open_snapshot(name)
+    arrays = {}
+    for column in columns:
+        chunked = table.column(column)
+        array = chunked.chunk(0) if chunked.num_chunks == 1 else chunked.combine_chunks()
+        arrays[column] = array.to_numpy(zero_copy_only=False)
+    return arrays
+
+def snapshots_match_database(names=DATASETS):
+    """
+    True when every dataset's snapshot was built from the same file content the table was last fully
+    reloaded from, so the snapshot can stand in for the table when reading analytics data.
+    Incremental loads merge rows into the table and clear that record, so the table is read instead.
+    """
+    from models import FullLoadState
+
+    if not snapshots_available():
+        return False
+    states = {state.dataset: state.content_hash for state in FullLoadState.query.all()}
+    for name in names:
+        metadata = snapshot_metadata(name)
+        if metadata is None or metadata.get('format_version') != SNAPSHOT_FORMAT_VERSION:
+            return False
+        if states.get(name) is None or metadata.get('source_sha256') != states[name]:
+            return False
+    return True
+
+def build_snapshots(names=None, force=False):
+    """
+    Compile CSV datasets into Arrow snapshots, skipping ones that are already fresh.
+    Returns the names of the datasets that were (re)built.
+    """
+    from real_data_loader import _timed_parse
+
+    built = []
+    for name in names or list(DATASETS):
+        file_path, _, label = DATASETS[name]
+        if not os.path.exists(file_path):
+            print(f"{label.capitalize()} data file not found: {file_path}")
+            continue
+        if not force and snapshot_is_fresh(name):
+            print(f"{label.capitalize()} snapshot is up to date")
+            continue
+        start = time.perf_counter()
+        rows, _ = _timed_parse(name, use_snapshot=False)
+        path = write_snapshot(name, rows)
+        print(f"Wrote {len(rows)} {label} rows to {path} in {time.perf_counter() - start:.2f}s")
+        built.append(name)
+    return built
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compile the e-commerce CSV files into Arrow snapshots")
+    parser.add_argument("--dataset", action="append", choices=list(DATASETS),
+                        help="only build these datasets (repeatable)")
+    parser.add_argument("--force", action="store_true", help="rebuild even if the snapshot is up to date")
+    args = parser.parse_args()
+
+    if pa is None:
+        raise SystemExit("pyarrow is not installed; install the 'snapshots' extra to build snapshots")
+    build_snapshots(args.dataset, force=args.force)
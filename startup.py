@@ -0,0 +1,237 @@
+import argparse
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from app import db
+from metrics import STARTUP
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows: startup is only coordinated on Postgres
+    fcntl = None
+
+# Prebuilt SQLite database copied into place when the configured database has no data yet
+DB_SNAPSHOT_PATH = os.environ.get("DB_SNAPSHOT_PATH")
+STARTUP_LOCK_FILE = os.environ.get("STARTUP_LOCK_FILE", os.path.join(tempfile.gettempdir(), "ecommerce-startup.lock"))
+# Longest a worker waits for another one to finish loading before giving up
+STARTUP_LOCK_TIMEOUT = float(os.environ.get("STARTUP_LOCK_TIMEOUT", "600"))
+# pg_advisory_lock key shared by every worker of this app ("ECOM")
+STARTUP_ADVISORY_LOCK_KEY = int(os.environ.get("STARTUP_ADVISORY_LOCK_KEY", str(0x45434F4D)))
+# When the Gemini SDK, the AI agent, its columnar store and the quick answers are prepared:
+# "background" (in a thread once the worker can serve), "blocking" (before it serves) or "off" (on first use)
+STARTUP_WARMUP = os.environ.get("STARTUP_WARMUP", "background").lower()
+
+READINESS_ID = 1
+
+class StartupLockTimeout(Exception):
+    """Raised when another worker holds the startup lock for longer than STARTUP_LOCK_TIMEOUT"""
+
+def is_data_ready() -> bool:
+    """One-row lookup of the readiness marker; False when the table does not exist yet"""
+    try:
+        return bool(db.session.execute(
+            text("SELECT ready FROM data_readiness WHERE id = :id"), {"id": READINESS_ID}
+        ).scalar())
+    except (OperationalError, ProgrammingError):
+        db.session.rollback()
+        return False
+
+def mark_data_ready(ready: bool = True, source: str = None):
+    from models import DataReadiness
+
+    marker = db.session.get(DataReadiness, READINESS_ID)
+    if marker is None:
+        marker = DataReadiness(id=READINESS_ID)
+        db.session.add(marker)
+    marker.ready = ready
+    marker.source = source
+    db.session.commit()
+
+@contextmanager
+def startup_lock(timeout: float = STARTUP_LOCK_TIMEOUT):
+    """
+    Serialize startup work across workers: a Postgres advisory lock when the database is Postgres
+    (which also covers workers on other hosts), otherwise an flock on STARTUP_LOCK_FILE
+    """
+    deadline = time.monotonic() + timeout
+    if db.engine.dialect.name == "postgresql":
+        with db.engine.connect() as connection:
+            while not connection.execute(text("SELECT pg_try_advisory_lock(:key)"),
+                                         {"key": STARTUP_ADVISORY_LOCK_KEY}).scalar():
+                if time.monotonic() >= deadline:
+                    raise StartupLockTimeout(f"Another worker held the startup lock for over {timeout:g}s")
+                time.sleep(0.2)
+            try:
+                yield
+            finally:
+                connection.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": STARTUP_ADVISORY_LOCK_KEY})
+        return
+
+    if fcntl is None:
+        logging.warning("fcntl is unavailable; startup is not coordinated between workers")
+        yield
+        return
+
+    with open(STARTUP_LOCK_FILE, "a+") as lock_file:
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    raise StartupLockTimeout(f"Another worker held the startup lock for over {timeout:g}s")
+                time.sleep(0.2)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def tables_exist() -> bool:
+    """True when every table the models define exists, e.g. after an upgrade added one"""
+    return set(db.metadata.tables) <= set(inspect(db.engine).get_table_names())
+
+def _sqlite_path():
+    url = db.engine.url
+    if url.get_backend_name() != "sqlite" or not url.database or url.database == ":memory:":
+        return None
+    return url.database
+
+def restore_db_snapshot(snapshot_path: str = DB_SNAPSHOT_PATH) -> bool:
+    """
+    Copy a prebuilt SQLite database over the configured one. Only call with the startup lock
+    held and before any worker serves from the database. Returns False when not applicable.
+    """
+    if not snapshot_path:
+        return False
+    target = _sqlite_path()
+    if target is None:
+        logging.warning("DB_SNAPSHOT_PATH is only supported for SQLite databases; loading the CSV files instead")
+        return False
+    if not os.path.exists(snapshot_path):
+        logging.warning(f"Database snapshot {snapshot_path} not found; loading the CSV files instead")
+        return False
+
+    # Close pooled connections to the old file before it is swapped out
+    db.session.remove()
+    db.engine.dispose()
+    os.makedirs(os.path.dirname(os.path.abspath(target)), exist_ok=True)
+    temp_path = f"{target}.{os.getpid()}.tmp"
+    shutil.copyfile(snapshot_path, temp_path)
+    for suffix in ("-wal", "-shm"):
+        if os.path.exists(target + suffix):
+            os.remove(target + suffix)
+    os.replace(temp_path, target)
+    logging.info(f"Restored database from snapshot {snapshot_path}")
+    return True
+
+def build_db_snapshot(output_path: str):
+    """
+    Write a consistent copy of the (loaded, ready) SQLite database to output_path using SQLite's
+    online backup API, for use as DB_SNAPSHOT_PATH
+    """
+    source_path = _sqlite_path()
+    if source_path is None:
+        raise ValueError("Database snapshots can only be built from a SQLite database")
+    temp_path = f"{output_path}.{os.getpid()}.tmp"
+    with sqlite3.connect(source_path) as source, sqlite3.connect(temp_path) as destination:
+        source.backup(destination)
+    os.replace(temp_path, output_path)
+    return output_path
+
+def ensure_data_ready():
+    """
+    Make sure the tables exist, the datasets are loaded and the rollups are current.
+
+    The common case (another worker or an earlier boot already did it) costs one marker lookup
+    and the rollup and summary freshness checks. Otherwise the work runs under the startup lock, so only one
+    worker creates tables, restores the snapshot or loads the CSV files while the rest wait and
+    then find the marker set. Failures propagate instead of triggering a reload, so a worker
+    never wipes data that the others are serving; the next boot finds the marker still unset
+    and loads again from scratch rather than serving the partial tables.
+    """
+    from rollups import rollups_are_fresh, refresh_rollups
+    from data_summary import data_summary_is_fresh, refresh_data_summary
+
+    if is_data_ready() and tables_exist() and rollups_are_fresh() and data_summary_is_fresh():
+        return "ready"
+
+    with startup_lock():
+        db.create_all()
+        outcome = "ready"
+        if not is_data_ready() and restore_db_snapshot():
+            outcome = "snapshot"
+            # Tables added since the snapshot was built
+            db.create_all()
+
+        if not is_data_ready():
+            from models import DataReadiness, ProductSales
+            marker = db.session.get(DataReadiness, READINESS_ID)
+            if marker is None and db.session.query(ProductSales.id).first() is not None:
+                # Loaded before the marker existed
+                mark_data_ready(True, "existing")
+            else:
+                from real_data_loader import load_all_real_data
+                if marker is not None:
+                    # A load that started but never finished: its rows are partial, so start over
+                    logging.warning(f"Previous data load ({marker.source}) did not finish; reloading")
+                mark_data_ready(False, "csv")
+                load_all_real_data()
+                mark_data_ready(True, "csv")
+                outcome = "loaded"
+
+        if not rollups_are_fresh():
+            refresh_rollups()
+        elif not data_summary_is_fresh():
+            # Databases loaded before the summary table existed
+            refresh_data_summary()
+        return outcome
+
+def _warm_up(app):
+    from gemini import warm_up as warm_up_gemini
+    from routes import get_ai_agent
+    from quick_answers import refresh_quick_answers
+
+    try:
+        with STARTUP.phase("warmup"), app.app_context():
+            warm_up_gemini()
+            get_ai_agent().columnar_store.refresh()
+            # Unless another worker or the last ingestion already stored them
+            refresh_quick_answers(get_ai_agent(), force=False)
+    except Exception as e:
+        # Whatever failed is built again on first use
+        logging.warning(f"Startup warm-up failed: {e}")
+    logging.info(f"Startup phases: {STARTUP.report()}")
+
+def start_warmup(app, mode: str = STARTUP_WARMUP):
+    """
+    Prepare what the first question needs according to STARTUP_WARMUP. Returns the warm-up
+    thread in background mode, otherwise None.
+    """
+    if mode == "off":
+        logging.info(f"Startup phases: {STARTUP.report()}")
+        return None
+    if mode == "blocking":
+        _warm_up(app)
+        return None
+    thread = threading.Thread(target=_warm_up, args=(app,), name="startup-warmup", daemon=True)
+    thread.start()
+    return thread
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prepare the database for serving")
+    parser.add_argument("--build-snapshot", metavar="PATH",
+                        help="load the data if needed, then write a SQLite snapshot for DB_SNAPSHOT_PATH")
+    args = parser.parse_args()
+
+    from app import app
+    with app.app_context():
+        print(f"Data: {ensure_data_ready()}")
+        if args.build_snapshot:
+            print(f"Wrote database snapshot to {build_db_snapshot(args.build_snapshot)}")
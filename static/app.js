@@ -65,20 +65,11 @@ class EcommerceAIAgent {
                 questionInput.value = question;
             }
 
-            const response = await fetch('/api/ask', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                },
-                body: JSON.stringify({ question: question })
-            });
-
-            const result = await response.json();
-            
-            if (result.success) {
-                this.showResponse(result);
+            // Stream stages as they finish when the browser supports it
+            if (window.ReadableStream && window.TextDecoder) {
+                await this.askQuestionStreaming(question);
             } else {
-                this.showError(result.error || 'An error occurred while processing your question');
+                await this.askQuestionBlocking(question);
             }
 
         } catch (error) {
@@ -89,8 +80,108 @@ class EcommerceAIAgent {
         }
     }
 
-    showResponse(result) {
+    async askQuestionBlocking(question) {
+        const response = await fetch('/api/ask', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({ question: question, result_format: 'columnar' })
+        });
+
+        const result = await response.json();
+        
+        if (result.success) {
+            this.showResponse(result);
+        } else {
+            this.showError(result.error || 'An error occurred while processing your question');
+        }
+    }
+
+    async askQuestionStreaming(question) {
+        const response = await fetch('/api/ask/stream', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({ question: question, result_format: 'columnar' })
+        });
+
+        if (!response.ok || !response.body) {
+            const result = await response.json().catch(() => ({}));
+            this.showError(result.error || 'An error occurred while processing your question');
+            return;
+        }
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        const partial = { question: question, formatted_answer: '' };
+        let buffer = '';
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+
+            buffer += decoder.decode(value, { stream: true });
+
+            // SSE events are separated by a blank line
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const event = this.parseSseEvent(buffer.slice(0, boundary));
+                buffer = buffer.slice(boundary + 2);
+                if (event) {
+                    this.handleStreamEvent(event, partial);
+                }
+            }
+        }
+    }
+
+    parseSseEvent(block) {
+        let eventName = 'message';
+        const dataLines = [];
+
+        block.split('\n').forEach(line => {
+            if (line.startsWith('event:')) {
+                eventName = line.slice(6).trim();
+            } else if (line.startsWith('data:')) {
+                dataLines.push(line.slice(5).trimStart());
+            }
+        });
+
+        if (dataLines.length === 0) return null;
+        return { name: eventName, data: JSON.parse(dataLines.join('\n')) };
+    }
+
+    handleStreamEvent(event, partial) {
+        switch (event.name) {
+            case 'sql':
+            case 'result':
+                Object.assign(partial, event.data);
+                this.showResponse(partial, true);
+                break;
+            case 'answer':
+                partial.formatted_answer += event.data.text;
+                this.updateAnswer(partial.formatted_answer);
+                break;
+            case 'done':
+                this.showResponse(event.data);
+                break;
+            case 'error':
+                this.showError(event.data.error || 'An error occurred while processing your question');
+                break;
+        }
+    }
+
+    updateAnswer(answer) {
+        const answerElement = document.getElementById('answerText');
+        if (answerElement) {
+            answerElement.innerHTML = this.formatAnswer(answer);
+        }
+    }
+
+    showResponse(result, inProgress = false) {
         const container = document.getElementById('responseContainer');
+        const wasVisible = container.style.display === 'block';
         
         const responseHtml = `
             <div class="card response-card shadow typing-animation">
@@ -113,8 +204,10 @@ class EcommerceAIAgent {
                     
                     <div class="mb-3">
                         <strong class="text-success">Answer:</strong>
-                        <div class="mt-2 p-3 bg-dark rounded border">
-                            ${this.formatAnswer(result.formatted_answer)}
+                        <div class="mt-2 p-3 bg-dark rounded border" id="answerText">
+                            ${inProgress && !result.formatted_answer
+                                ? '<span class="text-muted small">Generating answer...</span>'
+                                : this.formatAnswer(result.formatted_answer)}
                         </div>
                     </div>
                     
@@ -133,12 +226,18 @@ class EcommerceAIAgent {
                                     </div>
                                 ` : ''}
                                 
-                                ${result.raw_result && result.raw_result.length > 0 ? `
+                                ${this.resultRowCount(result.raw_result) > 0 ? `
                                     <div class="mb-3">
                                         <strong class="text-secondary">Raw Data:</strong>
-                                        <div class="mt-2 p-2 bg-secondary rounded small">
-                                            <pre><code>${JSON.stringify(result.raw_result, null, 2)}</code></pre>
+                                        <div class="mt-2 p-2 bg-secondary rounded small table-responsive">
+                                            ${this.renderResultTable(result.raw_result)}
                                         </div>
+                                        ${result.truncated && result.export_token ? `
+                                            <p class="mt-2 small text-muted">
+                                                Showing the first ${this.resultRowCount(result.raw_result)} rows.
+                                                <a href="/api/results/export?token=${encodeURIComponent(result.export_token)}">Download the full result (NDJSON)</a>
+                                            </p>
+                                        ` : ''}
                                     </div>
                                 ` : ''}
                             </div>
@@ -156,8 +255,10 @@ class EcommerceAIAgent {
         container.innerHTML = responseHtml;
         container.style.display = 'block';
         
-        // Scroll to response
-        container.scrollIntoView({ behavior: 'smooth', block: 'nearest' });
+        // Scroll to response once, not on every streamed stage
+        if (!wasVisible) {
+            container.scrollIntoView({ behavior: 'smooth', block: 'nearest' });
+        }
     }
 
     showError(message) {
@@ -312,6 +413,33 @@ class EcommerceAIAgent {
         return formatted;
     }
 
+    // Results arrive as {columns, types, rows} (result_format: 'columnar') or as one object per row
+    resultColumns(raw) {
+        if (!raw) return { columns: [], types: [], rows: [] };
+        if (!Array.isArray(raw)) return raw;
+        const columns = raw.length > 0 ? Object.keys(raw[0]) : [];
+        return { columns: columns, types: [], rows: raw.map(row => columns.map(column => row[column])) };
+    }
+
+    resultRowCount(raw) {
+        return this.resultColumns(raw).rows.length;
+    }
+
+    renderResultTable(raw) {
+        const { columns, types, rows } = this.resultColumns(raw);
+        const numeric = columns.map((_, i) => types[i] === 'integer' || types[i] === 'number');
+        const cell = (value, i) => `<td${numeric[i] ? ' class="text-end"' : ''}>${
+            value === null || value === undefined ? '<span class="text-muted">null</span>' : this.escapeHtml(String(value))}</td>`;
+
+        return `
+            <table class="table table-sm table-dark table-striped mb-0">
+                <thead><tr>${columns.map((column, i) =>
+                    `<th${numeric[i] ? ' class="text-end"' : ''}>${this.escapeHtml(column)}</th>`).join('')}</tr></thead>
+                <tbody>${rows.map(row => `<tr>${row.map(cell).join('')}</tr>`).join('')}</tbody>
+            </table>
+        `;
+    }
+
     escapeHtml(text) {
         const div = document.createElement('div');
         div.textContent = text;
@@ -0,0 +1,47 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor, wait
+from flask import current_app
+
+AGENT_WORKER_THREADS = int(os.environ.get("AGENT_WORKER_THREADS", "4"))
+
+# Shared, bounded pool so concurrent pipelines can't spawn unbounded threads
+_executor = ThreadPoolExecutor(max_workers=AGENT_WORKER_THREADS, thread_name_prefix="agent-worker")
+
+class TaskTimeout(Exception):
+    """Raised in place of a result when a task misses its deadline"""
+
+def submit_with_app_context(fn, *args, **kwargs):
+    """
+    Run fn on the shared pool inside its own application context.
+    Each worker therefore gets its own db.session, which is removed when the context ends.
+    """
+    app = current_app._get_current_object()
+
+    def run():
+        with app.app_context():
+            return fn(*args, **kwargs)
+
+    return _executor.submit(run)
+
+def gather(futures: dict, timeout: float) -> dict:
+    """
+    Wait up to timeout seconds for a dict of named futures.
+    Returns name -> result, or name -> exception for tasks that failed or timed out.
+    Tasks still running at the deadline keep their worker until they finish but are not waited for.
+    """
+    done, _ = wait(futures.values(), timeout=timeout)
+
+    outcomes = {}
+    for name, future in futures.items():
+        if future not in done:
+            future.cancel()
+            logging.warning(f"Task '{name}' timed out after {timeout}s")
+            outcomes[name] = TaskTimeout(f"Timed out after {timeout:g}s")
+            continue
+        try:
+            outcomes[name] = future.result()
+        except Exception as e:
+            logging.error(f"Task '{name}' failed: {e}")
+            outcomes[name] = e
+    return outcomes
@@ -0,0 +1,61 @@
+import os
+import shutil
+import tempfile
+
+import pytest
+
+# The app reads its configuration from the environment and loads the datasets when it is first
+# imported, so point it at a throwaway database and a small synthetic catalogue before then
+_WORK_DIR = tempfile.mkdtemp(prefix="ecommerce-tests-")
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{os.path.join(_WORK_DIR, 'test.db')}",
+    "SNAPSHOT_DIR": os.path.join(_WORK_DIR, "snapshots"),
+    "STARTUP_LOCK_FILE": os.path.join(_WORK_DIR, "startup.lock"),
+    "STARTUP_WARMUP": "off",
+    "QUICK_ANSWERS_REFRESH_SECONDS": "0",
+    "INGEST_PARSE_WORKERS": "0",
+    "LOG_LEVEL": "WARNING",
+})
+
+from data_loader import write_csv
+from real_data_loader import DATASETS
+
+FIXTURE_SCALE = 0.1
+FIXTURE_DAYS = 7
+FIXTURE_CSV_DIR = os.path.join(_WORK_DIR, "csv")
+FIXTURE_FILES = {name: path for name, (path, _) in write_csv(FIXTURE_CSV_DIR, FIXTURE_SCALE, FIXTURE_DAYS).items()}
+for _name, (_, _parser, _label) in list(DATASETS.items()):
+    DATASETS[_name] = (FIXTURE_FILES[_name], _parser, _label)
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(_WORK_DIR, ignore_errors=True)
+
+@pytest.fixture(scope="session")
+def app():
+    """The Flask app, with the fixture catalogue loaded into the test database"""
+    from app import app as flask_app
+    return flask_app
+
+@pytest.fixture
+def app_context(app):
+    from app import db
+
+    with app.app_context():
+        yield app
+        db.session.remove()
+
+@pytest.fixture
+def datasets(tmp_path, monkeypatch):
+    """
+    Copies of the fixture CSV files the loaders read for this test (which may rewrite them),
+    with their Arrow snapshots kept in the test's own directory. Returns dataset -> path.
+    """
+    import snapshot
+
+    paths = {}
+    for name, (_, parser, label) in list(DATASETS.items()):
+        paths[name] = str(tmp_path / os.path.basename(FIXTURE_FILES[name]))
+        shutil.copyfile(FIXTURE_FILES[name], paths[name])
+        monkeypatch.setitem(DATASETS, name, (paths[name], parser, label))
+    monkeypatch.setattr(snapshot, "SNAPSHOT_DIR", str(tmp_path / "snapshots"))
+    return paths
@@ -0,0 +1,61 @@
+import pytest
+
+pytest.importorskip("numpy")
+
+from columnar_store import ColumnarStore, verify_parity
+from intent_router import route_question
+from real_data_loader import load_all_real_data, load_incremental_data
+from snapshot import snapshots_available
+
+@pytest.fixture
+def agent(app_context):
+    from ai_agent import EcommerceAIAgent
+    return EcommerceAIAgent()
+
+def assert_parity(agent, store):
+    outcomes = verify_parity(agent, store)
+    mismatches = [outcome for outcome in outcomes if outcome["match"] is not True]
+    assert not mismatches
+
+def sql_total_sales(agent):
+    return agent.execute_query("SELECT SUM(total_sales) AS total_sales FROM product_sales")[0]["total_sales"]
+
+def test_matches_sql_after_full_load(datasets, agent):
+    load_all_real_data()
+    assert_parity(agent, ColumnarStore(enabled=True))
+
+@pytest.mark.skipif(not snapshots_available(), reason="pyarrow is not installed")
+def test_reads_snapshots_after_full_load(datasets, agent):
+    load_all_real_data()
+    store = ColumnarStore(enabled=True)
+    store.refresh()
+    assert store.source == "snapshot"
+    assert_parity(agent, store)
+
+def test_matches_sql_after_incremental_load(datasets, agent):
+    load_all_real_data()
+    before = sql_total_sales(agent)
+
+    # The next daily export holds a single new row
+    with open(datasets["sales"], "w", encoding="utf-8") as file:
+        file.write("date,item_id,total_sales,total_units_ordered\n2025-06-08,0,100.0,1\n")
+    assert load_incremental_data(["sales"]) == 1
+
+    store = ColumnarStore(enabled=True)
+    store.refresh()
+    # The table now holds both files' rows, which no snapshot describes
+    assert store.source == "database"
+    assert_parity(agent, store)
+
+    total = store.evaluate(route_question("What is my total sales?"))[0]["total_sales"]
+    assert total == pytest.approx(sql_total_sales(agent))
+    assert total == pytest.approx(before + 100.0)
+
+def test_ranking_direction_comes_from_the_intent(datasets, agent):
+    load_all_real_data()
+    store = ColumnarStore(enabled=True)
+    top = route_question("Top 5 products by ad sales")
+    # The SQL text is not consulted, so rewording it cannot flip top-N into bottom-N
+    reworded = top.model_copy(update={"query": top.query.replace(" DESC", " desc")})
+    assert store.evaluate(reworded) == store.evaluate(top)
+    assert store.evaluate(top) == agent.execute_query(top.query, top.params)
@@ -0,0 +1,15 @@
+import os
+
+import pytest
+
+from check_import_time import BUDGETS, check
+
+# Multiplies every budget, like check_import_time.py --scale, e.g. 2 on a slow CI machine
+IMPORT_TIME_BUDGET_SCALE = float(os.environ.get("IMPORT_TIME_BUDGET_SCALE", "1.0"))
+
+@pytest.mark.parametrize("module", list(BUDGETS))
+def test_imports_within_budget(module, app):
+    # The app fixture has loaded the test database, so importing app times the boot, not a data load
+    result, = check([module], scale=IMPORT_TIME_BUDGET_SCALE)
+    assert not result["loaded_heavy_modules"], f"{module} imports {', '.join(result['loaded_heavy_modules'])}"
+    assert result["seconds"] <= result["budget"], f"{module} took {result['seconds']}s (budget {result['budget']}s)"
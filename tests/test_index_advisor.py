@@ -0,0 +1,37 @@
+from types import SimpleNamespace
+
+import pytest
+
+@pytest.fixture
+def advisor(app_context, monkeypatch):
+    # index_advisor and routes import app, so they are imported once the app is up
+    import index_advisor
+    import routes
+
+    advisor = index_advisor.IndexAdvisor(enabled=True, auto_create=False)
+    monkeypatch.setattr(routes, "get_ai_agent", lambda: SimpleNamespace(index_advisor=advisor))
+    explained = []
+    explain = index_advisor.explain_query_plan
+
+    def counting_explain(sql_query, params=None):
+        explained.append(sql_query)
+        return explain(sql_query, params)
+
+    monkeypatch.setattr(index_advisor, "explain_query_plan", counting_explain)
+    advisor.record("SELECT * FROM product_sales WHERE total_units_ordered > 5")
+    advisor.record("SELECT item_id FROM product_ad_metrics ORDER BY ad_spend")
+    advisor.explained = explained
+    return advisor
+
+def test_report_reuses_cached_plans_by_default(app, advisor):
+    explained = len(advisor.explained)
+    response = app.test_client().get("/api/index-advisor")
+    assert response.status_code == 200
+    assert response.get_json()["report"]["statements"] == 2
+    assert len(advisor.explained) == explained
+
+def test_report_replans_when_asked(app, advisor):
+    explained = len(advisor.explained)
+    response = app.test_client().get("/api/index-advisor?replan=1")
+    assert response.status_code == 200
+    assert len(advisor.explained) == explained + 2
@@ -0,0 +1,77 @@
+from datetime import date
+
+import pytest
+
+from intent_router import route_question
+
+TODAY = date(2025, 6, 15)
+
+@pytest.mark.parametrize("question, intent", [
+    ("What is my total sales?", "total_sales"),
+    ("What is the total revenue?", "total_sales"),
+    ("Calculate the RoAS (Return on Ad Spend)", "roas"),
+    ("How much did we spend on ads?", "ad_spend"),
+    ("Total sales for item 5", "total_sales"),
+    ("Show me total sales in the last 7 days", "total_sales"),
+    ("Ad spend between 2025-06-01 and 2025-06-10", "ad_spend"),
+    ("Which product had the highest CPC (Cost Per Click)?", "rank_cpc"),
+    ("What are my top 5 products by ad sales?", "rank_ad_sales"),
+    ("bottom 3 items by impressions", "rank_impressions"),
+    ("best performing products", "rank_total_sales"),
+])
+def test_routes_supported_questions(question, intent):
+    match = route_question(question, TODAY)
+    assert match is not None
+    assert match.intent == intent
+
+def test_date_range_and_limit_are_bound():
+    match = route_question("Top five products by sales last month", TODAY)
+    assert match.params == {"start_date": "2025-05-01", "end_date": "2025-05-31", "limit": 5}
+
+def test_item_filter_is_bound():
+    match = route_question("Total clicks for item 42", TODAY)
+    assert "item_id = :item_id" in match.query
+    assert match.params == {"item_id": 42}
+
+# Questions the router would otherwise answer with the wrong SQL; they belong to the LLM
+@pytest.mark.parametrize("question", [
+    # extremes that do not rank products
+    "What is the highest sales?",
+    "Top sales day",
+    "What's the lowest CPC?",
+    "Which day had the highest sales?",
+    # counts, negation and exclusion
+    "How many products had zero sales?",
+    "number of products with sales",
+    "What are sales without ads?",
+    "What is organic sales?",
+    "total sales excluding item 5",
+    "Which items had no clicks?",
+    "Total sales not including returns",
+    # periods the router cannot parse
+    "What were sales in 2025?",
+    "sales this quarter",
+    "ad spend by week",
+    # shapes the router does not produce
+    "What is the average CPC?",
+    "Compare ad sales and total sales",
+    "sales growth last month",
+    # words the router does not understand
+    "What is the forecast for sales?",
+])
+def test_falls_back_for_unsupported_questions(question):
+    assert route_question(question, TODAY) is None
+
+@pytest.mark.parametrize("question, descending, limit", [
+    ("Top 5 products by ad sales", True, 5),
+    ("bottom 3 items by impressions", False, 3),
+    ("Which item had the lowest CTR?", False, 1),
+    ("best performing products", True, 10),
+])
+def test_ranked_intents_carry_direction_and_limit(question, descending, limit):
+    match = route_question(question, TODAY)
+    assert match.descending is descending
+    assert match.params["limit"] == limit
+
+def test_aggregates_have_no_direction():
+    assert route_question("What is my total sales?", TODAY).descending is None
@@ -0,0 +1,75 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("google.genai")
+
+import gemini
+
+class FakeCaches:
+    def __init__(self, errors=(), started=None, release=None):
+        self.errors = list(errors)
+        self.calls = 0
+        self.started = started
+        self.release = release
+
+    def create(self, model, config):
+        self.calls += 1
+        if self.started is not None:
+            self.started.set()
+            self.release.wait(5)
+        if self.errors:
+            raise self.errors.pop(0)
+        return SimpleNamespace(name=f"cachedContents/{self.calls}")
+
+@pytest.fixture
+def cache(monkeypatch):
+    caches = FakeCaches()
+    monkeypatch.setattr(gemini, "get_client", lambda: SimpleNamespace(caches=caches))
+    prompt_cache = gemini._SystemPromptCache(enabled=True, ttl_seconds=3600, retry_seconds=300)
+    return prompt_cache, caches
+
+def test_creates_and_reuses_cache(cache):
+    prompt_cache, caches = cache
+    assert prompt_cache.get() == "cachedContents/1"
+    assert prompt_cache.get() == "cachedContents/1"
+    assert caches.calls == 1
+
+def test_too_small_prompt_disables_cache(cache):
+    prompt_cache, caches = cache
+    caches.errors.append(Exception("400 INVALID_ARGUMENT. Cached content is too small. "
+                                   "total_token_count=312, min_total_token_count=4096"))
+    assert prompt_cache.get() is None
+    assert prompt_cache.unavailable_reason
+    assert prompt_cache.get() is None
+    assert caches.calls == 1
+
+def test_transient_error_is_retried_after_backoff(cache, monkeypatch):
+    prompt_cache, caches = cache
+    caches.errors.append(ConnectionError("Name or service not known"))
+    assert prompt_cache.get() is None
+    assert prompt_cache.unavailable_reason is None
+    # Within the backoff the prompt is sent inline without calling the API again
+    assert prompt_cache.get() is None
+    assert caches.calls == 1
+
+    clock = gemini.time.monotonic() + 301
+    monkeypatch.setattr(gemini.time, "monotonic", lambda: clock)
+    assert prompt_cache.get() == "cachedContents/2"
+
+def test_other_callers_do_not_wait_for_creation(monkeypatch):
+    started, release = threading.Event(), threading.Event()
+    caches = FakeCaches(started=started, release=release)
+    monkeypatch.setattr(gemini, "get_client", lambda: SimpleNamespace(caches=caches))
+    prompt_cache = gemini._SystemPromptCache(enabled=True)
+
+    creator = threading.Thread(target=prompt_cache.get)
+    creator.start()
+    assert started.wait(5)
+    # The lock is not held during the API call: this returns at once and sends the prompt inline
+    assert prompt_cache.get() is None
+    release.set()
+    creator.join(5)
+    assert prompt_cache.get() == "cachedContents/1"
+    assert caches.calls == 1
@@ -0,0 +1,65 @@
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+class FakePostgresConnection:
+    """Just enough of a Postgres connection to see whether EXPLAIN ran inside a savepoint"""
+
+    dialect = SimpleNamespace(name="postgresql")
+
+    def __init__(self):
+        self.savepoints = []
+
+    @contextmanager
+    def begin_nested(self):
+        self.savepoints.append("open")
+        try:
+            yield
+        except Exception:
+            self.savepoints[-1] = "rolled back"
+            raise
+        self.savepoints[-1] = "released"
+
+    def execute(self, statement, params=None):
+        raise OperationalError(str(statement), params, Exception('relation "missing" does not exist'))
+
+@pytest.fixture
+def governor(app_context):
+    # query_governor imports app, so it is imported once the app is up
+    from query_governor import QueryGovernor
+    return QueryGovernor()
+
+def test_failed_explain_is_rolled_back_to_a_savepoint_on_postgres(governor):
+    connection = FakePostgresConnection()
+    assert governor.estimate_cost(connection, "SELECT * FROM missing") is None
+    assert connection.savepoints == ["rolled back"]
+
+def test_statement_error_is_reported_when_explain_fails(governor):
+    with pytest.raises(OperationalError, match="no such table: missing"):
+        with governor.execute("SELECT * FROM missing") as result:
+            result.fetchall()
+    assert governor.stats()["failed"] == 1
+
+def test_sqlite_row_counts_come_from_the_data_summary(datasets, governor):
+    from sqlalchemy import event
+    from app import db
+    from real_data_loader import load_all_real_data
+
+    load_all_real_data()
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with db.engine.connect() as connection:
+        event.listen(db.engine, "before_cursor_execute", record)
+        try:
+            assert governor.estimate_cost(connection, "SELECT * FROM product_sales") is not None
+            counts, _ = governor._sqlite_table_stats(connection)
+        finally:
+            event.remove(db.engine, "before_cursor_execute", record)
+        actual = connection.exec_driver_sql("SELECT COUNT(*) FROM product_sales").scalar()
+    assert counts["product_sales"] == actual
+    assert not any("COUNT(" in statement.upper() for statement in statements)
@@ -0,0 +1,28 @@
+import pytest
+
+from schema_index import build_schema_prompt, select_schema
+
+@pytest.mark.parametrize("question, table", [
+    ("What is my total sales?", "item_rollup"),
+    ("Top 5 products by ad spend", "item_rollup"),
+    ("Overall clicks", "item_rollup"),
+    ("Show the daily sales trend", "daily_rollup"),
+    ("Ad spend per day", "daily_rollup"),
+    ("How did impressions change over time?", "daily_rollup"),
+])
+def test_selects_rollup_tables(question, table):
+    assert table in select_schema(question)["tables"]
+
+@pytest.mark.parametrize("question", [
+    "Which products are ineligible and why?",
+    "What is the CPC for item 5?",
+])
+def test_leaves_rollups_out_when_not_asked_for(question):
+    tables = select_schema(question)["tables"]
+    assert "item_rollup" not in tables and "daily_rollup" not in tables
+
+def test_rollup_prompt_lists_measures_and_guidance():
+    prompt, _ = build_schema_prompt("Show the daily ad spend trend")
+    assert "- daily_rollup:" in prompt
+    assert "ad_spend REAL" in prompt and "ad_rows INTEGER" in prompt
+    assert "Prefer item_rollup / daily_rollup" in prompt
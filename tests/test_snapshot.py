@@ -0,0 +1,40 @@
+import os
+import subprocess
+import sys
+from datetime import date
+
+import pytest
+
+pytest.importorskip("pyarrow")
+
+import snapshot
+
+# Rewrites the sales snapshot from another interpreter, as another worker or the CLI would
+_REWRITE = """
+import sys
+from datetime import date
+import real_data_loader, snapshot
+name, csv_path, snapshot_dir, total = sys.argv[1], sys.argv[2], sys.argv[3], float(sys.argv[4])
+real_data_loader.DATASETS[name] = (csv_path,) + real_data_loader.DATASETS[name][1:]
+snapshot.SNAPSHOT_DIR = snapshot_dir
+snapshot.write_snapshot(name, [{"date": date(2025, 6, 1), "item_id": 0, "total_sales": total, "total_units_ordered": 1}])
+"""
+
+def sales_rows(total):
+    return [{"date": date(2025, 6, 1), "item_id": 0, "total_sales": total, "total_units_ordered": 1}]
+
+def test_reopens_snapshot_replaced_by_another_process(datasets):
+    snapshot.write_snapshot("sales", sales_rows(100.0))
+    assert snapshot.snapshot_columns("sales", ["total_sales"])["total_sales"].tolist() == [100.0]
+
+    subprocess.run(
+        [sys.executable, "-c", _REWRITE, "sales", datasets["sales"], snapshot.SNAPSHOT_DIR, "250.0"],
+        check=True, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    )
+
+    assert snapshot.snapshot_metadata("sales") is not None
+    assert snapshot.snapshot_columns("sales", ["total_sales"])["total_sales"].tolist() == [250.0]
+
+def test_reuses_mapping_while_file_is_unchanged(datasets):
+    snapshot.write_snapshot("sales", sales_rows(100.0))
+    assert snapshot.open_snapshot("sales") is snapshot.open_snapshot("sales")
@@ -0,0 +1,45 @@
+import pytest
+
+import real_data_loader
+
+class LoadCrashed(Exception):
+    pass
+
+def table_counts():
+    from models import ProductSales, ProductAdMetrics, ProductEligibility
+    return {model.__tablename__: model.query.count() for model in (ProductSales, ProductAdMetrics, ProductEligibility)}
+
+def test_interrupted_load_is_redone_on_next_boot(datasets, app_context, monkeypatch):
+    from app import db
+    from models import DataReadiness
+    from startup import READINESS_ID, ensure_data_ready, is_data_ready
+
+    # A fresh database
+    real_data_loader.load_all_real_data()
+    expected = table_counts()
+    DataReadiness.query.delete()
+    for table in expected:
+        db.session.execute(db.text(f"DELETE FROM {table}"))
+    db.session.commit()
+
+    # The first boot dies after inserting the first dataset
+    ingest = real_data_loader._ingest_dataset
+    calls = []
+    def crash_on_second_dataset(*args, **kwargs):
+        calls.append(args[2])
+        if len(calls) == 2:
+            raise LoadCrashed(f"killed while loading {args[2]}")
+        return ingest(*args, **kwargs)
+    monkeypatch.setattr(real_data_loader, "_ingest_dataset", crash_on_second_dataset)
+    with pytest.raises(LoadCrashed):
+        ensure_data_ready()
+    db.session.rollback()
+    partial = table_counts()
+    assert 0 < sum(partial.values()) < sum(expected.values())
+    assert not is_data_ready()
+
+    # The next boot must not serve the partial tables as ready
+    monkeypatch.setattr(real_data_loader, "_ingest_dataset", ingest)
+    assert ensure_data_ready() == "loaded"
+    assert table_counts() == expected
+    assert db.session.get(DataReadiness, READINESS_ID).source == "csv"